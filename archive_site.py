@@ -0,0 +1,252 @@
+"""Keep every published digest by week and build a static archive site from them.
+
+`remember_published_digest` records each published digest under the ISO week of its first
+event, replacing what was published under its name for that week before. Digests published
+separately for parts of a week, e.g. a digest per city, are merged into the week's page. The
+site has a page per week and an index. Builds are incremental: ``manifest.json`` in the
+output directory keeps the hash of every page's inputs, i.e. the week's events and the
+templates, and only pages whose inputs changed are rendered again, streamed straight to
+their files. The site is public, so the text of events is HTML-escaped::
+
+    python archive_site.py --output archive
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import time
+from collections.abc import Collection
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from diskcache import Cache
+from jinja2 import Environment, FileSystemLoader
+
+from tracing import tracer
+
+if TYPE_CHECKING:
+    from kuda_idem_template import Event
+
+MANIFEST_NAME = "manifest.json"
+# The digest template and the templates it includes, all of which pages depend on
+DIGEST_TEMPLATES = ("template.j2", "header.j2", "event.j2")
+_WEEKS_KEY = "archive_weeks"
+# Name of a digest of a whole week, as published from the GUI
+WHOLE_WEEK = ""
+
+# The digest itself is Telegram HTML with line breaks, which the page keeps as they are
+PAGE_HEADER = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="UTF-8">
+<title>Куда идём? {{ week }}</title>
+<style>
+body {font-family: sans-serif; max-width: 40em; margin: 2em auto; white-space: pre-wrap;}
+</style>
+</head>
+<body><a href="index.html">← Архив</a>
+"""
+PAGE_FOOTER = """
+</body>
+</html>
+"""
+INDEX_TEMPLATE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="UTF-8">
+<title>Куда идём? Архив</title>
+<style>body {font-family: sans-serif; max-width: 40em; margin: 2em auto;}</style>
+</head>
+<body>
+<h1>Архив</h1>
+<ul>
+{% for week, date_range, count in weeks -%}
+<li>{{ week }}: <a href="{{ week }}.html">{{ date_range }}</a> ({{ count }})</li>
+{% endfor -%}</ul>
+</body>
+</html>
+"""
+
+
+def week_key(events: Collection[Event]) -> str:
+    """The ISO week of the first event of a digest, e.g. ``2024-W47``."""
+    year, week, _ = min(event.start_datetime for event in events).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ArchiveStore:
+    """Published digests by week in the disk cache, with the content hash of each."""
+
+    def __init__(self, cache: Cache) -> None:
+        self.cache = cache
+
+    def record(self, events: Collection[Event], name: str = WHOLE_WEEK) -> str:
+        """Store a published digest as the one of its week by its name and return the week.
+
+        The events of the week are those of all its digests, in the order of their names. A
+        digest named after its own week, as the pipeline names them by week, is the whole week.
+        """
+        week = week_key(events)
+        if name == week:
+            name = WHOLE_WEEK
+        with self.cache.transact():
+            # Weeks recorded before digests had names hold a single digest of the whole week
+            digests = self.cache.get(("archive_digests", week)) or {
+                WHOLE_WEEK: self.cache.get(("archive", week), [])
+            }
+            digests[name] = [event.model_dump(mode="json") for event in events]
+            digests = {key: data for key, data in sorted(digests.items()) if data}
+            events_data = [data for digest in digests.values() for data in digest]
+            content_hash = _hash(json.dumps(events_data, sort_keys=True))
+            self.cache.set(("archive_digests", week), digests)
+            self.cache.set(("archive", week), events_data)
+            weeks = self.cache.get(_WEEKS_KEY, {})
+            if weeks.get(week) != content_hash:
+                self.cache.set(_WEEKS_KEY, {**weeks, week: content_hash})
+        return week
+
+    def weeks(self) -> dict[str, str]:
+        """Content hashes of the digests by week, oldest first."""
+        return dict(sorted(self.cache.get(_WEEKS_KEY, {}).items()))
+
+    def events(self, week: str) -> list[dict[str, Any]]:
+        """The events of all digests of a week, as serialized events."""
+        return self.cache.get(("archive", week), [])
+
+
+@dataclass(slots=True)
+class BuildResult:
+    """Pages rendered by a build, the others were up to date."""
+
+    rendered: list[str] = field(default_factory=list)
+    skipped: int = 0
+
+
+def build_site(
+        store: ArchiveStore,
+        output_dir: Path,
+        template_dir: Path = Path("."),
+        force: bool = False,
+) -> BuildResult:
+    """Render the pages of weeks whose inputs changed, and the index if any page did.
+
+    Args:
+    ----
+        store: Archived digests
+        output_dir: Directory of the site
+        template_dir: Directory of template.j2 and the templates it includes
+        force: Render every page, e.g. after the site was edited by hand
+
+    Returns:
+    -------
+        BuildResult: Names of the rendered pages and the number of skipped ones
+
+    """
+    from kuda_idem_template import (
+        Event,
+        determine_date_range,
+        format_date_range,
+        get_russian_weekday,
+    )
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    # Inputs hash, date range and event count of every built page
+    manifest: dict[str, dict[str, Any]] = (
+        {}
+        if force or not manifest_path.exists()
+        else json.loads(manifest_path.read_text(encoding="utf-8"))
+    )
+    template_hash = _hash(
+        *((template_dir / name).read_text(encoding="utf-8") for name in DIGEST_TEMPLATES),
+        PAGE_HEADER,
+        PAGE_FOOTER,
+        # Pages built before event fields were escaped are rendered again
+        "autoescape",
+    )
+    # The site is public, so the text of events is escaped rather than taken as HTML
+    environment = Environment(loader=FileSystemLoader(template_dir), autoescape=True)
+    digest_template = environment.get_template("template.j2")
+    header_template = environment.from_string(PAGE_HEADER)
+
+    result = BuildResult()
+    for week, content_hash in store.weeks().items():
+        page_name = f"{week}.html"
+        page_hash = _hash(template_hash, content_hash)
+        entry = manifest.get(page_name)
+        if entry is not None and entry["hash"] == page_hash and (output_dir / page_name).exists():
+            result.skipped += 1
+            continue
+
+        events = [Event(**data) for data in store.events(week)]
+        date_range = format_date_range(*determine_date_range(events))
+        with tracer.span("archive.render", week=week), (output_dir / page_name).open(
+            "w", encoding="utf-8"
+        ) as f:
+            f.write(header_template.render(week=week))
+            digest_template.stream(
+                events=events, date_range=date_range, get_russian_weekday=get_russian_weekday
+            ).dump(f)
+            f.write(PAGE_FOOTER)
+        manifest[page_name] = {"hash": page_hash, "date_range": date_range, "count": len(events)}
+        result.rendered.append(page_name)
+
+    # Newest weeks first
+    index_rows = [
+        (name.removesuffix(".html"), entry["date_range"], entry["count"])
+        for name, entry in sorted(manifest.items(), reverse=True)
+        if name != "index.html"
+    ]
+    index_hash = _hash(INDEX_TEMPLATE, json.dumps(index_rows))
+    index_entry = manifest.get("index.html")
+    if (
+            index_entry is None
+            or index_entry["hash"] != index_hash
+            or not (output_dir / "index.html").exists()
+    ):
+        with tracer.span("archive.index", weeks=len(index_rows)), (
+            output_dir / "index.html"
+        ).open("w", encoding="utf-8") as f:
+            environment.from_string(INDEX_TEMPLATE).stream(weeks=index_rows).dump(f)
+        manifest["index.html"] = {"hash": index_hash}
+        result.rendered.append("index.html")
+    else:
+        result.skipped += 1
+
+    manifest_path.write_text(
+        json.dumps(manifest, indent=1, sort_keys=True, ensure_ascii=False), encoding="utf-8"
+    )
+    return result
+
+
+def main() -> None:
+    """Build the archive site from the command line."""
+    from kuda_idem_template import cache
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", type=Path, default=Path("archive"))
+    parser.add_argument("--templates", type=Path, default=Path("."), help="Template directory")
+    parser.add_argument("--force", action="store_true", help="Render every page again")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = build_site(ArchiveStore(cache), args.output, args.templates, args.force)
+    elapsed = time.perf_counter() - started
+    print(
+        f"Rendered {len(result.rendered)} pages, {result.skipped} up to date, in {elapsed:.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
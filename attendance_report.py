@@ -0,0 +1,272 @@
+"""Report attendance trends from the answers to all sent polls as an HTML page.
+
+Every poll is reduced to a summary: the city, venue, weekday, series and votes of its events
+and the IDs of its voters. Summaries are kept in the disk cache with the voter and answer
+counts they were made from, so a report only reads the answers of polls that were sent or
+answered since the last one. The report aggregates all summaries column by column into
+turnout per venue, city and weekday, with the change over the most recent weeks, the share
+of voters coming back and the series of events that draw the most votes, and renders it with
+the templates of the digest. The aggregates are not cached: the recent weeks are the latest
+polls, which every new poll and ``--recent-weeks`` change, so every report aggregates all
+summaries again::
+
+    python attendance_report.py --output attendance.html
+    python attendance_report.py --recent-weeks 8 --top 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import datetime as dt
+from collections import Counter
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from jinja2 import Environment
+
+from event_conflicts import normalize
+from kuda_idem_template import cache, get_russian_weekday, template_environment
+from poll_results import PollStore
+from tracing import tracer
+
+# The columns of the events of a poll summary
+EVENT_COLUMNS = ("city", "venue", "weekday", "series")
+
+
+def event_series(title: str) -> str:
+    """The series an event belongs to: its normalized title without numbers, e.g. of editions."""
+    return " ".join(word for word in normalize(title).split() if not word.isdigit())
+
+
+@dataclass(slots=True)
+class PollSummary:
+    """What a report needs of a poll, stored by column.
+
+    Attributes
+    ----------
+        poll_id: ID of the poll
+        sent_at: When the poll was sent
+        stamp: Voter and answer counts of the poll the summary was made from
+        columns: Values of `EVENT_COLUMNS` for every event of the poll
+        votes: Votes for every event of the poll
+        voters: IDs of everyone who currently has an answer
+
+    """
+
+    poll_id: str
+    sent_at: dt.datetime
+    stamp: tuple[int, int]
+    columns: dict[str, list[str]]
+    votes: list[int]
+    voters: frozenset[int]
+
+
+def _stamp(store: PollStore, poll_id: str) -> tuple[int, int]:
+    # Every answer, even one that leaves the votes as they were, increments the answer count
+    return store.voter_count(poll_id), store.answer_count(poll_id)
+
+
+def summarize_polls(store: PollStore) -> list[PollSummary]:
+    """Summaries of all polls, oldest first, made again only for polls answered since."""
+    cache = store.cache
+    summaries: list[PollSummary] = []
+    changed: dict[str, tuple[int, int]] = {}
+    for poll_id in store.poll_ids():
+        stamp = _stamp(store, poll_id)
+        # Stored as a dict, so the cache does not depend on the module the class is in
+        data = cache.get(("attendance", poll_id))
+        if data is not None and data["stamp"] == stamp:
+            summaries.append(PollSummary(**data))
+        else:
+            changed[poll_id] = stamp
+
+    if changed:
+        with tracer.span("attendance.summarize", polls=len(changed)):
+            for poll_id, stamp in changed.items():
+                poll = cache[("poll", poll_id)]
+                columns: dict[str, list[str]] = {name: [] for name in EVENT_COLUMNS}
+                votes: list[int] = []
+                for result in store.results(poll_id):
+                    # Options after the events, like "Никуда не иду", stand for no event
+                    if (event := result.event) is None:
+                        continue
+                    start = dt.datetime.fromisoformat(event["start_datetime"])
+                    columns["city"].append(event["city"])
+                    columns["venue"].append(event["venue_name"])
+                    columns["weekday"].append(get_russian_weekday(start))
+                    columns["series"].append(event_series(event["title"]))
+                    votes.append(result.votes)
+                summary = PollSummary(
+                    poll_id,
+                    dt.datetime.fromisoformat(poll["sent_at"]),
+                    stamp,
+                    columns,
+                    votes,
+                    store.voter_ids(poll_id),
+                )
+                cache.set(("attendance", poll_id), dataclasses.asdict(summary))
+                summaries.append(summary)
+    return sorted(summaries, key=lambda summary: summary.sent_at)
+
+
+@dataclass(slots=True)
+class Turnout:
+    """Votes of the events with the same city, venue, weekday or series.
+
+    Attributes
+    ----------
+        name: The shared value
+        events: Events with it
+        votes: Votes for them
+        recent: Mean votes per event in the recent weeks, None if it had none
+        earlier: Mean votes per event before, None if it had none
+
+    """
+
+    name: str
+    events: int
+    votes: int
+    recent: float | None
+    earlier: float | None
+
+    @property
+    def mean(self) -> float:
+        """Mean votes per event."""
+        return self.votes / self.events
+
+    @property
+    def trend(self) -> float | None:
+        """Change of the mean votes in the recent weeks, None without both periods."""
+        if self.recent is None or self.earlier is None:
+            return None
+        return self.recent - self.earlier
+
+
+@dataclass(slots=True)
+class Week:
+    """Voters of a poll and how many of them had voted before."""
+
+    sent_at: dt.datetime
+    events: int
+    votes: int
+    voters: int
+    returning: int
+
+    @property
+    def repeat_rate(self) -> float:
+        """Share of the voters who had answered an earlier poll."""
+        return self.returning / self.voters if self.voters else 0.0
+
+
+@dataclass(slots=True)
+class AttendanceReport:
+    """Turnout by every column of `EVENT_COLUMNS`, per week and of returning voters."""
+
+    turnout: dict[str, list[Turnout]]
+    weeks: list[Week]
+    voters: int
+    repeat_voters: int
+    generated_at: dt.datetime = field(default_factory=dt.datetime.now)
+
+    @property
+    def repeat_rate(self) -> float:
+        """Share of all voters who answered more than one poll."""
+        return self.repeat_voters / self.voters if self.voters else 0.0
+
+
+def build_report(
+        summaries: Sequence[PollSummary], recent_weeks: int = 4, min_series: int = 2
+) -> AttendanceReport:
+    """Aggregate poll summaries, oldest first, into an attendance report.
+
+    Args:
+    ----
+        summaries: Summaries of the polls in the order they were sent
+        recent_weeks: Number of the latest polls whose turnout is compared with the earlier
+        min_series: Events a series needs at least to be ranked
+
+    Returns:
+    -------
+        AttendanceReport: Turnout sorted by mean votes, the highest first
+
+    """
+    first_recent = max(len(summaries) - recent_weeks, 0)
+    counts = {name: [Counter(), Counter()] for name in EVENT_COLUMNS}
+    votes = {name: [Counter(), Counter()] for name in EVENT_COLUMNS}
+    polls_voted: Counter[int] = Counter()
+    weeks = []
+    with tracer.span("attendance.report", polls=len(summaries)):
+        for i, summary in enumerate(summaries):
+            period = int(i >= first_recent)
+            for name in EVENT_COLUMNS:
+                column = summary.columns[name]
+                counts[name][period].update(column)
+                period_votes = votes[name][period]
+                for value, value_votes in zip(column, summary.votes, strict=True):
+                    period_votes[value] += value_votes
+            returning = sum(1 for voter in summary.voters if voter in polls_voted)
+            polls_voted.update(summary.voters)
+            weeks.append(
+                Week(
+                    summary.sent_at,
+                    len(summary.votes),
+                    sum(summary.votes),
+                    len(summary.voters),
+                    returning,
+                )
+            )
+
+    def mean(name: str, period: int, value: str) -> float | None:
+        events = counts[name][period][value]
+        return votes[name][period][value] / events if events else None
+
+    turnout = {}
+    for name in EVENT_COLUMNS:
+        total_counts = counts[name][0] + counts[name][1]
+        rows = [
+            Turnout(
+                value,
+                events,
+                votes[name][0][value] + votes[name][1][value],
+                mean(name, 1, value),
+                mean(name, 0, value),
+            )
+            for value, events in total_counts.items()
+            if name != "series" or events >= min_series
+        ]
+        turnout[name] = sorted(rows, key=lambda row: (-row.mean, row.name))
+    return AttendanceReport(
+        turnout,
+        weeks,
+        len(polls_voted),
+        sum(1 for polls in polls_voted.values() if polls > 1),
+    )
+
+
+def render_report(
+        report: AttendanceReport, top: int = 10, environment: Environment | None = None
+) -> str:
+    """Render the report with ``attendance.j2``, listing ``top`` rows of every turnout table."""
+    environment = environment or template_environment
+    with tracer.span("template.render_attendance"):
+        return environment.get_template("attendance.j2").render(report=report, top=top)
+
+
+def main() -> None:
+    """Write the attendance report of all polls from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", type=Path, default=Path("attendance.html"))
+    parser.add_argument("--recent-weeks", type=int, default=4)
+    parser.add_argument("--top", type=int, default=10, help="Rows of every table at most")
+    args = parser.parse_args()
+
+    summaries = summarize_polls(PollStore(cache))
+    report = build_report(summaries, args.recent_weeks)
+    args.output.write_text(render_report(report, args.top), encoding="utf-8")
+    print(f"Wrote the attendance of {len(summaries)} polls to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
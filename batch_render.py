@@ -0,0 +1,210 @@
+"""Render many variants of the digest at once in a process pool.
+
+A variant is a set of events, e.g. those of one city, rendered with the templates of one
+directory, e.g. one per language, into one format: Telegram HTML, a plain page, Discord
+Markdown or plain text. Rendering is CPU-bound Python, so variants are spread over worker
+processes. Every worker compiles the templates of a directory once and keeps them, together
+with its own cache of event fragments, for all the variants it renders. Events are sent to
+the workers as compact JSON rows, and variants that differ only in their format are rendered
+once and converted per format::
+
+    python batch_render.py --by city --formats telegram markdown --output variants
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import time
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader
+
+from kuda_idem_template import Event, FragmentCache, cache, generate_event_page
+from publishing import html_to_markdown, html_to_text
+from tracing import tracer
+
+# The fields of an event in the order of the rows sent to the workers
+EVENT_FIELDS = tuple(Event.model_fields)
+
+
+def _telegram(page: str) -> str:
+    return page.replace('<meta charset="UTF-8">', "")
+
+
+def _page(page: str) -> str:
+    return page
+
+
+# Conversions of a rendered page into every supported format
+FORMATS = {
+    "telegram": _telegram,
+    "html": _page,
+    "markdown": html_to_markdown,
+    "text": html_to_text,
+}
+
+
+@dataclass(slots=True)
+class Variant:
+    """A variant of the digest to render.
+
+    Attributes
+    ----------
+        name: Name of the variant, e.g. its city and format
+        events: Events of the variant
+        format: One of `FORMATS`
+        template_dir: Directory of header.j2 and event.j2, e.g. of one language
+
+    """
+
+    name: str
+    events: Sequence[Event]
+    format: str = "telegram"
+    template_dir: Path = Path(".")
+
+
+def pack_events(events: Sequence[Event]) -> bytes:
+    """Serialize events as a JSON list of rows of their field values."""
+    rows = [
+        [data[name] for name in EVENT_FIELDS]
+        for data in (event.model_dump(mode="json") for event in events)
+    ]
+    return json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def unpack_events(packed: bytes) -> list[Event]:
+    """Deserialize events packed by `pack_events`."""
+    return [Event(**dict(zip(EVENT_FIELDS, row, strict=True))) for row in json.loads(packed)]
+
+
+# Per worker process: the environment of every template directory, and the fragment cache
+_environments: dict[str, Environment] = {}
+_fragments = FragmentCache()
+
+
+def _render_job(job: tuple[str, bytes, tuple[str, ...]]) -> list[str]:
+    """Render packed events with the templates of a directory into several formats."""
+    template_dir, packed, formats = job
+    environment = _environments.get(template_dir)
+    if environment is None:
+        # Templates never change during a batch, so they are compiled once and not checked
+        environment = Environment(loader=FileSystemLoader(template_dir), auto_reload=False)
+        _environments[template_dir] = environment
+    page = generate_event_page(unpack_events(packed), environment, _fragments)
+    return [FORMATS[name](page) for name in formats]
+
+
+class BatchRenderer:
+    """A process pool rendering variants, reusable for several batches.
+
+    Args:
+    ----
+        max_workers: Worker processes, defaults to the number of cores
+
+    """
+
+    def __init__(self, max_workers: int | None = None) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool: ProcessPoolExecutor | None = None
+
+    def __enter__(self) -> BatchRenderer:
+        self._pool = ProcessPoolExecutor(self.max_workers)
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def render(self, variants: Sequence[Variant]) -> list[str]:
+        """Render variants and return them in the order of ``variants``.
+
+        Raises:
+        ------
+            ValueError: If a variant asks for an unknown format
+
+        """
+        assert self._pool is not None, "BatchRenderer must be used as a context manager"
+        for variant in variants:
+            if variant.format not in FORMATS:
+                raise ValueError(f"Unknown format {variant.format!r}")
+
+        # One job per distinct events and templates, with all the formats asked of them
+        jobs: dict[tuple[str, bytes], list[int]] = {}
+        for i, variant in enumerate(variants):
+            jobs.setdefault((str(variant.template_dir), pack_events(variant.events)), []).append(i)
+        payloads = [
+            (template_dir, packed, tuple(variants[i].format for i in indices))
+            for (template_dir, packed), indices in jobs.items()
+        ]
+
+        results: list[str] = [""] * len(variants)
+        chunksize = max(1, len(payloads) // (self.max_workers * 4))
+        with tracer.span("batch.render", variants=len(variants), jobs=len(payloads)):
+            outputs = self._pool.map(_render_job, payloads, chunksize=chunksize)
+            for indices, rendered in zip(jobs.values(), outputs, strict=True):
+                for i, output in zip(indices, rendered, strict=True):
+                    results[i] = output
+        return results
+
+
+def city_variants(
+        events: Sequence[Event],
+        formats: Sequence[str],
+        template_dirs: Sequence[Path] = (Path("."),),
+) -> list[Variant]:
+    """Every combination of a city's events, a template directory and a format."""
+    cities = sorted({event.city for event in events})
+    return [
+        Variant(
+            f"{city}-{template_dir.name or 'default'}-{format}",
+            [event for event in events if event.city == city],
+            format,
+            template_dir,
+        )
+        for city, template_dir, format in itertools.product(cities, template_dirs, formats)
+    ]
+
+
+def main() -> None:
+    """Render the variants of the saved events into a directory from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--by", choices=("city", "all"), default="city")
+    parser.add_argument("--formats", nargs="+", choices=tuple(FORMATS), default=["telegram"])
+    parser.add_argument(
+        "--templates", type=Path, nargs="+", default=[Path(".")], help="Template directories"
+    )
+    parser.add_argument("--workers", type=int, help="Worker processes, defaults to the cores")
+    parser.add_argument("--output", type=Path, default=Path("variants"))
+    args = parser.parse_args()
+
+    events = [Event(**data) for data in cache.get("events", [])]
+    if args.by == "city":
+        variants = city_variants(events, args.formats, args.templates)
+    else:
+        variants = [
+            Variant(f"{template_dir.name or 'default'}-{format}", events, format, template_dir)
+            for template_dir, format in itertools.product(args.templates, args.formats)
+        ]
+
+    started = time.perf_counter()
+    with BatchRenderer(args.workers) as renderer:
+        outputs = renderer.render(variants)
+    elapsed = time.perf_counter() - started
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    suffixes = {"telegram": "html", "html": "html", "markdown": "md", "text": "txt"}
+    for variant, output in zip(variants, outputs, strict=True):
+        path = args.output / f"{variant.name}.{suffixes[variant.format]}"
+        path.write_text(output, encoding="utf-8")
+    print(f"Rendered {len(variants)} variants in {elapsed:.2f} s into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Benchmark the render and validation hot paths on synthetic events.
+
+Run from anywhere with ``python benchmarks/bench_hot_paths.py``. Every run is appended to
+``benchmarks/history.jsonl`` and compared to the previous one, so that regressions are visible.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+HISTORY_PATH = Path(__file__).resolve().parent / "history.jsonl"
+DEFAULT_SIZES = (10, 100, 1_000, 10_000)
+
+# Settings are read on import, the benchmarks never talk to Telegram
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("TOPIC_ID", "0")
+os.environ.setdefault("GROUP_CHAT_ID", "0")
+sys.path.insert(0, str(REPO_ROOT))
+
+from diskcache import Cache  # noqa: E402
+
+import kuda_idem_template  # noqa: E402
+from event_batch import EventBatch  # noqa: E402
+from kuda_idem_template import (  # noqa: E402
+    Event,
+    FragmentCache,
+    determine_date_range,
+    format_date_range,
+    generate_event_page,
+    split_html_message,
+)
+
+CITIES = ("Амстердам", "Роттердам", "Утрехт", "Гаага", "Антверп", "Зандаам")
+VENUES = ("Клуб RAUM", "Клуб RADION", "Арт-центр WORM", "BASIS", "Bret", "De School")
+
+
+def make_event_data(n: int, seed: int = 0) -> list[dict[str, Any]]:
+    """Generate raw keyword arguments for ``n`` synthetic events around one weekend.
+
+    Args:
+    ----
+        n: Number of events to generate
+        seed: Seed for the random generator, so that runs are comparable
+
+    Returns:
+    -------
+        list[dict[str, Any]]: Keyword arguments for the Event constructor
+
+    """
+    rng = random.Random(seed)
+    friday = dt.datetime(2024, 11, 22, 20, 0)
+    events = []
+    for i in range(n):
+        start = friday + dt.timedelta(hours=rng.randrange(0, 60))
+        events.append(
+            {
+                "city": rng.choice(CITIES),
+                "title": f"Synthetic party #{i} — {rng.choice(('techno', 'house', 'ambient'))}",
+                "title_link": f"https://www.instagram.com/p/event{i}/" if rng.random() < 0.7 else None,
+                "description": "Описание вечеринки. " * rng.randrange(0, 6) or None,
+                "start_datetime": start,
+                "end_datetime": start + dt.timedelta(hours=rng.randrange(2, 12)),
+                "venue_name": rng.choice(VENUES),
+                "venue_address": f"Straat {rng.randrange(1, 200)}",
+                "venue_map_link": f"https://maps.app.goo.gl/venue{i % 50}",
+                "ticket_link": f"https://shop.example.com/{i}/" if rng.random() < 0.5 else None,
+                "ticket_info": "Билетов мало." if rng.random() < 0.2 else None,
+            }
+        )
+    return events
+
+
+def make_events(n: int, seed: int = 0) -> list[Event]:
+    """Generate ``n`` validated synthetic events, see `make_event_data`."""
+    return [Event(**data) for data in make_event_data(n, seed)]
+
+
+def bench_cases(
+        n: int,
+        cache_dir: Path,
+) -> Iterator[tuple[str, Callable[[], object]]]:
+    """Yield benchmark names with zero-argument callables for a collection of ``n`` events."""
+    data = make_event_data(n)
+    events = [Event(**kwargs) for kwargs in data]
+    start_date, end_date = determine_date_range(events)
+    html_message = generate_event_page(events)
+    cache = Cache(str(cache_dir / f"cache_{n}"))
+    # Same format as the GUI uses for its saved events
+    cache.set("events", [event.model_dump(mode="python") for event in events])
+
+    yield "event_construction", lambda: [Event(**kwargs) for kwargs in data]
+    yield "determine_date_range", lambda: determine_date_range(events)
+    batch = EventBatch.from_events(events)
+    yield "event_batch_construction", lambda: EventBatch.from_events(events)
+    yield "event_batch_date_range", batch.date_range
+    yield "event_batch_sorted", batch.sorted
+    yield "event_batch_group_by_city", batch.group_by_city
+    yield "format_date_range", lambda: format_date_range(start_date, end_date)
+    yield "generate_event_page", lambda: generate_event_page(events)
+    yield "generate_event_page_cold", lambda: generate_event_page_cold(events)
+    yield "cache_save", lambda: cache.set(
+        "events", [event.model_dump(mode="python") for event in events]
+    )
+    yield "cache_load", lambda: [Event(**kwargs) for kwargs in cache.get("events", [])]
+    yield "split_html_message", lambda: split_html_message(html_message)
+
+
+def generate_event_page_cold(events: list[Event]) -> str:
+    """Render a page with an empty fragment cache, i.e. every event is rendered."""
+    kuda_idem_template.fragment_cache = FragmentCache()
+    return generate_event_page(events)
+
+
+def time_call(func: Callable[[], object], repeat: int, min_time: float) -> float:
+    """Return the median time of a single call of ``func``, in seconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return statistics.median(t / number for t in timer.repeat(repeat=repeat, number=number))
+
+
+def git_revision() -> str | None:
+    """Return the current git revision, if the benchmarks run from a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous_run(path: Path) -> dict[str, Any] | None:
+    """Return the most recent run stored in the history file, if any."""
+    if not path.exists():
+        return None
+    lines = path.read_text(encoding="utf-8").splitlines()
+    return json.loads(lines[-1]) if lines else None
+
+
+def format_seconds(seconds: float) -> str:
+    """Format a duration with a human-friendly unit."""
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main() -> None:
+    """Run the benchmarks, print a comparison with the previous run and store the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: tuple(int(size) for size in value.split(",")),
+        default=DEFAULT_SIZES,
+        help="Comma-separated numbers of events (default: %(default)s)",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions per case")
+    parser.add_argument(
+        "--min-time", type=float, default=0.2, help="Minimal time of one repetition, in seconds"
+    )
+    parser.add_argument(
+        "--only", nargs="+", default=None, help="Only run benchmarks with these names"
+    )
+    parser.add_argument("--history", type=Path, default=HISTORY_PATH, help="History file")
+    parser.add_argument("--no-save", action="store_true", help="Do not store the results")
+    args = parser.parse_args()
+
+    # generate_event_page reads the template relative to the working directory
+    os.chdir(REPO_ROOT)
+    previous = load_previous_run(args.history)
+    previous_results = previous["results"] if previous else {}
+
+    results: dict[str, dict[str, float]] = {}
+    print(f"{'benchmark':<28}{'events':>8}{'per call':>14}{'vs previous':>14}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for n in args.sizes:
+            for name, func in bench_cases(n, Path(cache_dir)):
+                if args.only and name not in args.only:
+                    continue
+                seconds = time_call(func, args.repeat, args.min_time)
+                results.setdefault(name, {})[str(n)] = seconds
+
+                old = previous_results.get(name, {}).get(str(n))
+                change = f"{(seconds - old) / old:+.1%}" if old else "—"
+                print(f"{name:<28}{n:>8}{format_seconds(seconds):>14}{change:>14}")
+
+    if not args.no_save:
+        run = {
+            "timestamp": dt.datetime.now(dt.UTC).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }
+        with args.history.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(run, ensure_ascii=False) + "\n")
+        print(f"\nResults appended to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Load-test the Telegram send path against the local Bot API stand-in.
+
+Sends many digests concurrently through `send_html_message`, with the stub's latency
+and error injection, and reports throughput together with the stub's request accounting.
+The disk cache, calendar feed and event archive the send path writes to are kept in a
+temporary directory, so the synthetic digests never reach the real ones.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("TOPIC_ID", "1")
+os.environ.setdefault("GROUP_CHAT_ID", "-100")
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_hot_paths import make_events  # noqa: E402
+from diskcache import Cache  # noqa: E402
+
+import kuda_idem_template  # noqa: E402
+from telegram_stub_server import StubBotApiServer  # noqa: E402
+
+
+async def load_test(
+        server: StubBotApiServer, digests: int, concurrency: int, events: int
+) -> tuple[float, int]:
+    """Send ``digests`` digests with at most ``concurrency`` in flight.
+
+    Returns
+    -------
+        tuple[float, int]: Elapsed time in seconds and the number of failed sends
+
+    """
+    kuda_idem_template.settings.BOT_API_BASE_URL = server.base_url
+    collection = make_events(events)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_one() -> None:
+        async with semaphore:
+            await kuda_idem_template.send_html_message(collection)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(send_one() for _ in range(digests)), return_exceptions=True)
+    return time.perf_counter() - started, sum(isinstance(r, Exception) for r in results)
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Start the stub, run the load test and print the report."""
+    # generate_event_page reads the template relative to the working directory
+    os.chdir(REPO_ROOT)
+    server = StubBotApiServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        seed=0,
+    )
+    settings = kuda_idem_template.settings
+    with tempfile.TemporaryDirectory(prefix="bench_send_path") as directory:
+        state = Path(directory)
+        kuda_idem_template.cache = Cache(state / "event_cache")
+        settings.ICS_FEED_PATH = state / "events.ics"
+        settings.EVENT_ARCHIVE_DIR = state / "event_archive"
+        try:
+            async with server:
+                elapsed, failed = await load_test(
+                    server, args.digests, args.concurrency, args.events
+                )
+        finally:
+            kuda_idem_template.cache.close()
+
+    calls = len(server.requests)
+    print(
+        f"{args.digests} digests of {args.events} events, concurrency {args.concurrency}: "
+        f"{elapsed:.2f} s, {args.digests / elapsed:.1f} digests/s, "
+        f"{calls / elapsed:.1f} API calls/s, {failed} failed"
+    )
+    print(server.summary())
+
+
+def main() -> None:
+    """Parse the command line and run the load test."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--digests", type=int, default=100, help="Number of digests to send")
+    parser.add_argument("--concurrency", type=int, default=10, help="Digests sent at once")
+    parser.add_argument("--events", type=int, default=10, help="Events per digest")
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Stub jitter, seconds")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of 429 responses")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Share of 502 responses")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
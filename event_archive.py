@@ -0,0 +1,357 @@
+"""An append-only, memory-mapped archive of all published events and their poll votes.
+
+Every event sent with a poll is appended as a fixed-width record to ``records.bin``: its start
+and end times, weekday, and the IDs of its city, venue, title and poll in ``strings.bin``, a
+table of length-prefixed UTF-8 strings. Analytics map the files and stream over the records
+without building an object per event; strings are only decoded for the rows of a report, so
+opening the archive takes the same time whatever its size. Vote counts are stored in the
+records too and are updated in place from the poll store::
+
+    python event_archive.py report              # busiest venues, cities and weekdays
+    python event_archive.py votes               # update the votes of the latest poll
+    python event_archive.py import              # fill a new archive from the digest archive
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import mmap
+import struct
+from collections import Counter
+from collections.abc import Callable, Collection, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tracing import tracer
+
+if TYPE_CHECKING:
+    from archive_site import ArchiveStore
+    from kuda_idem_template import Event
+    from poll_results import PollStore
+
+MAGIC = b"KIEA"
+VERSION = 1
+# Magic, version and record size, padded to 16 bytes
+HEADER = struct.Struct("<4sHH8x")
+# Start, end, city, venue, title, poll, votes, poll option, weekday, padding
+RECORD = struct.Struct("<qqIIIIIBB2x")
+_LENGTH = struct.Struct("<I")
+# String ID of a missing string, e.g. of events sent without a poll
+NO_STRING = 0xFFFFFFFF
+
+RECORDS_NAME = "records.bin"
+STRINGS_NAME = "strings.bin"
+POLLS_NAME = "polls.json"
+
+
+@dataclass(slots=True, frozen=True)
+class Record:
+    """An archived event, with its strings as IDs into the string table."""
+
+    start: int
+    end: int
+    city: int
+    venue: int
+    title: int
+    poll: int
+    votes: int
+    option: int
+    weekday: int
+
+
+class EventArchive:
+    """The record and string files of an archive in a directory.
+
+    Appending reads the string table once to reuse the IDs of known strings. Reading only
+    maps the files.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.records_path = directory / RECORDS_NAME
+        self.strings_path = directory / STRINGS_NAME
+        self.polls_path = directory / POLLS_NAME
+
+    def _create(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if not self.records_path.exists():
+            self.records_path.write_bytes(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.strings_path.touch()
+
+    def _string_ids(self) -> dict[str, int]:
+        ids: dict[str, int] = {}
+        data = self.strings_path.read_bytes()
+        offset = 0
+        while offset + _LENGTH.size <= len(data):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            ids[data[offset + _LENGTH.size:offset + _LENGTH.size + length].decode()] = offset
+            offset += _LENGTH.size + length
+        return ids
+
+    def append(self, events: Collection[Event], poll_id: str | None = None) -> int:
+        """Append the events of a digest, in the order of the poll options, if there is a poll.
+
+        Returns
+        -------
+            int: Position of the first appended record
+
+        """
+        from event_batch import to_micros
+
+        self._create()
+        with tracer.span("event_archive.append", events=len(events)):
+            ids = self._string_ids()
+            with self.strings_path.open("ab") as strings:
+                offset = strings.tell()
+
+                def string_id(text: str) -> int:
+                    nonlocal offset
+                    if (known := ids.get(text)) is not None:
+                        return known
+                    encoded = text.encode()
+                    strings.write(_LENGTH.pack(len(encoded)) + encoded)
+                    ids[text] = offset
+                    offset += _LENGTH.size + len(encoded)
+                    return ids[text]
+
+                poll = string_id(poll_id) if poll_id is not None else NO_STRING
+                records = b"".join(
+                    RECORD.pack(
+                        to_micros(event.start_datetime),
+                        to_micros(event.end_datetime),
+                        string_id(event.city),
+                        string_id(event.venue_name),
+                        string_id(event.title),
+                        poll,
+                        0,
+                        option if poll_id is not None else 0,
+                        event.start_datetime.weekday(),
+                    )
+                    for option, event in enumerate(events)
+                )
+            # Strings are written first, so records never refer to missing strings
+            with self.records_path.open("ab") as f:
+                first = (f.tell() - HEADER.size) // RECORD.size
+                f.write(records)
+        if poll_id is not None:
+            polls = self._polls()
+            polls[poll_id] = [first, len(events)]
+            temporary = self.polls_path.with_name(self.polls_path.name + ".tmp")
+            temporary.write_text(json.dumps(polls), encoding="utf-8")
+            temporary.replace(self.polls_path)
+        return first
+
+    def _polls(self) -> dict[str, list[int]]:
+        if not self.polls_path.exists():
+            return {}
+        return json.loads(self.polls_path.read_text(encoding="utf-8"))
+
+    def update_votes(self, poll_id: str, store: PollStore) -> bool:
+        """Write the current votes of a poll's options into their records, in place.
+
+        Returns
+        -------
+            bool: Whether the poll's events are in the archive
+
+        """
+        position = self._polls().get(poll_id)
+        if position is None:
+            return False
+        first, count = position
+        results = store.results(poll_id)
+        with self.records_path.open("r+b") as f, mmap.mmap(f.fileno(), 0) as mapped:
+            for option in range(count):
+                offset = HEADER.size + (first + option) * RECORD.size
+                record = list(RECORD.unpack_from(mapped, offset))
+                record[6] = results[option].votes
+                RECORD.pack_into(mapped, offset, *record)
+        return True
+
+    def reader(self) -> ArchiveReader:
+        """Map the archive for reading."""
+        return ArchiveReader(self.records_path, self.strings_path)
+
+
+class ArchiveReader:
+    """Read-only memory maps of the record and string files.
+
+    Use as a context manager, records and strings are read on demand.
+    """
+
+    def __init__(self, records_path: Path, strings_path: Path) -> None:
+        self._files = [records_path.open("rb"), strings_path.open("rb")]
+        self._maps = [
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if f.seek(0, 2) else None
+            for f in self._files
+        ]
+        records, _ = self._maps
+        if records is None or HEADER.unpack_from(records) != (MAGIC, VERSION, RECORD.size):
+            self.close()
+            raise ValueError(f"{records_path} is not an event archive of version {VERSION}")
+
+    def close(self) -> None:
+        """Unmap and close the files."""
+        for mapped in self._maps:
+            if mapped is not None:
+                mapped.close()
+        for f in self._files:
+            f.close()
+
+    def __enter__(self) -> ArchiveReader:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return (len(self._maps[0]) - HEADER.size) // RECORD.size
+
+    def rows(self, chunk: int = 4096) -> Iterator[tuple[int, ...]]:
+        """Stream the records as tuples in `RECORD` field order, oldest first.
+
+        Records are copied out of the map ``chunk`` at a time rather than read through a view
+        of it, so the reader can be closed while a caller still holds the iterator.
+        """
+        records = self._maps[0]
+        end = HEADER.size + len(self) * RECORD.size
+        for start in range(HEADER.size, end, chunk * RECORD.size):
+            yield from RECORD.iter_unpack(records[start:min(start + chunk * RECORD.size, end)])
+
+    def record(self, position: int) -> Record:
+        """The record at a position."""
+        return Record(*RECORD.unpack_from(self._maps[0], HEADER.size + position * RECORD.size))
+
+    def string(self, string_id: int) -> str | None:
+        """A string of the string table by its ID."""
+        strings = self._maps[1]
+        if string_id == NO_STRING or strings is None:
+            return None
+        (length,) = _LENGTH.unpack_from(strings, string_id)
+        start = string_id + _LENGTH.size
+        return strings[start:start + length].decode()
+
+
+@dataclass(slots=True)
+class Report:
+    """Totals of the archive by venue, city and weekday."""
+
+    events: int
+    venues: list[tuple[str, int, int]]
+    cities: list[tuple[str, int, int]]
+    weekdays: list[tuple[str, int, int]]
+
+    def describe(self) -> str:
+        """The report as text tables of events and votes."""
+        lines = [f"{self.events} events"]
+        for title, rows in (
+                ("Busiest venues", self.venues),
+                ("Attendance by city", self.cities),
+                ("Weekdays", self.weekdays),
+        ):
+            lines.append(f"\n{title} (events, votes):")
+            width = max((len(name) for name, _, _ in rows), default=0)
+            lines += [f"  {name:<{width}}  {count:>6}  {votes:>6}" for name, count, votes in rows]
+        return "\n".join(lines)
+
+
+def build_report(
+        reader: ArchiveReader, since: dt.datetime | None = None, top: int = 10
+) -> Report:
+    """Count events and sum votes by venue, city and weekday in one pass over the records.
+
+    Args:
+    ----
+        reader: Mapped archive
+        since: Only count events starting at or after this time
+        top: Venues to list at most
+
+    Returns:
+    -------
+        Report: Rows of name, events and votes, the largest first
+
+    """
+    from event_batch import to_micros
+    from kuda_idem_template import get_russian_weekday
+
+    low = to_micros(since) if since is not None else None
+    counts: dict[str, Counter[int]] = {name: Counter() for name in ("venue", "city", "weekday")}
+    votes: dict[str, Counter[int]] = {name: Counter() for name in ("venue", "city", "weekday")}
+    events = 0
+    with tracer.span("event_archive.report", records=len(reader)):
+        for start, _, city, venue, _, _, record_votes, _, weekday in reader.rows():
+            if low is not None and start < low:
+                continue
+            events += 1
+            for name, key in (("venue", venue), ("city", city), ("weekday", weekday)):
+                counts[name][key] += 1
+                votes[name][key] += record_votes
+
+    def rows(
+            name: str, label: Callable[[int], str], limit: int | None = None
+    ) -> list[tuple[str, int, int]]:
+        return [
+            (label(key), count, votes[name][key])
+            for key, count in counts[name].most_common(limit)
+        ]
+
+    # 1 January 2024 was a Monday, so its weekday number is the offset in days
+    monday = dt.datetime(2024, 1, 1)
+    return Report(
+        events,
+        rows("venue", lambda key: reader.string(key) or "", top),
+        rows("city", lambda key: reader.string(key) or ""),
+        rows("weekday", lambda key: get_russian_weekday(monday + dt.timedelta(days=key))),
+    )
+
+
+def import_archive(archive: EventArchive, store: ArchiveStore) -> int:
+    """Append every week of the digest archive to an empty event archive, without polls."""
+    from kuda_idem_template import Event
+
+    if archive.records_path.exists() and archive.records_path.stat().st_size > HEADER.size:
+        raise FileExistsError(f"{archive.records_path} already has records")
+    appended = 0
+    for week in store.weeks():
+        events = [Event(**data) for data in store.events(week)]
+        archive.append(events)
+        appended += len(events)
+    return appended
+
+
+def main() -> None:
+    """Report on the event archive or update it from the command line."""
+    from archive_site import ArchiveStore
+    from kuda_idem_template import cache, settings
+    from poll_results import PollStore
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser("report", help="Busiest venues, cities and weekdays")
+    report.add_argument("--since", type=dt.datetime.fromisoformat)
+    report.add_argument("--top", type=int, default=10)
+    votes = commands.add_parser("votes", help="Copy the votes of a poll into the archive")
+    votes.add_argument("--poll-id", help="Poll to update, defaults to the latest one")
+    commands.add_parser("import", help="Fill a new archive from the digest archive")
+    args = parser.parse_args()
+
+    archive = EventArchive(settings.EVENT_ARCHIVE_DIR)
+    match args.command:
+        case "report":
+            if not archive.records_path.exists():
+                parser.exit(message="No events archived yet.\n")
+            with archive.reader() as reader:
+                print(build_report(reader, args.since, args.top).describe())
+        case "votes":
+            store = PollStore(cache)
+            poll_id = args.poll_id or store.latest_poll_id()
+            if poll_id is None or not archive.update_votes(poll_id, store):
+                parser.exit(1, f"Poll {poll_id} is not in the archive\n")
+        case "import":
+            print(f"Imported {import_archive(archive, ArchiveStore(cache))} events")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""A compact columnar representation of many events for bulk queries.
+
+`EventBatch` keeps the start and end times of its events as arrays of 64-bit microsecond
+counts, and cities and venues as codes into lists of their distinct values, so that date
+ranges, time windows, sorting and grouping by city run over flat arrays with C-level builtins
+instead of reading attributes of pydantic models. The other fields are kept as plain columns,
+so converting back to `Event` gives equal events.
+"""
+
+from __future__ import annotations
+
+import copy
+import datetime as dt
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from itertools import compress
+from typing import Any
+
+from kuda_idem_template import Event, get_friday_and_sunday
+
+# Fields stored as codes into their distinct values, which repeat across events
+CATEGORY_FIELDS = ("city", "venue_name", "venue_address", "venue_map_link")
+# Fields stored as they are
+OBJECT_FIELDS = (
+    "title", "title_link", "description", "ticket_link", "ticket_info", "poster", "uid"
+)
+
+_EPOCH = dt.datetime(1970, 1, 1)
+_UTC_EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.UTC)
+_MICROSECOND = dt.timedelta(microseconds=1)
+
+
+def to_micros(value: dt.datetime) -> int:
+    """Microseconds since the epoch, of UTC for aware datetimes and of wall time otherwise."""
+    if value.tzinfo is None:
+        return (value - _EPOCH) // _MICROSECOND
+    return (value - _UTC_EPOCH) // _MICROSECOND
+
+
+def from_micros(micros: int, tzinfo: dt.tzinfo | None) -> dt.datetime:
+    """The datetime of `to_micros`, in the time zone it had."""
+    if tzinfo is None:
+        return _EPOCH + dt.timedelta(microseconds=micros)
+    return (_UTC_EPOCH + dt.timedelta(microseconds=micros)).astimezone(tzinfo)
+
+
+class Categories:
+    """Distinct values of a column, with codes in the order they were first seen."""
+
+    __slots__ = ("_codes", "values")
+
+    def __init__(self) -> None:
+        self.values: list[Any] = []
+        self._codes: dict[Any, int] = {}
+
+    def code(self, value: Any) -> int:
+        """The code of a value, added if it is new."""
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def find(self, value: Any) -> int | None:
+        """The code of a value, None if no event has it."""
+        return self._codes.get(value)
+
+
+class EventBatch:
+    """Events stored by column, or a selection of the rows of another batch.
+
+    `window`, `sorted`, `city` and `group_by_city` return views, which share the columns of
+    the batch they were made from and only hold the positions of their rows, so queries
+    touch no more than the columns they read.
+
+    Times are compared as microseconds, of UTC for aware datetimes and of wall time for naive
+    ones, so a batch holds either only aware or only naive times.
+    """
+
+    def __init__(self) -> None:
+        self.starts = array("q")
+        self.ends = array("q")
+        self.timezone_codes = array("H")
+        self.end_timezone_codes = array("H")
+        self.timezones = Categories()
+        # Whether the times are aware, None until the first event is added
+        self.aware: bool | None = None
+        self.categories = {name: Categories() for name in CATEGORY_FIELDS}
+        self.codes = {name: array("I") for name in CATEGORY_FIELDS}
+        self.objects: dict[str, list[Any]] = {name: [] for name in OBJECT_FIELDS}
+        # Positions of the rows of a view in the columns, None for all of them in order
+        self.rows: array[int] | None = None
+
+    @classmethod
+    def from_events(cls, events: Iterable[Event]) -> EventBatch:
+        """Store events by column."""
+        batch = cls()
+        for event in events:
+            batch.append(event)
+        return batch
+
+    def append(self, event: Event) -> None:
+        """Add an event at the end.
+
+        Raises:
+        ------
+            ValueError: If the batch is a view, or if the event has aware times and the batch
+                naive ones or the other way around
+
+        """
+        if self.rows is not None:
+            raise ValueError("Events cannot be added to a view of a batch")
+        start, end = event.start_datetime, event.end_datetime
+        aware = start.tzinfo is not None
+        if (end.tzinfo is not None) != aware or self.aware not in (None, aware):
+            raise ValueError("Events with naive and aware times cannot be mixed in a batch")
+        self.aware = aware
+        self.starts.append(to_micros(start))
+        self.ends.append(to_micros(end))
+        self.timezone_codes.append(self.timezones.code(start.tzinfo))
+        self.end_timezone_codes.append(self.timezones.code(end.tzinfo))
+        for name in CATEGORY_FIELDS:
+            self.codes[name].append(self.categories[name].code(getattr(event, name)))
+        for name in OBJECT_FIELDS:
+            self.objects[name].append(getattr(event, name))
+
+    def _positions(self) -> Sequence[int]:
+        return range(len(self.starts)) if self.rows is None else self.rows
+
+    def _column(self, column: Sequence[Any]) -> Iterable[Any]:
+        return column if self.rows is None else map(column.__getitem__, self.rows)
+
+    def _view(self, positions: Iterable[int]) -> EventBatch:
+        view = copy.copy(self)
+        view.rows = array("I", positions)
+        return view
+
+    def __len__(self) -> int:
+        return len(self._positions())
+
+    def __getitem__(self, i: int) -> Event:
+        row = self._positions()[i]
+        timezones = self.timezones.values
+        # The values were validated when the event was added
+        return Event.model_construct(
+            start_datetime=from_micros(self.starts[row], timezones[self.timezone_codes[row]]),
+            end_datetime=from_micros(self.ends[row], timezones[self.end_timezone_codes[row]]),
+            **{
+                name: self.categories[name].values[self.codes[name][row]]
+                for name in CATEGORY_FIELDS
+            },
+            **{name: self.objects[name][row] for name in OBJECT_FIELDS},
+        )
+
+    def __iter__(self) -> Iterator[Event]:
+        return (self[i] for i in range(len(self)))
+
+    def to_events(self) -> list[Event]:
+        """The events of the batch, in its order."""
+        return list(self)
+
+    def min_start(self) -> dt.datetime:
+        """Start of the earliest event, in its time zone."""
+        row = min(self._positions(), key=self.starts.__getitem__)
+        return from_micros(self.starts[row], self.timezones.values[self.timezone_codes[row]])
+
+    def max_end(self) -> dt.datetime:
+        """End of the latest event, in its time zone."""
+        row = max(self._positions(), key=self.ends.__getitem__)
+        return from_micros(self.ends[row], self.timezones.values[self.end_timezone_codes[row]])
+
+    def _micros(self, value: dt.datetime) -> int:
+        if self.aware is not None and (value.tzinfo is not None) != self.aware:
+            raise TypeError("can't compare offset-naive and offset-aware datetimes")
+        return to_micros(value)
+
+    def date_range(self) -> tuple[dt.datetime, dt.datetime]:
+        """Start and end of the digest, as `determine_date_range` returns them."""
+        earliest_start, latest_end = self.min_start(), self.max_end()
+        friday, sunday = get_friday_and_sunday(earliest_start)
+        return min(friday, earliest_start), max(sunday, latest_end)
+
+    def window(self, start: dt.datetime, end: dt.datetime) -> EventBatch:
+        """Events starting in ``[start, end)``.
+
+        Raises:
+        ------
+            TypeError: If the bounds are aware and the times of the batch naive, or the other
+                way around
+
+        """
+        low, high = self._micros(start), self._micros(end)
+        selected = [low <= value < high for value in self._column(self.starts)]
+        return self._view(compress(self._positions(), selected))
+
+    def sorted(self) -> EventBatch:
+        """Events in start time order, events starting together keep their order."""
+        return self._view(sorted(self._positions(), key=self.starts.__getitem__))
+
+    def city(self, city: str) -> EventBatch:
+        """Events in a city."""
+        code = self.categories["city"].find(city)
+        selected = [value == code for value in self._column(self.codes["city"])]
+        return self._view(compress(self._positions(), selected))
+
+    def group_by_city(self) -> dict[str, EventBatch]:
+        """Events by city, cities in the order they first appear."""
+        groups: dict[int, list[int]] = {}
+        for position, code in zip(self._positions(), self._column(self.codes["city"])):
+            groups.setdefault(code, []).append(position)
+        values = self.categories["city"].values
+        return {values[code]: self._view(positions) for code, positions in groups.items()}
@@ -0,0 +1,108 @@
+"""Find duplicate events and clashing events at the same venue.
+
+Events are grouped by normalized city and venue and swept in start time order, keeping the
+events that are still running in a heap ordered by end time. Every event is pushed and popped
+once, so finding all conflicts takes O(n log n + k) for n events and k conflicting pairs,
+instead of comparing every pair of events.
+"""
+
+from __future__ import annotations
+
+import heapq
+import re
+import unicodedata
+from collections import defaultdict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from enum import Enum, auto
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from kuda_idem_template import Event
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+class ConflictKind(Enum):
+    """Whether two events look like the same party or just share a venue at the same time."""
+
+    DUPLICATE = auto()
+    CLASH = auto()
+
+
+@dataclass(slots=True, frozen=True)
+class Conflict:
+    """A pair of conflicting events, as indices into the checked collection."""
+
+    kind: ConflictKind
+    first: int
+    second: int
+
+    def describe(self, events: Sequence[Event]) -> str:
+        """Describe the conflict for a human."""
+        first, second = events[self.first], events[self.second]
+        if self.kind is ConflictKind.DUPLICATE:
+            return (
+                f"Events {self.first + 1} and {self.second + 1} look like duplicates: "
+                f"{first.title!r}"
+            )
+        return (
+            f"Events {self.first + 1} and {self.second + 1} overlap at {first.venue_name}: "
+            f"{first.title!r} and {second.title!r}"
+        )
+
+
+def normalize(text: str) -> str:
+    """Normalize a name for comparison: case, Unicode forms, punctuation and spacing."""
+    return _NON_WORD.sub(" ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+def find_conflicts(events: Sequence[Event]) -> list[Conflict]:
+    """Find duplicate and overlapping events.
+
+    Two events are duplicates if they have the same normalized title and either start at the
+    same time or overlap at the same venue. Other events that overlap in time at the same
+    venue clash.
+
+    Args:
+    ----
+        events: Events to check
+
+    Returns:
+    -------
+        list[Conflict]: Conflicting pairs, with the earlier index first
+
+    """
+    conflicts: dict[tuple[int, int], ConflictKind] = {}
+    titles = [normalize(event.title) for event in events]
+
+    # The same party entered twice, possibly with a differently spelled venue
+    by_title_and_start: defaultdict[tuple[str, object], list[int]] = defaultdict(list)
+    for i, event in enumerate(events):
+        same = by_title_and_start[titles[i], event.start_datetime]
+        for j in same:
+            conflicts[j, i] = ConflictKind.DUPLICATE
+        same.append(i)
+
+    venues: defaultdict[tuple[str, str], list[int]] = defaultdict(list)
+    for i, event in enumerate(events):
+        venues[normalize(event.city), normalize(event.venue_name)].append(i)
+
+    for indices in venues.values():
+        if len(indices) < 2:
+            continue
+        indices.sort(key=lambda i: events[i].start_datetime)
+        # Events that started earlier and have not ended yet, by end time
+        running: list[tuple[object, int]] = []
+        for i in indices:
+            event = events[i]
+            while running and running[0][0] <= event.start_datetime:
+                heapq.heappop(running)
+            for _, j in running:
+                pair = (min(i, j), max(i, j))
+                if pair not in conflicts:
+                    same_title = titles[i] == titles[j]
+                    conflicts[pair] = ConflictKind.DUPLICATE if same_title else ConflictKind.CLASH
+            heapq.heappush(running, (event.end_datetime, i))
+
+    return [Conflict(kind, first, second) for (first, second), kind in sorted(conflicts.items())]
@@ -0,0 +1,336 @@
+"""Pre-fill event fields from the promoter pages behind ``title_link``.
+
+Pages are fetched concurrently through an HTTP cache that honors Cache-Control freshness and
+revalidates stale pages with ETag/Last-Modified, so that re-runs mostly cost a 304 or nothing.
+Metadata is read from schema.org JSON-LD events and OpenGraph tags by default; sites with
+their own markup get a parser registered with `site_parser`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import re
+import time
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+from diskcache import Cache
+
+from tracing import tracer
+
+# Extracted fields are a subset of the Event fields
+Draft = dict[str, Any]
+SiteParser = Callable[["PageMetadata", str], Draft]
+
+USER_AGENT = "Mozilla/5.0 (compatible; kuda-idem-enrichment/1.0)"
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+_site_parsers: dict[str, SiteParser] = {}
+
+
+@dataclass(slots=True)
+class PageMetadata:
+    """Metadata found in the head of an HTML page."""
+
+    meta: dict[str, str] = field(default_factory=dict)
+    json_ld: list[Any] = field(default_factory=list)
+    title: str | None = None
+
+
+class _MetadataParser(HTMLParser):
+    """Collect ``<meta>`` tags, JSON-LD scripts and the page title."""
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.metadata = PageMetadata()
+        self._in_json_ld = False
+        self._in_title = False
+        self._buffer: list[str] = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        attributes = dict(attrs)
+        if tag == "meta":
+            name = attributes.get("property") or attributes.get("name")
+            content = attributes.get("content")
+            if name and content is not None:
+                self.metadata.meta.setdefault(name.lower(), content)
+        elif tag == "script" and attributes.get("type") == "application/ld+json":
+            self._in_json_ld = True
+        elif tag == "title" and self.metadata.title is None:
+            self._in_title = True
+
+    def handle_data(self, data: str) -> None:
+        if self._in_json_ld or self._in_title:
+            self._buffer.append(data)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "script" and self._in_json_ld:
+            try:
+                self.metadata.json_ld.append(json.loads("".join(self._buffer)))
+            except json.JSONDecodeError:
+                pass
+            self._in_json_ld = False
+        elif tag == "title" and self._in_title:
+            self.metadata.title = "".join(self._buffer).strip()
+            self._in_title = False
+        self._buffer.clear()
+
+
+def parse_metadata(html: str) -> PageMetadata:
+    """Extract the metadata of an HTML page."""
+    parser = _MetadataParser()
+    parser.feed(html)
+    return parser.metadata
+
+
+def site_parser(host_suffix: str) -> Callable[[SiteParser], SiteParser]:
+    """Register a parser for pages whose host ends with ``host_suffix``.
+
+    A site parser receives the page metadata and the URL and returns the fields it found.
+    Its fields take precedence over the generic JSON-LD and OpenGraph ones.
+    """
+
+    def register(parser: SiteParser) -> SiteParser:
+        _site_parsers[host_suffix.lower()] = parser
+        return parser
+
+    return register
+
+
+def _json_ld_nodes(data: Any) -> Iterator[dict[str, Any]]:
+    """Walk JSON-LD documents, including lists and ``@graph`` containers."""
+    if isinstance(data, list):
+        for item in data:
+            yield from _json_ld_nodes(item)
+    elif isinstance(data, dict):
+        yield data
+        yield from _json_ld_nodes(data.get("@graph", []))
+
+
+def _is_event(node: dict[str, Any]) -> bool:
+    types = node.get("@type", [])
+    # Event or one of its subtypes, e.g. MusicEvent or DanceEvent
+    return any(str(t).endswith("Event") for t in (types if isinstance(types, list) else [types]))
+
+
+def _parse_datetime(value: Any) -> dt.datetime | None:
+    try:
+        return dt.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _first(value: Any) -> Any:
+    return value[0] if isinstance(value, list) and value else value
+
+
+def extract_json_ld_event(metadata: PageMetadata) -> Draft:
+    """Extract event fields from the first schema.org Event in the JSON-LD of a page."""
+    event = next(
+        (node for doc in metadata.json_ld for node in _json_ld_nodes(doc) if _is_event(node)),
+        None,
+    )
+    if event is None:
+        return {}
+
+    draft: Draft = {
+        "title": event.get("name"),
+        "description": event.get("description"),
+        "start_datetime": _parse_datetime(event.get("startDate")),
+        "end_datetime": _parse_datetime(event.get("endDate")),
+    }
+    location = _first(event.get("location"))
+    if isinstance(location, dict):
+        draft["venue_name"] = location.get("name")
+        address = location.get("address")
+        if isinstance(address, dict):
+            draft["venue_address"] = address.get("streetAddress")
+            draft["city"] = address.get("addressLocality")
+        elif isinstance(address, str):
+            draft["venue_address"] = address
+    offers = _first(event.get("offers"))
+    if isinstance(offers, dict):
+        draft["ticket_link"] = offers.get("url")
+    return draft
+
+
+def extract_open_graph(metadata: PageMetadata) -> Draft:
+    """Extract event fields from OpenGraph tags, including Facebook's event extension."""
+    meta = metadata.meta
+    return {
+        "title": meta.get("og:title") or metadata.title,
+        "description": meta.get("og:description") or meta.get("description"),
+        "start_datetime": _parse_datetime(meta.get("event:start_time")),
+        "end_datetime": _parse_datetime(meta.get("event:end_time")),
+    }
+
+
+def extract_event_fields(html: str, url: str) -> Draft:
+    """Extract event fields from a page, preferring site parsers, then JSON-LD, then OpenGraph.
+
+    Args:
+    ----
+        html: Page content
+        url: Page URL, which selects the site parser
+
+    Returns:
+    -------
+        Draft: Event fields found on the page, without empty values
+
+    """
+    metadata = parse_metadata(html)
+    host = (urlsplit(url).hostname or "").lower()
+    site = next(
+        (parser for suffix, parser in _site_parsers.items() if host.endswith(suffix)), None
+    )
+    draft: Draft = {}
+    for layer in (
+            extract_open_graph(metadata),
+            extract_json_ld_event(metadata),
+            site(metadata, url) if site is not None else {},
+    ):
+        draft.update((key, value) for key, value in layer.items() if value not in (None, ""))
+    return draft
+
+
+@dataclass(slots=True)
+class CachedPage:
+    """A fetched page with what is needed to revalidate it."""
+
+    text: str
+    etag: str | None
+    last_modified: str | None
+    fresh_until: float
+
+
+class CachingFetcher:
+    """Fetch pages over a pooled client, honoring Cache-Control and conditional requests.
+
+    Use as an async context manager, which owns the HTTP client. `stats` counts network
+    fetches, revalidated pages (304) and fresh cache hits.
+    """
+
+    def __init__(self, cache: Cache, concurrency: int = 8, timeout: float = 15.0) -> None:
+        self.cache = cache
+        self.client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=timeout,
+            headers={"User-Agent": USER_AGENT, "Accept": "text/html"},
+            limits=httpx.Limits(max_connections=concurrency),
+        )
+        self.stats = {"fetched": 0, "revalidated": 0, "fresh": 0}
+
+    async def __aenter__(self) -> CachingFetcher:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.client.aclose()
+
+    async def fetch(self, url: str) -> str:
+        """Return the content of a page, from the cache whenever the server allows it."""
+        cached: CachedPage | None = self.cache.get(("page", url))
+        if cached is not None and cached.fresh_until > time.time():
+            self.stats["fresh"] += 1
+            return cached.text
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        with tracer.span("enrichment.fetch"):
+            response = await self.client.get(url, headers=headers)
+
+        if response.status_code == httpx.codes.NOT_MODIFIED and cached is not None:
+            self.stats["revalidated"] += 1
+            cached.fresh_until = _fresh_until(response)
+            self.cache.set(("page", url), cached)
+            return cached.text
+
+        response.raise_for_status()
+        self.stats["fetched"] += 1
+        self.cache.set(
+            ("page", url),
+            CachedPage(
+                text=response.text,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                fresh_until=_fresh_until(response),
+            ),
+        )
+        return response.text
+
+
+def _fresh_until(response: httpx.Response) -> float:
+    cache_control = response.headers.get("Cache-Control", "")
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return 0.0
+    match = _MAX_AGE.search(cache_control)
+    return time.time() + int(match.group(1)) if match else 0.0
+
+
+async def enrich_links(
+        urls: Sequence[str],
+        cache: Cache,
+        concurrency: int = 8,
+) -> list[Draft | Exception]:
+    """Fetch pages concurrently and extract event fields from each.
+
+    Args:
+    ----
+        urls: Page URLs, usually the ``title_link`` of events
+        cache: Disk cache for the fetched pages
+        concurrency: Pages fetched at once at most
+
+    Returns:
+    -------
+        list[Draft | Exception]: Fields per URL in input order, or the error fetching it
+
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    async with CachingFetcher(cache, concurrency) as fetcher:
+
+        async def enrich(url: str) -> Draft:
+            async with semaphore:
+                html = await fetcher.fetch(url)
+            with tracer.span("enrichment.parse"):
+                return extract_event_fields(html, url)
+
+        return await asyncio.gather(*(enrich(url) for url in urls), return_exceptions=True)
+
+
+def missing_fields(draft: Draft, filled: Iterable[str]) -> Draft:
+    """Keep only the fields of a draft that are not filled in yet."""
+    filled = set(filled)
+    return {key: value for key, value in draft.items() if key not in filled}
+
+
+def main() -> None:
+    """Print the event fields found on the given pages."""
+    from kuda_idem_template import cache
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("urls", nargs="+", help="Pages to read")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    drafts = asyncio.run(enrich_links(args.urls, cache, args.concurrency))
+    for url, draft in zip(args.urls, drafts, strict=True):
+        print(url)
+        if isinstance(draft, Exception):
+            print(f"  failed: {draft}")
+            continue
+        for key, value in draft.items():
+            print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""A persistent full-text index of past events for as-you-type suggestions.
+
+Events are stored in SQLite with an FTS5 table using the trigram tokenizer, so a query of
+three or more characters finds the events whose title, venue or city contains it anywhere,
+not only at the start of a word. The query is matched as it is typed: a typo in it finds
+nothing. The index is filled incrementally: from the weeks of the archive whose content
+hash it has not seen yet, and from every event entered in the GUI. Events are deduplicated
+by their content hash. The database is in WAL mode, so it can be searched while another
+connection fills it::
+
+    python event_search.py "джаз"   # update the index and search it
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import sqlite3
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from event_conflicts import normalize
+from tracing import tracer
+
+if TYPE_CHECKING:
+    from archive_site import ArchiveStore
+    from kuda_idem_template import Event
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    start TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+    title, venue_name, city, tokenize = 'trigram'
+);
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+"""
+# Trigrams need this many characters, shorter queries match title prefixes instead
+MIN_TRIGRAM_QUERY = 3
+
+
+def shift_to_weekend(event: Event, now: dt.datetime | None = None) -> Event:
+    """Copy an event to the current weekend, keeping its weekdays and times."""
+    from kuda_idem_template import get_friday_and_sunday
+
+    friday, _ = get_friday_and_sunday(now or dt.datetime.now())
+    event_friday, _ = get_friday_and_sunday(event.start_datetime)
+    shift = dt.timedelta(days=(friday.date() - event_friday.date()).days)
+    # The copy is another event, so it gets a UID of its own
+    return type(event)(
+        **event.model_dump(exclude={"uid", "start_datetime", "end_datetime"}),
+        start_datetime=event.start_datetime + shift,
+        end_datetime=event.end_datetime + shift,
+    )
+
+
+class EventSearchIndex:
+    """Past events in SQLite, searchable by trigrams of their title, venue and city."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self._db.close()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT count(*) FROM events").fetchone()[0]
+
+    def add(self, events: Iterable[Event]) -> int:
+        """Index events that are not indexed yet and return how many were added."""
+        from kuda_idem_template import content_hash
+
+        added = 0
+        with tracer.span("search.add"), self._db:
+            for event in events:
+                data = event.model_dump_json()
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO events (hash, start, data) VALUES (?, ?, ?)",
+                    (content_hash(data), event.start_datetime.isoformat(), data),
+                )
+                if cursor.rowcount:
+                    self._db.execute(
+                        "INSERT INTO events_fts (rowid, title, venue_name, city) "
+                        "VALUES (?, ?, ?, ?)",
+                        (cursor.lastrowid, event.title, event.venue_name, event.city),
+                    )
+                    added += 1
+        return added
+
+    def sync_archive(self, store: ArchiveStore) -> int:
+        """Index the events of archived weeks that changed since the last sync."""
+        from kuda_idem_template import Event
+
+        seen = dict(self._db.execute("SELECT name, hash FROM sources"))
+        added = 0
+        for week, week_hash in store.weeks().items():
+            if seen.get(week) == week_hash:
+                continue
+            added += self.add(Event(**data) for data in store.events(week))
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sources (name, hash) VALUES (?, ?)", (week, week_hash)
+                )
+        return added
+
+    def search(self, query: str, limit: int = 10) -> list[Event]:
+        """Find past events for a query, one per title, the most recent version of each.
+
+        Args:
+        ----
+            query: Any part of the title, venue or city
+            limit: Events returned at most
+
+        Returns:
+        -------
+            list[Event]: Best matches first
+
+        """
+        from kuda_idem_template import Event
+
+        query = query.strip()
+        if not query:
+            return []
+        with tracer.span("search.query"):
+            if len(query) >= MIN_TRIGRAM_QUERY:
+                rows = self._db.execute(
+                    "SELECT events.data, events.start FROM events_fts "
+                    "JOIN events ON events.id = events_fts.rowid "
+                    "WHERE events_fts MATCH ? ORDER BY rank LIMIT ?",
+                    ('"' + query.replace('"', '""') + '"', limit * 20),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT events.data, events.start FROM events_fts "
+                    "JOIN events ON events.id = events_fts.rowid "
+                    "WHERE events_fts.title LIKE ? ESCAPE '\\' LIMIT ?",
+                    (_escape_like(query) + "%", limit * 20),
+                ).fetchall()
+
+        # Keep the best ranked titles, each with the data of its most recent occurrence
+        latest: dict[str, tuple[str, str]] = {}
+        for data, start in rows:
+            title = normalize(json.loads(data)["title"])
+            if title not in latest:
+                if len(latest) == limit:
+                    continue
+                latest[title] = (data, start)
+            elif start > latest[title][1]:
+                latest[title] = (data, start)
+        return [Event(**json.loads(data)) for data, _ in latest.values()]
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def main() -> None:
+    """Update the index from the archive and the saved events, then search it."""
+    from archive_site import ArchiveStore
+    from kuda_idem_template import Event, cache, settings
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("query", nargs="?", help="Text to search for")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    index = EventSearchIndex(settings.SEARCH_INDEX_PATH)
+    try:
+        added = index.sync_archive(ArchiveStore(cache))
+        added += index.add(Event(**data) for data in cache.get("events", []))
+        print(f"Indexed {added} new events, {len(index)} in total")
+        if args.query:
+            started = time.perf_counter()
+            events = index.search(args.query, args.limit)
+            elapsed = time.perf_counter() - started
+            for event in events:
+                print(f"{event.start_datetime:%d.%m.%Y}  {event.title} ({event.venue_name})")
+            print(f"{len(events)} events in {elapsed * 1000:.1f} ms")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
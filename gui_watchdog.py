@@ -0,0 +1,197 @@
+"""Measure Qt event loop stalls and find the handlers that block the UI thread.
+
+A QTimer on the UI thread beats every few milliseconds while a monitor thread watches the beats.
+When the UI thread misses beats for longer than a threshold, the monitor logs the stack of the
+UI thread, i.e. the handler that blocks it, and the stall duration goes into a histogram shown
+by `StallDebugDialog`.
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import deque
+from dataclasses import dataclass
+
+from PyQt6.QtCore import QObject, QTimer
+from PyQt6.QtWidgets import (
+    QDialog,
+    QGridLayout,
+    QLabel,
+    QPushButton,
+    QTextEdit,
+    QVBoxLayout,
+    QWidget,
+)
+
+logger = logging.getLogger(__name__)
+
+# Shorter delays are scheduling noise rather than stalls
+MIN_STALL_MS = 50
+# Upper bounds of the stall histogram buckets, in milliseconds
+STALL_BUCKETS_MS = (100, 250, 500, 1_000, 2_500, 5_000, float("inf"))
+
+
+@dataclass(slots=True)
+class Stall:
+    """A period during which the UI thread did not process events."""
+
+    started_at: float
+    duration_ms: float
+    handler: str
+    stack: str
+
+
+class EventLoopWatchdog(QObject):
+    """Detect event loop stalls longer than a threshold and record all stalls in a histogram.
+
+    Create it on the UI thread after the QApplication, it starts immediately.
+    """
+
+    def __init__(
+            self,
+            threshold_ms: float = 200,
+            interval_ms: int = 20,
+            history: int = 50,
+            parent: QObject | None = None,
+    ) -> None:
+        super().__init__(parent)
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.histogram = [0] * len(STALL_BUCKETS_MS)
+        self.stalls: deque[Stall] = deque(maxlen=history)
+        self.stalled_ms = 0.0
+        self.started_at = time.monotonic()
+
+        self._last_beat = self.started_at
+        self._pending: Stall | None = None
+        self._lock = threading.Lock()
+        self._ui_thread_id = threading.get_ident()
+        self._stop = threading.Event()
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._beat)
+        self._timer.start()
+        self._monitor = threading.Thread(target=self._watch, name="ui-watchdog", daemon=True)
+        self._monitor.start()
+
+    def stop(self) -> None:
+        """Stop watching the event loop."""
+        self._timer.stop()
+        self._stop.set()
+
+    @property
+    def stall_ratio(self) -> float:
+        """Share of the watched time the event loop spent stalled."""
+        return self.stalled_ms / 1000 / max(time.monotonic() - self.started_at, 1e-9)
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            # Anything beyond the timer interval is time the event loop was not responsive
+            stall_ms = (now - self._last_beat) * 1000 - self.interval_ms
+            self._last_beat = now
+            pending, self._pending = self._pending, None
+        if stall_ms < MIN_STALL_MS:
+            return
+
+        self.histogram[bisect_left(STALL_BUCKETS_MS, stall_ms)] += 1
+        self.stalled_ms += stall_ms
+        if pending is not None:
+            pending.duration_ms = stall_ms
+            logger.warning("UI thread was blocked for %.0f ms by %s", stall_ms, pending.handler)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval_ms / 1000):
+            with self._lock:
+                blocked_ms = (time.monotonic() - self._last_beat) * 1000
+                if blocked_ms < self.threshold_ms or self._pending is not None:
+                    continue
+                frame = sys._current_frames().get(self._ui_thread_id)
+                if frame is None:
+                    continue
+                summary = traceback.extract_stack(frame)
+                stall = self._pending = Stall(
+                    started_at=self._last_beat,
+                    duration_ms=blocked_ms,
+                    handler=_find_handler(summary),
+                    stack="".join(summary.format()),
+                )
+                self.stalls.append(stall)
+            logger.warning(
+                "UI thread blocked for over %.0f ms in %s, stack:\n%s",
+                self.threshold_ms,
+                stall.handler,
+                stall.stack,
+            )
+
+
+def _find_handler(summary: traceback.StackSummary) -> str:
+    """Name the handler Qt called into, i.e. the frame right after the innermost event loop."""
+    event_loops = [i for i, frame in enumerate(summary) if ".exec(" in (frame.line or "")]
+    frame = summary[min(event_loops[-1] + 1, len(summary) - 1) if event_loops else -1]
+    return f"{frame.name} ({frame.filename}:{frame.lineno})"
+
+
+class StallDebugDialog(QDialog):
+    """A debug panel with the stall histogram and the stacks of the latest long stalls."""
+
+    def __init__(self, watchdog: EventLoopWatchdog, parent: QWidget | None = None) -> None:
+        super().__init__(parent)
+        self.watchdog = watchdog
+        self.setWindowTitle("UI Responsiveness")
+        self.setMinimumWidth(700)
+
+        layout = QVBoxLayout(self)
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        histogram_widget = QWidget()
+        self.histogram_layout = QGridLayout(histogram_widget)
+        layout.addWidget(histogram_widget)
+
+        self.stalls_text = QTextEdit()
+        self.stalls_text.setReadOnly(True)
+        self.stalls_text.setStyleSheet("font-family: monospace;")
+        layout.addWidget(self.stalls_text)
+
+        refresh_button = QPushButton("Refresh")
+        refresh_button.clicked.connect(self.refresh)
+        layout.addWidget(refresh_button)
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Show the current state of the watchdog."""
+        watchdog = self.watchdog
+        self.summary_label.setText(
+            f"Stalled {watchdog.stalled_ms / 1000:.1f} s "
+            f"({watchdog.stall_ratio:.1%} of the session), "
+            f"reported above {watchdog.threshold_ms:.0f} ms: {len(watchdog.stalls)}"
+        )
+
+        while (item := self.histogram_layout.takeAt(0)) is not None:
+            if item.widget() is not None:
+                item.widget().deleteLater()
+        largest = max(watchdog.histogram) or 1
+        lower = MIN_STALL_MS
+        for row, (upper, count) in enumerate(
+                zip(STALL_BUCKETS_MS, watchdog.histogram, strict=True)
+        ):
+            name = f"{lower:.0f}+ ms" if upper == float("inf") else f"{lower:.0f}–{upper:.0f} ms"
+            self.histogram_layout.addWidget(QLabel(name), row, 0)
+            self.histogram_layout.addWidget(QLabel("█" * round(30 * count / largest)), row, 1)
+            self.histogram_layout.addWidget(QLabel(str(count)), row, 2)
+            lower = upper
+
+        self.stalls_text.setPlainText(
+            "\n".join(
+                f"{stall.duration_ms:.0f} ms in {stall.handler}\n{stall.stack}"
+                for stall in reversed(watchdog.stalls)
+            )
+            or "No stalls above the threshold yet."
+        )
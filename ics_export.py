@@ -0,0 +1,274 @@
+"""Export events as an iCalendar feed members can subscribe to.
+
+The feed keeps every event it was ever given, so it grows into an archive over the years;
+events dropped from an updated digest stay in it as cancelled, so calendars remove them.
+Each event's VEVENT is rendered once and stored in the disk cache with the content hash of
+the event; updating the feed renders only new and changed events and streams the stored
+VEVENTs of all others to the file unchanged::
+
+    python ics_export.py events.ics   # add the saved events of the GUI to a feed
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import hashlib
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from diskcache import Cache
+
+from event_conflicts import normalize
+from tracing import tracer
+
+if TYPE_CHECKING:
+    from kuda_idem_template import Event
+
+PRODID = "-//Kuda idem//Event digest//RU"
+CALENDAR_NAME = "Куда идём?"
+UID_DOMAIN = "kuda-idem"
+# Lines longer than this many octets must be folded
+MAX_LINE_OCTETS = 75
+
+_INDEX_KEY = "ics_index"
+
+
+def escape_text(text: str) -> str:
+    """Escape a TEXT property value."""
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold_line(line: str) -> str:
+    """Fold a content line into lines of at most 75 octets, without splitting characters."""
+    if len(line.encode()) <= MAX_LINE_OCTETS:
+        return line + "\r\n"
+    parts = []
+    current, size = "", 0
+    for char in line:
+        octets = len(char.encode())
+        # Continuation lines start with a space, which counts towards their length
+        if size + octets > MAX_LINE_OCTETS - (1 if parts else 0):
+            parts.append(current)
+            current, size = "", 0
+        current += char
+        size += octets
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def format_datetime(value: dt.datetime, timezone: dt.tzinfo | None = None) -> str:
+    """Format a datetime as UTC, or as floating local time if it is naive without a time zone.
+
+    Args:
+    ----
+        value: Datetime to format
+        timezone: Time zone of naive datetimes, which are floating if it is None
+
+    Returns:
+    -------
+        str: DATE-TIME property value
+
+    """
+    if value.tzinfo is None and timezone is not None:
+        value = value.replace(tzinfo=timezone)
+    if value.tzinfo is not None:
+        return value.astimezone(dt.UTC).strftime("%Y%m%dT%H%M%SZ")
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def event_uid(event: Event) -> str:
+    """Derive the UID of a new event from its normalized title, city, venue and start time.
+
+    The UID is stored with the event when it is created, see `Event.uid`, so editing any
+    field later updates the same calendar entry. Deriving it rather than picking a random
+    one gives events created again from the same data, and events saved before they had
+    a UID, the entry they already have.
+    """
+    key = "|".join((
+        normalize(event.title),
+        normalize(event.city),
+        normalize(event.venue_name),
+        event.start_datetime.isoformat(),
+    ))
+    return f"{hashlib.sha256(key.encode()).hexdigest()[:32]}@{UID_DOMAIN}"
+
+
+def event_hash(event: Event, timezone: dt.tzinfo | None = None) -> str:
+    """Hash an event and the time zone of its times to tell whether its VEVENT is outdated."""
+    return hashlib.sha256(f"{event.model_dump_json()}|{timezone}".encode()).hexdigest()
+
+
+def render_vevent(
+        event: Event,
+        uid: str,
+        stamp: dt.datetime,
+        sequence: int = 0,
+        timezone: dt.tzinfo | None = None,
+        cancelled: bool = False,
+) -> str:
+    """Render an event as a VEVENT component.
+
+    Args:
+    ----
+        event: Event to render
+        uid: Unique identifier of the event
+        stamp: When this version of the event was created, in UTC
+        sequence: Revision of the event, incremented on every change
+        timezone: Time zone of naive start and end times, see `format_datetime`
+        cancelled: Whether the event was cancelled, which removes it from calendars
+
+    Returns:
+    -------
+        str: Folded content lines of the component
+
+    """
+    description = "\n".join(
+        part for part in (event.description, event.title_link, event.ticket_info) if part
+    )
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{format_datetime(stamp)}",
+        f"SEQUENCE:{sequence}",
+        f"DTSTART:{format_datetime(event.start_datetime, timezone)}",
+        f"DTEND:{format_datetime(event.end_datetime, timezone)}",
+        f"SUMMARY:{escape_text(event.title)}",
+        # The map link is an alternative representation of the location
+        f'LOCATION;ALTREP="{event.venue_map_link}":'
+        + escape_text(f"{event.venue_name}, {event.venue_address}, {event.city}"),
+    ]
+    if description:
+        lines.append(f"DESCRIPTION:{escape_text(description)}")
+    if cancelled:
+        lines.append("STATUS:CANCELLED")
+    if url := event.ticket_link or event.title_link:
+        lines.append(f"URL:{url}")
+    lines.append("END:VEVENT")
+    return "".join(fold_line(line) for line in lines)
+
+
+class CalendarFeed:
+    """An iCalendar file updated incrementally from the VEVENTs stored in the disk cache.
+
+    The index of all events in the feed, with their hashes and start times, is stored under
+    a single key; every VEVENT is stored under its own key, so unchanged ones are never
+    rendered again. Naive event times are taken to be in ``timezone`` and written in UTC,
+    so subscribers in other time zones see the right times.
+    """
+
+    def __init__(self, path: Path, cache: Cache, timezone: dt.tzinfo | None = None) -> None:
+        self.path = path
+        self.cache = cache
+        self.timezone = timezone
+
+    def update(
+            self,
+            events: Iterable[Event],
+            now: dt.datetime | None = None,
+            cancelled: Iterable[Event] = (),
+    ) -> int:
+        """Add new events and changed versions of known ones, then rewrite the file.
+
+        Args:
+        ----
+            events: Events to add or update, events already in the feed may be left out
+            now: Time stamp of the changed VEVENTs, defaults to the current time
+            cancelled: Events in the feed to mark as cancelled, unless they are in ``events``
+
+        Returns:
+        -------
+            int: Number of rendered VEVENTs, 0 if the file was already up to date
+
+        """
+        now = now or dt.datetime.now(dt.UTC)
+        index: dict[str, dict[str, object]] = self.cache.get(_INDEX_KEY, {})
+        changed = 0
+        kept: set[str] = set()
+        with tracer.span("ics.render"), self.cache.transact():
+            for event in events:
+                kept.add(event.uid)
+                content_hash = event_hash(event, self.timezone)
+                entry = index.get(event.uid)
+                if entry is not None and entry["hash"] == content_hash:
+                    continue
+                self._render(index, event, now, entry, content_hash)
+                changed += 1
+            for event in cancelled:
+                entry = index.get(event.uid)
+                # Cancelled entries have no hash, so the event is rendered again if it returns
+                if event.uid in kept or entry is None or entry["hash"] is None:
+                    continue
+                self._render(index, event, now, entry, None)
+                changed += 1
+            if changed:
+                self.cache.set(_INDEX_KEY, index)
+        if changed or not self.path.exists():
+            self.write(index)
+        return changed
+
+    def _render(
+            self,
+            index: dict[str, dict[str, object]],
+            event: Event,
+            now: dt.datetime,
+            entry: dict[str, object] | None,
+            content_hash: str | None,
+    ) -> None:
+        """Store the VEVENT of an event with the next sequence, cancelled without a hash."""
+        sequence = int(entry["sequence"]) + 1 if entry is not None else 0
+        self.cache.set(
+            ("ics", event.uid),
+            render_vevent(
+                event, event.uid, now, sequence, self.timezone, cancelled=content_hash is None
+            ),
+        )
+        index[event.uid] = {
+            "hash": content_hash,
+            "start": event.start_datetime.isoformat(),
+            "sequence": sequence,
+        }
+
+    def write(self, index: dict[str, dict[str, object]] | None = None) -> None:
+        """Stream the stored VEVENTs to the file, in start time order, replacing it atomically."""
+        index = self.cache.get(_INDEX_KEY, {}) if index is None else index
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        with tracer.span("ics.write", events=len(index)), temporary.open(
+            "w", encoding="utf-8", newline=""
+        ) as f:
+            f.writelines(self._components(index))
+        temporary.replace(self.path)
+
+    def _components(self, index: dict[str, dict[str, object]]) -> Iterator[str]:
+        yield "BEGIN:VCALENDAR\r\n"
+        yield "VERSION:2.0\r\n"
+        yield fold_line(f"PRODID:{PRODID}")
+        yield "CALSCALE:GREGORIAN\r\n"
+        yield fold_line(f"X-WR-CALNAME:{escape_text(CALENDAR_NAME)}")
+        for uid in sorted(index, key=lambda uid: str(index[uid]["start"])):
+            yield self.cache[("ics", uid)]
+        yield "END:VCALENDAR\r\n"
+
+
+def main() -> None:
+    """Add the events saved in the GUI to a calendar feed."""
+    from kuda_idem_template import Event, cache, events_timezone
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", type=Path, nargs="?", default=Path("events.ics"))
+    args = parser.parse_args()
+
+    events = [Event(**data) for data in cache.get("events", [])]
+    changed = CalendarFeed(args.path, cache, events_timezone()).update(events)
+    print(f"Rendered {changed} of {len(events)} events into {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Answer inline queries such as "@bot амстердам суббота" from the published events.
+
+`EventIndex` is built once per published digest and maps the words of cities, venues and
+titles, and the days of the events, to the events. A query is split into words, each word
+is resolved through the index, and the events matching every word are answered with their
+cached digest fragments, so answering takes no rendering and no I/O besides the answer::
+
+    python inline_queries.py   # answer inline queries and collect poll answers
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import datetime as dt
+import itertools
+import time
+from collections import defaultdict
+from collections.abc import Callable, Sequence
+from typing import TYPE_CHECKING
+
+from telegram import (
+    Bot,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    Update,
+)
+from telegram.constants import InlineQueryLimit, ParseMode, UpdateType
+
+from event_conflicts import normalize
+from poll_results import PollAnswerCollector, PollStore
+from tracing import tracer
+
+if TYPE_CHECKING:
+    from kuda_idem_template import Event
+
+# Words that only ask about the current day, or the next one
+TODAY_WORDS = frozenset({"сегодня", "сейчас", "today", "tonight", "now"})
+TOMORROW_WORDS = frozenset({"завтра", "tomorrow"})
+# Stems match the inflected forms too, e.g. "субботу" and "воскресенье"
+WEEKDAY_STEMS = (
+    ("понедельн", 0), ("monday", 0),
+    ("вторник", 1), ("tuesday", 1),
+    ("сред", 2), ("wednesday", 2),
+    ("четверг", 3), ("thursday", 3),
+    ("пятниц", 4), ("friday", 4),
+    ("суббот", 5), ("saturday", 5),
+    ("воскрес", 6), ("sunday", 6),
+)
+STOP_WORDS = frozenset({
+    "в", "во", "на", "где", "что", "куда", "in", "on", "at", "what", "where",
+})
+# Results are cached by Telegram for everyone, the digest rarely changes within a minute
+CACHE_TIME = 60
+
+
+def _words(text: str) -> list[str]:
+    return [word for word in normalize(text).split() if word not in STOP_WORDS]
+
+
+class EventIndex:
+    """Events by the words of their city, venue and title, and by the days they take place."""
+
+    def __init__(self, events: Sequence[Event]) -> None:
+        self.events = sorted(events, key=lambda event: event.start_datetime)
+        words: defaultdict[str, set[int]] = defaultdict(set)
+        days: defaultdict[dt.date, set[int]] = defaultdict(set)
+        for i, event in enumerate(self.events):
+            for word in _words(f"{event.city} {event.venue_name} {event.title}"):
+                words[word].add(i)
+            days[event.start_datetime.date()].add(i)
+        self._words = dict(words)
+        self._sorted_words = sorted(words)
+        self._days = dict(days)
+
+    def _match_word(self, word: str, now: dt.datetime) -> set[int]:
+        if word in TODAY_WORDS:
+            running = {
+                i for i, event in enumerate(self.events)
+                if event.start_datetime <= now < event.end_datetime
+            }
+            return self._days.get(now.date(), set()) | running
+        if word in TOMORROW_WORDS:
+            return self._days.get(now.date() + dt.timedelta(days=1), set())
+        for stem, weekday in WEEKDAY_STEMS:
+            if word.startswith(stem):
+                return {
+                    i for day, indices in self._days.items() if day.weekday() == weekday
+                    for i in indices
+                }
+        # Every indexed word the query word is a prefix of, found by binary search
+        matches: set[int] = set()
+        position = bisect.bisect_left(self._sorted_words, word)
+        for indexed in itertools.islice(self._sorted_words, position, None):
+            if not indexed.startswith(word):
+                break
+            matches |= self._words[indexed]
+        return matches
+
+    def find(self, query: str, now: dt.datetime | None = None) -> list[int]:
+        """Positions in `events` of the events matching every word of a query.
+
+        An empty query matches all events. Positions are in start time order.
+        """
+        now = now or dt.datetime.now()
+        matches: set[int] | None = None
+        for word in _words(query):
+            found = self._match_word(word, now)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+        return list(range(len(self.events))) if matches is None else sorted(matches)
+
+    def search(self, query: str, now: dt.datetime | None = None) -> list[Event]:
+        """Events matching every word of a query, in start time order."""
+        return [self.events[i] for i in self.find(query, now)]
+
+
+def event_result(event: Event) -> InlineQueryResultArticle:
+    """An inline result that sends the event's fragment of the digest."""
+    from kuda_idem_template import (
+        EVENT_SEPARATOR,
+        content_hash,
+        fragment_cache,
+        template_environment,
+    )
+
+    fragment, _ = fragment_cache.render(template_environment.get_template("event.j2"), event)
+    return InlineQueryResultArticle(
+        # A SHA-256 hex digest is exactly as long as a result ID may be
+        id=content_hash(event.model_dump_json()),
+        title=event.title,
+        description=(
+            f"{event.city}, {event.venue_name}, {event.start_datetime.strftime('%d.%m %H:%M')}"
+        ),
+        input_message_content=InputTextMessageContent(
+            fragment.removeprefix(EVENT_SEPARATOR).strip(), parse_mode=ParseMode.HTML
+        ),
+        url=event.title_link,
+    )
+
+
+class InlineQueryResponder:
+    """Answer inline queries from an `EventIndex` of the last published digest.
+
+    The index and the result of every event are rebuilt from ``load_events`` at most every
+    ``refresh_interval`` seconds, so a newly published digest is picked up without a restart
+    and answering a query only looks up prebuilt results.
+    """
+
+    def __init__(
+            self,
+            bot: Bot,
+            load_events: Callable[[], Sequence[Event]],
+            refresh_interval: float = 60.0,
+    ) -> None:
+        self.bot = bot
+        self.load_events = load_events
+        self.refresh_interval = refresh_interval
+        self._index: EventIndex | None = None
+        self._results: list[InlineQueryResultArticle] = []
+        self._loaded_at = 0.0
+
+    @property
+    def index(self) -> EventIndex:
+        """The current index, rebuilt if it is older than the refresh interval."""
+        if self._index is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+            with tracer.span("inline.index"):
+                index = EventIndex(self.load_events())
+                self._results = [event_result(event) for event in index.events]
+                self._index = index
+            self._loaded_at = time.monotonic()
+        return self._index
+
+    def results(
+            self, query: str, now: dt.datetime | None = None
+    ) -> list[InlineQueryResultArticle]:
+        """Inline results for a query, at most as many as Telegram accepts.
+
+        Identical events have the same result ID, which Telegram rejects, so only the first
+        of them is answered.
+        """
+        results: dict[str, InlineQueryResultArticle] = {}
+        for i in self.index.find(query, now):
+            results.setdefault(self._results[i].id, self._results[i])
+            if len(results) == InlineQueryLimit.RESULTS:
+                break
+        return list(results.values())
+
+    async def answer(self, inline_query: InlineQuery) -> None:
+        """Answer an inline query."""
+        with tracer.span("inline.answer"):
+            await self.bot.answer_inline_query(
+                inline_query.id, self.results(inline_query.query), cache_time=CACHE_TIME
+            )
+
+
+class UpdateRouter(PollAnswerCollector):
+    """Collect poll answers and answer inline queries from the same stream of updates."""
+
+    allowed_updates = (UpdateType.POLL_ANSWER, UpdateType.INLINE_QUERY)
+
+    def __init__(
+            self,
+            bot: Bot,
+            store: PollStore,
+            responder: InlineQueryResponder,
+            poll_timeout: int = 30,
+    ) -> None:
+        super().__init__(bot, store, poll_timeout)
+        self.responder = responder
+
+    async def handle_update(self, update: Update) -> None:
+        """Answer inline queries and apply poll answers."""
+        if update.inline_query is not None:
+            await self.responder.answer(update.inline_query)
+        else:
+            await super().handle_update(update)
+
+
+def main() -> None:
+    """Answer inline queries and collect poll answers until interrupted."""
+    from kuda_idem_template import cache, load_published_events, make_bot
+
+    bot = make_bot()
+    router = UpdateRouter(bot, PollStore(cache), InlineQueryResponder(bot, load_published_events))
+    try:
+        asyncio.run(router.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Run the headless entry point: write, send, update or publish the digest.
+
+A script of its own, so that `kuda_idem_template` is only ever imported as a module and every
+module shares its settings, cache and profiled functions::
+
+    python kuda_idem.py --action load_to_file
+    python kuda_idem.py --action publish --profile render
+"""
+
+from kuda_idem_template import cli
+
+if __name__ == "__main__":
+    cli()
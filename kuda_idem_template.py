@@ -2,27 +2,66 @@
 
 from __future__ import annotations
 
+import argparse
 import asyncio
 import datetime as dt
+import hashlib
+import json
+import logging
+import sys
+import threading
+from collections import OrderedDict
 from collections.abc import Collection
 from enum import Enum, auto
-from typing import Annotated
-
-from jinja2 import Template
-from pydantic import BaseModel, BeforeValidator, HttpUrl, SecretStr, TypeAdapter
-from pydantic_settings import BaseSettings, SettingsConfigDict
-from telegram import Bot
-from telegram.constants import ParseMode
+from pathlib import Path
+from typing import Annotated, Any
+from zoneinfo import ZoneInfo
+
+from diskcache import Cache
+from jinja2 import Environment, FileSystemLoader, Template
+from pydantic import BaseModel, BeforeValidator, HttpUrl, SecretStr, TypeAdapter, model_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
+from telegram import Bot, Message
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import BadRequest
+
+from archive_site import ArchiveStore
+from event_archive import EventArchive
+from ics_export import CalendarFeed, event_uid
+from poll_results import PollStore
+from posters import PosterUploader, event_posters
+from profiling import SESSION, Profiler, add_profile_arguments, wrap_operation
+from tracing import traced, tracer
+
+logger = logging.getLogger(__name__)
+
+# Line that starts every event in event.j2, used to split long digests between events
+EVENT_SEPARATOR = "\n─────────────"
 
 http_url_adapter = TypeAdapter(HttpUrl)
 Url = Annotated[str, BeforeValidator(lambda value: str(http_url_adapter.validate_python(value)))]
 
 
+def split_addresses(value: Any) -> Any:
+    """Split a comma-separated list of addresses, as written in a .env file, or parse JSON."""
+    if isinstance(value, str):
+        if value.lstrip().startswith("["):
+            return json.loads(value)
+        return [address.strip() for address in value.split(",") if address.strip()]
+    return value
+
+
+# Read from the environment as "a@example.com, b@example.com" rather than as JSON
+AddressList = Annotated[list[str], NoDecode, BeforeValidator(split_addresses)]
+
+
 class Action(Enum):
-    """Pick whether write HTML to a file or send in to a Telegram group chat topic."""
+    """Pick whether write HTML to a file, send in to a Telegram group chat topic or update it."""
 
     LOAD_TO_FILE = auto()
     SEND_MESSAGE = auto()
+    UPDATE_MESSAGE = auto()
+    PUBLISH = auto()
 
 
 class Settings(BaseSettings):
@@ -30,12 +69,52 @@ class Settings(BaseSettings):
     - BOT_TOKEN - an API token for your bot.
     - TOPIC_ID - an ID for your group chat topic.
     - GROUP_CHAT_ID - an ID for your group chat.
+
+    Optionally, BOT_API_BASE_URL points the bot to another Bot API server, e.g. a local
+    stand-in from telegram_stub_server.py, WEBHOOK_SECRET_TOKEN protects the webhook receiver
+    in webhook_server.py, and TRACE_JSONL_PATH and TRACE_PROMETHEUS_PATH
+    enable timing spans exported to these files every TRACE_FLUSH_INTERVAL seconds.
+
+    The publish action also posts to a Discord webhook if DISCORD_WEBHOOK_URL is set, mails
+    the digest if SMTP_HOST, EMAIL_FROM and EMAIL_TO (comma-separated) are set and writes it to
+    PUBLISH_FILE_PATH if it is set. ICS_FEED_PATH is the calendar feed every sent or
+    published digest is added to, with times in EVENTS_TIMEZONE unless they have their own.
+    SEARCH_INDEX_PATH is the index of past events the GUI suggests from.
+    EVENT_ARCHIVE_DIR holds the binary archive of every event sent with a poll, for analytics.
     """
 
     # Telegram bot configuration
     BOT_TOKEN: SecretStr
     TOPIC_ID: int
     GROUP_CHAT_ID: int
+    BOT_API_BASE_URL: str = "https://api.telegram.org/bot"
+    WEBHOOK_SECRET_TOKEN: SecretStr | None = None
+
+    # Other channels of the publish action
+    DISCORD_WEBHOOK_URL: str | None = None
+    SMTP_HOST: str | None = None
+    SMTP_PORT: int = 587
+    SMTP_USERNAME: str | None = None
+    SMTP_PASSWORD: SecretStr | None = None
+    SMTP_STARTTLS: bool = True
+    EMAIL_FROM: str | None = None
+    EMAIL_TO: AddressList = []
+    PUBLISH_FILE_PATH: Path | None = None
+
+    # Calendar feed of all events ever published, and the time zone of events without one
+    ICS_FEED_PATH: Path = Path("events.ics")
+    EVENTS_TIMEZONE: str | None = "Europe/Amsterdam"
+
+    # Full-text index of past events for title suggestions in the GUI
+    SEARCH_INDEX_PATH: Path = Path("event_search.sqlite3")
+
+    # Binary archive of all events sent with a poll and their votes
+    EVENT_ARCHIVE_DIR: Path = Path("event_archive")
+
+    # Timing instrumentation
+    TRACE_JSONL_PATH: Path | None = None
+    TRACE_PROMETHEUS_PATH: Path | None = None
+    TRACE_FLUSH_INTERVAL: float = 10.0
 
     model_config = SettingsConfigDict(
         env_file=(".env", ".env.prod"),
@@ -44,6 +123,13 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
+tracer.configure(
+    jsonl_path=settings.TRACE_JSONL_PATH,
+    prometheus_path=settings.TRACE_PROMETHEUS_PATH,
+    flush_interval=settings.TRACE_FLUSH_INTERVAL,
+)
+# Saved events, sent polls and their answers
+cache = Cache("event_cache")
 
 
 class Event(BaseModel):
@@ -62,6 +148,9 @@ class Event(BaseModel):
         venue_map_link: URL to the venue's location on a map
         ticket_link: Optional URL where tickets can be purchased
         ticket_info: Optional information about tickets, defaults to "Билет не нужен."
+        poster: Optional image file sent along with the digest
+        uid: Identifier of the event in the calendar feed, derived from the event when it is
+            created and kept as it is edited
 
     """
 
@@ -76,6 +165,15 @@ class Event(BaseModel):
     venue_map_link: Url
     ticket_link: Url | None = None
     ticket_info: str | None = None
+    poster: Path | None = None
+    uid: str = ""
+
+    @model_validator(mode="after")
+    def assign_uid(self) -> Event:
+        """Give a new event its UID, events loaded with one keep it."""
+        if not self.uid:
+            self.uid = event_uid(self)
+        return self
 
 
 def get_russian_weekday(date: dt.datetime) -> str:
@@ -183,31 +281,149 @@ def determine_date_range(events: Collection[Event]) -> tuple[dt.datetime, dt.dat
     return start_date, end_date
 
 
+class FragmentCache:
+    """Rendered event fragments keyed by the content hash of their event.
+
+    Fragments are only valid for the event template they were rendered with, so the cache is
+    emptied when the template is reloaded after a change. The least recently used fragments
+    are dropped beyond ``maxsize``. Pages may be rendered in several threads at once, which
+    only hold the lock while they look up or store a fragment.
+    """
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize = maxsize
+        self._fragments: OrderedDict[str, str] = OrderedDict()
+        self._template: Template | None = None
+        self._lock = threading.Lock()
+
+    def render(self, template: Template, event: Event) -> tuple[str, bool]:
+        """Return the fragment of an event and whether it had to be rendered."""
+        key = content_hash(event.model_dump_json())
+        with self._lock:
+            if template is not self._template:
+                self._fragments.clear()
+                self._template = template
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                return fragment, False
+        fragment = template.render(event=event, get_russian_weekday=get_russian_weekday)
+        with self._lock:
+            if template is self._template:
+                self._fragments[key] = fragment
+                if len(self._fragments) > self.maxsize:
+                    self._fragments.popitem(last=False)
+        return fragment, True
+
+
+# Templates are looked up in the working directory and reloaded when they change on disk
+template_environment = Environment(loader=FileSystemLoader("."), auto_reload=True)
+fragment_cache = FragmentCache()
+
+
+@traced("render")
 def generate_event_page(
         events: Collection[Event],
+        environment: Environment | None = None,
+        fragments: FragmentCache | None = None,
 ) -> str:
-    """Generate HTML page from events using a Jinja2 template.
+    """Generate HTML page from events using the Jinja2 templates.
+
+    The page is header.j2 followed by event.j2 for every event, as laid out in template.j2.
+    Event fragments are taken from `fragment_cache` when the event did not change, so only
+    new and edited events are rendered.
 
     Args:
     ----
         events: Collection of Event objects to include in the page
+        environment: Environment to load the templates from, defaults to
+            `template_environment`
+        fragments: Cache of event fragments, defaults to `fragment_cache`
 
     Returns:
     -------
         str: Generated HTML content
 
     """
+    environment = environment or template_environment
+    fragments = fragments or fragment_cache
     start_date, end_date = determine_date_range(events)
 
-    with open("template.j2", encoding="utf-8") as f:
-        template = Template(f.read())
-    return template.render(
-        events=events,
-        date_range=format_date_range(start_date, end_date),
-        get_russian_weekday=get_russian_weekday,
-    )
+    with tracer.span("template.load"):
+        header_template = environment.get_template("header.j2")
+        event_template = environment.get_template("event.j2")
+    with tracer.span("template.render", events=len(events)) as span:
+        parts = [header_template.render(date_range=format_date_range(start_date, end_date))]
+        rendered = 0
+        for event in events:
+            fragment, fresh = fragments.render(event_template, event)
+            parts.append(fragment)
+            rendered += fresh
+        span.set(rendered=rendered)
+        return "".join(parts)
+
+
+def split_html_message(
+        html_message: str,
+        limit: int = MessageLimit.MAX_TEXT_LENGTH,
+) -> list[str]:
+    """Split an HTML message into chunks that fit into a single Telegram message.
+
+    Chunks are cut between events whenever possible, then between lines, so that
+    HTML tags opened on a line are also closed within the same chunk.
+
+    Args:
+    ----
+        html_message: Rendered HTML message
+        limit: Maximum length of a single chunk
 
+    Returns:
+    -------
+        list[str]: Message chunks, in order
 
+    """
+    head, *tails = html_message.split(EVENT_SEPARATOR)
+    blocks = [head, *(EVENT_SEPARATOR + tail for tail in tails)]
+
+    chunks: list[str] = []
+    current = ""
+    for block in blocks:
+        # Oversized events are broken up by lines, and oversized lines are cut as a last resort
+        pieces = (
+            [block]
+            if len(block) <= limit
+            else [
+                line[i:i + limit]
+                for line in block.splitlines(keepends=True)
+                for i in range(0, len(line), limit)
+            ]
+        )
+        for piece in pieces:
+            if current and len(current) + len(piece) > limit:
+                chunks.append(current)
+                current = ""
+            current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def render_html_message(events: Collection[Event]) -> str:
+    """Render the digest as Telegram HTML, i.e. without the page-only markup."""
+    return generate_event_page(events).replace('<meta charset="UTF-8">', "")
+
+
+def content_hash(text: str) -> str:
+    """Hash message content to tell whether it changed since it was published."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def make_bot() -> Bot:
+    """Create a bot for the configured token and Bot API server."""
+    return Bot(token=settings.BOT_TOKEN.get_secret_value(), base_url=settings.BOT_API_BASE_URL)
+
+
+@traced("send")
 async def send_html_message(events: Collection[Event]) -> None:
     """Send HTML message with events and create a poll in Telegram.
 
@@ -216,18 +432,45 @@ async def send_html_message(events: Collection[Event]) -> None:
         events: Collection of Event objects to include in the message
 
     """
-    html_message = generate_event_page(events).replace('<meta charset="UTF-8">', "")
+    html_message = render_html_message(events)
 
     # Create bot instance
-    bot = Bot(token=settings.BOT_TOKEN.get_secret_value())
-    # Send message with HTML parsing
-    await bot.send_message(
-        chat_id=settings.GROUP_CHAT_ID,
-        text=html_message,
-        message_thread_id=settings.TOPIC_ID,
-        parse_mode=ParseMode.HTML,
-    )
-
+    bot = make_bot()
+    # Send the posters first, so that the digest follows them as a caption would
+    await send_event_posters(bot, events)
+    # Send message with HTML parsing, split into several messages if it is too long
+    published = []
+    for chunk in split_html_message(html_message):
+        message = await send_digest_chunk(bot, chunk)
+        published.append({"message_id": message.message_id, "hash": content_hash(chunk)})
+    # Remember the messages and their events, so that the digest can be edited in place later
+    remember_published_digest(published, events)
+    await send_event_poll(bot, events)
+
+
+async def send_event_posters(bot: Bot, events: Collection[Event]) -> None:
+    """Send the posters of the events to the topic as a media group, if there are any."""
+    posters = event_posters(list(events))
+    if posters:
+        async with PosterUploader(bot, cache) as uploader:
+            await uploader.send_posters(
+                settings.GROUP_CHAT_ID, posters, message_thread_id=settings.TOPIC_ID
+            )
+
+
+async def send_digest_chunk(bot: Bot, chunk: str) -> Message:
+    """Send a chunk of the digest to the topic."""
+    with tracer.span("telegram.sendMessage", length=len(chunk)):
+        return await bot.send_message(
+            chat_id=settings.GROUP_CHAT_ID,
+            text=chunk,
+            message_thread_id=settings.TOPIC_ID,
+            parse_mode=ParseMode.HTML,
+        )
+
+
+async def send_event_poll(bot: Bot, events: Collection[Event]) -> None:
+    """Send the poll about the events to the topic and remember it to collect the answers."""
     # Create poll options from event titles
     options = [event.title for event in events] + [
         "Иду в другое место",
@@ -235,70 +478,250 @@ async def send_html_message(events: Collection[Event]) -> None:
         "Никуда не иду",
     ]
 
-    # Send poll
-    await bot.send_poll(
-        chat_id=settings.GROUP_CHAT_ID,
-        message_thread_id=settings.TOPIC_ID,
-        question="Куда идём на эти выходные?",
-        options=options,
-        is_anonymous=False,
-        allows_multiple_answers=True,
+    with tracer.span("telegram.sendPoll", options=len(options)):
+        poll_message = await bot.send_poll(
+            chat_id=settings.GROUP_CHAT_ID,
+            message_thread_id=settings.TOPIC_ID,
+            question="Куда идём на эти выходные?",
+            options=options,
+            is_anonymous=False,
+            allows_multiple_answers=True,
+        )
+    PollStore(cache).register_poll(poll_message, events)
+    # The poll is sent already, so failing to archive it must not make callers send it again
+    try:
+        EventArchive(settings.EVENT_ARCHIVE_DIR).append(events, poll_message.poll.id)
+    except OSError:
+        logger.exception("Archiving the events of poll %s failed", poll_message.poll.id)
+
+
+def digest_key(name: str = "") -> tuple[Any, ...]:
+    """The cache key of a digest published to the topic, by its name if one of several."""
+    key = ("digest", settings.GROUP_CHAT_ID, settings.TOPIC_ID)
+    return (*key, name) if name else key
+
+
+def remember_published_digest(
+        messages: list[dict[str, Any]],
+        events: Collection[Event],
+        dropped: Collection[Event] = (),
+        name: str = "",
+) -> None:
+    """Store the message IDs and content hashes of the digest published to the topic.
+
+    The digest is also archived as the one of its week, and its events are added to the
+    calendar feed, where events dropped from an updated digest are cancelled. Digests
+    published in one run, e.g. one per city, are told apart by their names.
+    """
+    cache.set(
+        digest_key(name),
+        {"messages": messages, "events": [event.model_dump(mode="json") for event in events]},
+    )
+    ArchiveStore(cache).record(events, name)
+    CalendarFeed(settings.ICS_FEED_PATH, cache, events_timezone()).update(
+        events, cancelled=dropped
     )
 
 
+def events_timezone() -> dt.tzinfo | None:
+    """The time zone of event times without one, None to leave them floating."""
+    return ZoneInfo(settings.EVENTS_TIMEZONE) if settings.EVENTS_TIMEZONE else None
+
+
+def load_published_events(name: str = "") -> list[Event]:
+    """Load the events of the digest last published to the topic, to edit and update it."""
+    digest = cache.get(digest_key(name))
+    return [Event(**data) for data in digest["events"]] if digest else []
+
+
+@traced("update")
+async def update_html_message(
+        events: Collection[Event], bot: Bot | None = None, name: str = ""
+) -> int:
+    """Edit the last published digest in place to match the events.
+
+    Only messages whose content hash changed are edited. If the digest now needs more
+    messages, the extra ones are sent after the poll, and messages it no longer needs are
+    deleted. The poll is left as it is, since Telegram does not allow editing poll options.
+
+    Args:
+    ----
+        events: Collection of Event objects to include in the message
+        bot: Bot to send with, defaults to one for the configured token
+        name: Name of the digest, if it was published as one of several
+
+    Returns:
+    -------
+        int: Number of Telegram API requests made, 0 if the digest is up to date
+
+    Raises:
+    ------
+        LookupError: If no digest was published to the configured topic yet
+
+    """
+    key = digest_key(name)
+    digest = cache.get(key)
+    if digest is None:
+        raise LookupError("No published digest to update, send one first")
+    # Progress is saved after every request, so a retry does not repeat what succeeded
+    messages: list[dict[str, Any]] = list(digest["messages"])
+
+    def save_progress() -> None:
+        cache.set(key, {**digest, "messages": messages})
+
+    chunks = split_html_message(render_html_message(events))
+    bot = bot or make_bot()
+    requests = 0
+    for i, chunk in enumerate(chunks):
+        chunk_hash = content_hash(chunk)
+        if i < len(messages):
+            if messages[i]["hash"] == chunk_hash:
+                continue
+            message_id = messages[i]["message_id"]
+            with tracer.span("telegram.editMessageText", length=len(chunk)):
+                try:
+                    await bot.edit_message_text(
+                        text=chunk,
+                        chat_id=settings.GROUP_CHAT_ID,
+                        message_id=message_id,
+                        parse_mode=ParseMode.HTML,
+                    )
+                except BadRequest as e:
+                    # Edited by an earlier attempt whose progress was not saved
+                    if "message is not modified" not in e.message.lower():
+                        raise
+            requests += 1
+            messages[i] = {"message_id": message_id, "hash": chunk_hash}
+        else:
+            message_id = (await send_digest_chunk(bot, chunk)).message_id
+            requests += 1
+            messages.append({"message_id": message_id, "hash": chunk_hash})
+        save_progress()
+
+    while len(messages) > len(chunks):
+        with tracer.span("telegram.deleteMessage"):
+            await bot.delete_message(
+                chat_id=settings.GROUP_CHAT_ID, message_id=messages[-1]["message_id"]
+            )
+        requests += 1
+        messages.pop()
+        save_progress()
+
+    uids = {event.uid for event in events}
+    dropped = [
+        event for event in (Event(**data) for data in digest["events"]) if event.uid not in uids
+    ]
+    remember_published_digest(messages, events, dropped, name)
+    return requests
+
+
 def main(action: Action) -> None:
     """Execute the main program logic.
 
     Args:
     ----
-        action: Whether to write HTML to a file or send to Telegram
+        action: Whether to write HTML to a file, send to Telegram, update the sent message or
+            publish to all configured channels
 
     """
-    events = (
-        Event(
-            city="Амстердам",
-            title="RAUM invites BASSIANI 🇬🇪",
-            title_link="https://www.instagram.com/club.raum/p/DArEX2oIko8/?locale=nl",
-            description="Лучший клуб СНГ прилетает в лучший клуб Амстердама. Такое я бы не пропускал!",
-            start_datetime=dt.datetime(2024, 11, 22, 23, 0),
-            end_datetime=dt.datetime(2024, 11, 23, 7, 0),
-            venue_name="Клуб RAUM",
-            venue_address="Humberweg 3",
-            venue_map_link="https://maps.app.goo.gl/RfpFD8iWguaMHSEe8",
-            ticket_link="https://shop.paylogic.com/ea94b94aa341470e96e4be2916ee397f/",
-            ticket_info="Билетов мало."
-        ),
-        Event(
-            city="Амстердам",
-            title="VAULT SESSIONS X VULGED // RØDHÅD ANL",
-            title_link="https://www.instagram.com/p/DAl1dxaglZ5/?hl=en",
-            start_datetime=dt.datetime(2024, 11, 22, 23, 0),
-            end_datetime=dt.datetime(2024, 11, 23, 8, 0),
-            venue_name="Клуб RADION",
-            venue_address="Louwesweg 1",
-            venue_map_link="https://maps.app.goo.gl/BCp1L74yxzfP2zMm7",
-            ticket_link="https://shop.eventix.io/d56aad36-a0b7-4ded-80c7-5774f32d6857/tickets?shop_code=awjk4xvv/",
-        ),
-        Event(
-            city="Роттердам",
-            title="CODA Collective, Free Pop-up rave",
-            title_link="https://www.instagram.com/p/DCXJbe4oqV0/",
-            description="Бесплатная вечеринка в очень милом месте и с приятной атмосферой!",
-            start_datetime=dt.datetime(2024, 11, 21, 22, 0),
-            end_datetime=dt.datetime(2024, 11, 22, 2, 0),
-            venue_name="Арт-центр WORM",
-            venue_address="Boomgaardsstraat 71",
-            venue_map_link="https://maps.app.goo.gl/3S5DKJii2WiJoN2p6",
-        ),
-    )
+    with tracer.span("events.validate"):
+        events = (
+            Event(
+                city="Амстердам",
+                title="RAUM invites BASSIANI 🇬🇪",
+                title_link="https://www.instagram.com/club.raum/p/DArEX2oIko8/?locale=nl",
+                description="Лучший клуб СНГ прилетает в лучший клуб Амстердама. Такое я бы не пропускал!",
+                start_datetime=dt.datetime(2024, 11, 22, 23, 0),
+                end_datetime=dt.datetime(2024, 11, 23, 7, 0),
+                venue_name="Клуб RAUM",
+                venue_address="Humberweg 3",
+                venue_map_link="https://maps.app.goo.gl/RfpFD8iWguaMHSEe8",
+                ticket_link="https://shop.paylogic.com/ea94b94aa341470e96e4be2916ee397f/",
+                ticket_info="Билетов мало."
+            ),
+            Event(
+                city="Амстердам",
+                title="VAULT SESSIONS X VULGED // RØDHÅD ANL",
+                title_link="https://www.instagram.com/p/DAl1dxaglZ5/?hl=en",
+                start_datetime=dt.datetime(2024, 11, 22, 23, 0),
+                end_datetime=dt.datetime(2024, 11, 23, 8, 0),
+                venue_name="Клуб RADION",
+                venue_address="Louwesweg 1",
+                venue_map_link="https://maps.app.goo.gl/BCp1L74yxzfP2zMm7",
+                ticket_link="https://shop.eventix.io/d56aad36-a0b7-4ded-80c7-5774f32d6857/tickets?shop_code=awjk4xvv/",
+            ),
+            Event(
+                city="Роттердам",
+                title="CODA Collective, Free Pop-up rave",
+                title_link="https://www.instagram.com/p/DCXJbe4oqV0/",
+                description="Бесплатная вечеринка в очень милом месте и с приятной атмосферой!",
+                start_datetime=dt.datetime(2024, 11, 21, 22, 0),
+                end_datetime=dt.datetime(2024, 11, 22, 2, 0),
+                venue_name="Арт-центр WORM",
+                venue_address="Boomgaardsstraat 71",
+                venue_map_link="https://maps.app.goo.gl/3S5DKJii2WiJoN2p6",
+            ),
+        )
 
     match action:
         case Action.LOAD_TO_FILE:
-            with open("events.html", mode="w", encoding="utf-8") as f:
-                f.write(generate_event_page(events))
+            html_page = generate_event_page(events)
+            with tracer.span("file.write"), open("events.html", mode="w", encoding="utf-8") as f:
+                f.write(html_page)
         case Action.SEND_MESSAGE:
             asyncio.run(send_html_message(events))
+        case Action.UPDATE_MESSAGE:
+            asyncio.run(update_html_message(events))
+        case Action.PUBLISH:
+            from publishing import configured_sinks, describe_results, publish
+
+            print(describe_results(asyncio.run(publish(events, configured_sinks()))))
+
+
+# Operations that can be profiled on their own, mapped to the functions that implement them
+PROFILED_OPERATIONS = {
+    "render": "generate_event_page",
+    "send": "send_html_message",
+    "update": "update_html_message",
+}
+
+
+def cli(argv: list[str] | None = None) -> None:
+    """Run the headless entry point with command line options.
+
+    Args:
+    ----
+        argv: Command line arguments, defaults to ``sys.argv[1:]``
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--action",
+        choices=[action.name.lower() for action in Action],
+        default=Action.SEND_MESSAGE.name.lower(),
+        help="Write HTML to events.html, send it to Telegram, edit the sent digest or publish it "
+             "to all configured channels (default: %(default)s)",
+    )
+    add_profile_arguments(parser, operations=tuple(PROFILED_OPERATIONS))
+    args = parser.parse_args(argv)
+    action = Action[args.action.upper()]
+
+    if args.profile is None:
+        main(action)
+        return
+
+    profiler = Profiler(args.profile, args.profile_dir)
+    if args.profile == SESSION:
+        with profiler:
+            main(action)
+    else:
+        wrap_operation(sys.modules[__name__], PROFILED_OPERATIONS[args.profile], profiler)
+        main(action)
+    for report in profiler.reports:
+        print(f"Profile report written to {report}")
 
 
 if __name__ == "__main__":
-    main(Action.SEND_MESSAGE)
+    # Run as a script, this module would be a second copy of the one that publishing and the
+    # other modules import, with its own settings and cache, and profiling would miss them
+    sys.exit("Run the headless entry point with `python kuda_idem.py` instead")
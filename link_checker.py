@@ -0,0 +1,180 @@
+"""Check the links of events concurrently before a digest is sent.
+
+All links are resolved over one pooled async HTTP client, with a limit of concurrent requests
+per host, and every URL is requested once per run even if several events share it. Results
+are kept in the disk cache for a while, so venue links shared by many weekends are not checked
+again every time.
+
+Only links a server answered with an error status are broken. A link that could not be
+reached at all, e.g. while offline or on a timeout, is unknown: it is neither reported nor
+cached, so it is checked again next time.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import defaultdict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+import httpx
+from diskcache import Cache
+
+from tracing import tracer
+
+if TYPE_CHECKING:
+    from kuda_idem_template import Event
+
+LINK_FIELDS = ("title_link", "venue_map_link", "ticket_link")
+# Statuses with which some servers answer HEAD requests although GET works
+HEAD_UNSUPPORTED = frozenset({
+    HTTPStatus.FORBIDDEN,
+    HTTPStatus.METHOD_NOT_ALLOWED,
+    HTTPStatus.NOT_IMPLEMENTED,
+})
+# Some shops refuse requests without a browser-like user agent
+USER_AGENT = "Mozilla/5.0 (compatible; kuda-idem-link-checker/1.0)"
+
+
+@dataclass(slots=True, frozen=True)
+class LinkStatus:
+    """Outcome of resolving a URL."""
+
+    url: str
+    status: int | None
+    error: str | None
+    checked_at: float
+
+    @property
+    def ok(self) -> bool:
+        """Whether the link leads to a page."""
+        return self.status is not None and self.status < HTTPStatus.BAD_REQUEST
+
+    @property
+    def broken(self) -> bool:
+        """Whether the server answered with an error, rather than not answering at all."""
+        return self.status is not None and self.status >= HTTPStatus.BAD_REQUEST
+
+    def describe(self) -> str:
+        """Describe why a link is broken."""
+        return f"HTTP {self.status}" if self.status is not None else str(self.error)
+
+
+@dataclass(slots=True, frozen=True)
+class BrokenLink:
+    """A broken link of an event, as an index into the checked collection."""
+
+    event_index: int
+    field: str
+    link: LinkStatus
+
+
+class LinkChecker:
+    """Resolve links concurrently with per-host limits and a TTL cache of the results.
+
+    Use as an async context manager, which owns the pooled HTTP client.
+
+    Attributes
+    ----------
+        cache: Disk cache for the results
+        ttl: How long a working link is not checked again, in seconds
+        failure_ttl: How long a broken link is not checked again, in seconds
+        per_host: Concurrent requests to a single host at most
+        client: Pooled HTTP client, limited to ``max_connections`` and ``timeout`` seconds
+
+    """
+
+    def __init__(
+            self,
+            cache: Cache,
+            ttl: float = 24 * 60 * 60,
+            failure_ttl: float = 15 * 60,
+            per_host: int = 4,
+            max_connections: int = 32,
+            timeout: float = 10.0,
+    ) -> None:
+        self.cache = cache
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.per_host = per_host
+        self.client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=timeout,
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(max_connections=max_connections),
+        )
+        self._host_limits: defaultdict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.per_host)
+        )
+        self._in_flight: dict[str, asyncio.Task[LinkStatus]] = {}
+
+    async def __aenter__(self) -> LinkChecker:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.client.aclose()
+
+    async def check_url(self, url: str) -> LinkStatus:
+        """Return the cached status of a URL, or resolve it once however many callers ask."""
+        cached = self.cache.get(("link", url))
+        if cached is not None:
+            return cached
+        task = self._in_flight.get(url)
+        if task is None:
+            task = self._in_flight[url] = asyncio.create_task(self._resolve(url))
+            task.add_done_callback(lambda _: self._in_flight.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def check_events(self, events: Sequence[Event]) -> list[BrokenLink]:
+        """Check every link of every event and return the broken ones, in event order.
+
+        Links that could not be reached are left out, since they are not known to be broken.
+        """
+        links = [
+            (i, field, url)
+            for i, event in enumerate(events)
+            for field in LINK_FIELDS
+            if (url := getattr(event, field)) is not None
+        ]
+        with tracer.span("links.check", links=len(links)):
+            statuses = await asyncio.gather(*(self.check_url(url) for _, _, url in links))
+        return [
+            BrokenLink(i, field, status)
+            for (i, field, _), status in zip(links, statuses, strict=True)
+            if status.broken
+        ]
+
+    async def _resolve(self, url: str) -> LinkStatus:
+        async with self._host_limits[urlsplit(url).netloc]:
+            try:
+                response = await self.client.head(url)
+                if response.status_code in HEAD_UNSUPPORTED:
+                    # Only the status is needed, so don't download the body
+                    async with self.client.stream("GET", url) as response:
+                        pass
+                status = LinkStatus(url, response.status_code, None, time.time())
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}".rstrip(": ")
+                # Unknown rather than broken, e.g. while offline, so it is not cached either
+                return LinkStatus(url, None, error, time.time())
+        self.cache.set(("link", url), status, expire=self.ttl if status.ok else self.failure_ttl)
+        return status
+
+
+async def find_broken_links(events: Sequence[Event], cache: Cache) -> list[BrokenLink]:
+    """Check all links of the events with a fresh `LinkChecker`."""
+    async with LinkChecker(cache) as checker:
+        return await checker.check_events(events)
+
+
+def describe_broken_links(events: Sequence[Event], broken: Sequence[BrokenLink]) -> str:
+    """Describe broken links per event for a human."""
+    return "\n".join(
+        f"Event {link.event_index + 1} ({events[link.event_index].title!r}): "
+        f"{link.field} {link.link.url} is broken, {link.link.describe()}"
+        for link in broken
+    )
@@ -0,0 +1,193 @@
+"""A minimal asyncio HTTP/1.1 server for local stand-ins of the services the bot talks to.
+
+Only what the stand-ins need is supported: keep-alive connections, bodies with a
+Content-Length header, JSON, url-encoded and multipart request bodies.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import email.policy
+import json
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+from http import HTTPStatus
+from typing import Any
+from urllib.parse import parse_qsl, urlsplit
+
+
+@dataclass(slots=True)
+class Request:
+    """A parsed HTTP request."""
+
+    method: str
+    path: str
+    query: dict[str, str]
+    headers: dict[str, str]
+    body: bytes = b""
+
+    def form(self) -> dict[str, str | bytes]:
+        """Decode a url-encoded, multipart or JSON body into a flat mapping.
+
+        JSON bodies must be objects, their values are kept as they are. Multipart file
+        parts are returned as bytes.
+        """
+        content_type = self.headers.get("content-type", "")
+        if content_type.startswith("application/json"):
+            return json.loads(self.body or b"{}")
+        if content_type.startswith("multipart/form-data"):
+            message = BytesParser(policy=email.policy.HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + self.body
+            )
+            form: dict[str, str | bytes] = {}
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                payload = part.get_payload(decode=True) or b""
+                form[name] = payload if part.get_filename() else payload.decode()
+            return form
+        return dict(parse_qsl(self.body.decode(), keep_blank_values=True))
+
+
+@dataclass(slots=True)
+class Response:
+    """An HTTP response."""
+
+    status: int = HTTPStatus.OK
+    body: bytes = b""
+    headers: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def json(cls, payload: Any, status: int = HTTPStatus.OK) -> Response:
+        """Create a response with a JSON body."""
+        return cls(
+            status=status,
+            body=json.dumps(payload, ensure_ascii=False).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class LocalHTTPServer:
+    """Serve requests on a local port with a single async handler.
+
+    Use as an async context manager; with ``port=0`` a free port is picked, see `url`.
+    """
+
+    def __init__(self, handler: Handler, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self._server: asyncio.Server | None = None
+        self._connections: set[asyncio.Task[None]] = set()
+
+    @property
+    def url(self) -> str:
+        """Base URL of the running server, without a trailing slash."""
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        """Start listening for connections."""
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        """Stop listening and drop open connections."""
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self) -> None:
+        """Start the server and serve until cancelled."""
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+    async def __aenter__(self) -> LocalHTTPServer:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.stop()
+
+    async def _serve_connection(
+            self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except ValueError as e:  # Malformed request line or header
+                    response = Response(HTTPStatus.BAD_REQUEST, str(e).encode())
+                    await write_response(writer, response, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                try:
+                    response = await self.handler(request)
+                except Exception as e:  # A broken handler must not kill the stand-in
+                    response = Response(HTTPStatus.INTERNAL_SERVER_ERROR, str(e).encode())
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                await write_response(writer, response, keep_alive=keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+
+async def read_request(reader: asyncio.StreamReader) -> Request | None:
+    """Read one request from a connection, or return None when the client hung up.
+
+    Raises:
+    ------
+        ValueError: If the request line or the Content-Length header is malformed
+
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise ValueError(f"Malformed request line {request_line!r}") from None
+
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0))
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    return Request(method, url.path, dict(parse_qsl(url.query)), headers, body)
+
+
+async def write_response(
+        writer: asyncio.StreamWriter, response: Response, keep_alive: bool = True
+) -> None:
+    """Write a response to a connection."""
+    status = HTTPStatus(response.status)
+    headers = {
+        **response.headers,
+        "Content-Length": str(len(response.body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+    }
+    head = f"HTTP/1.1 {status.value} {status.phrase}\r\n" + "".join(
+        f"{name}: {value}\r\n" for name, value in headers.items()
+    )
+    writer.write(head.encode("latin-1") + b"\r\n" + response.body)
+    await writer.drain()
@@ -0,0 +1,347 @@
+"""Queue digests in a durable outbox and deliver them to Telegram once it can be reached.
+
+The GUI does not send a digest itself: `Outbox.put` renders it into the messages to send and
+queues them with their destination in the disk cache, which survives restarts. An
+`OutboxFlusher` running in the background drains the queue in order over one bot, i.e. one
+pooled HTTP client, per batch, spacing out requests and backing off while the network is
+down. Every completed step of a delivery is saved, so a digest interrupted halfway is
+continued, not sent again. In-place updates of the published digest are queued the same way,
+so they are applied in order with the digests and never race the flusher::
+
+    python outbox.py            # deliver the queued digests, waiting for the network
+    python outbox.py --status   # show what is queued
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Collection
+from typing import Any
+
+from diskcache import Cache
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from kuda_idem_template import (
+    Event,
+    cache,
+    content_hash,
+    make_bot,
+    remember_published_digest,
+    render_html_message,
+    send_digest_chunk,
+    send_event_poll,
+    send_event_posters,
+    settings,
+    split_html_message,
+    update_html_message,
+)
+from posters import event_posters
+from publishing import RateLimiter
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = "outbox"
+_STATUS_KEY = "outbox_status"
+_FLUSHER_KEY = "outbox_flusher"
+# Delivered and failed digests whose status is kept for the GUI
+KEEP_FINISHED = 20
+# Delivery steps of a digest, in order
+POSTERS, MESSAGES, POLL = "posters", "messages", "poll"
+# The only step of an update of the published digest
+UPDATE = "update"
+
+
+def _retry_after(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, dt.timedelta) else retry_after
+
+
+class Outbox:
+    """Digests waiting to be sent, in the order they were queued, with their delivery status.
+
+    The queue itself is a diskcache queue under the ``outbox`` prefix. The status of every
+    digest, by its ID, is kept under a single key, so the GUI reads it in one lookup.
+    """
+
+    def __init__(self, cache: Cache) -> None:
+        self.cache = cache
+
+    def put(self, events: Collection[Event]) -> str:
+        """Render a digest, queue it for the configured topic and return its ID.
+
+        Raises:
+        ------
+            FileNotFoundError: If the poster of an event does not exist
+
+        """
+        # Checked now, while the digest can still be fixed, rather than when it is delivered
+        for poster, _ in event_posters(list(events)):
+            if not poster.is_file():
+                raise FileNotFoundError(f"The poster {poster} does not exist")
+        with tracer.span("outbox.put", events=len(events)):
+            chunks = split_html_message(render_html_message(events))
+            return self._push(events, POSTERS, chunks)
+
+    def put_update(self, events: Collection[Event]) -> str:
+        """Queue an in-place update of the published digest to the events and return its ID.
+
+        The update is rendered when it is delivered, against the digest published by then.
+        """
+        with tracer.span("outbox.put", events=len(events)):
+            return self._push(events, UPDATE, [])
+
+    def _push(self, events: Collection[Event], step: str, chunks: list[str]) -> str:
+        entry_id = uuid.uuid4().hex
+        entry = {
+            "id": entry_id,
+            "chat_id": settings.GROUP_CHAT_ID,
+            "topic_id": settings.TOPIC_ID,
+            "chunks": chunks,
+            "events": [event.model_dump(mode="json") for event in events],
+            "step": step,
+            "published": [],
+        }
+        with self.cache.transact():
+            self.cache.push(entry, prefix=_PREFIX)
+            self._set_status(entry_id, state="queued", sent=0, total=len(chunks))
+        return entry_id
+
+    def peek(self) -> tuple[str, dict[str, Any]] | None:
+        """The key and entry of the oldest queued digest, None if the queue is empty."""
+        key, entry = self.cache.peek(prefix=_PREFIX, default=(None, None))
+        return None if key is None else (key, entry)
+
+    def save(self, key: str, entry: dict[str, Any]) -> None:
+        """Store the progress of a delivery."""
+        with self.cache.transact():
+            self.cache.set(key, entry)
+            self._set_status(entry["id"], state="sending", sent=len(entry["published"]))
+
+    def finish(self, key: str, entry: dict[str, Any], error: str | None = None) -> None:
+        """Remove a digest from the queue, as delivered or as failed with an error."""
+        with self.cache.transact():
+            self.cache.delete(key)
+            self._set_status(
+                entry["id"],
+                state="failed" if error else "sent",
+                sent=len(entry["published"]),
+                error=error,
+            )
+
+    def _set_status(self, entry_id: str, **status: Any) -> None:
+        statuses: dict[str, dict[str, Any]] = self.cache.get(_STATUS_KEY, {})
+        statuses[entry_id] = {**statuses.get(entry_id, {}), **status, "updated": time.time()}
+        finished = [key for key, value in statuses.items() if value["state"] in ("sent", "failed")]
+        for key in finished[:-KEEP_FINISHED]:
+            del statuses[key]
+        self.cache.set(_STATUS_KEY, statuses)
+
+    def statuses(self) -> dict[str, dict[str, Any]]:
+        """Status of the queued and recently finished digests, oldest first."""
+        return self.cache.get(_STATUS_KEY, {})
+
+    def pending(self) -> int:
+        """Number of digests not delivered yet."""
+        return sum(
+            status["state"] in ("queued", "sending") for status in self.statuses().values()
+        )
+
+    def set_flusher_state(self, **state: Any) -> None:
+        """Record what the flusher is doing, e.g. waiting for the network."""
+        self.cache.set(_FLUSHER_KEY, state)
+
+    def describe(self) -> str:
+        """One line about the outbox for the GUI's status bar."""
+        statuses = list(self.statuses().values())
+        pending = [status for status in statuses if status["state"] in ("queued", "sending")]
+        if not pending:
+            if statuses and statuses[-1]["state"] == "failed":
+                return f"Outbox: the last digest failed: {statuses[-1]['error']}"
+            return "Outbox: all digests sent" if statuses else "Outbox: empty"
+        flusher = self.cache.get(_FLUSHER_KEY, {})
+        text = f"Outbox: {len(pending)} digest(s) waiting"
+        sending = pending[0]
+        if sending["state"] == "sending":
+            text += f", sent {sending['sent']} of {sending['total']} messages"
+        if (retry_at := flusher.get("retry_at")) is not None:
+            reason = "no connection" if flusher.get("offline", True) else flusher["error"]
+            text += f", {reason}, retrying in {max(0, retry_at - time.time()):.0f} s"
+        return text
+
+
+class OutboxFlusher:
+    """Deliver the queued digests in order, until stopped.
+
+    Args:
+    ----
+        outbox: Queue to drain
+        bot: Bot to send with, defaults to one for the configured token
+        rate: Requests per second at most
+        idle_interval: Seconds between looks at an empty queue, `wake` cuts it short
+
+    """
+
+    def __init__(
+            self,
+            outbox: Outbox,
+            bot: Bot | None = None,
+            rate: float | None = 1.0,
+            idle_interval: float = 30.0,
+    ) -> None:
+        self.outbox = outbox
+        self.bot = bot or make_bot()
+        self.limiter = RateLimiter(rate)
+        self.idle_interval = idle_interval
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def wake(self) -> None:
+        """Look at the queue right away, e.g. after queuing a digest."""
+        self._wake.set()
+
+    def stop(self) -> None:
+        """Stop after the current request."""
+        self._stopped.set()
+        self._wake.set()
+
+    async def flush(self) -> int:
+        """Deliver every queued digest and return how many were finished.
+
+        Network errors are raised, leaving the digest being sent at the step it got to. A digest
+        failing with any other error is dropped as failed, since sending it again would fail
+        again.
+        """
+        finished = 0
+        if self.outbox.peek() is None:
+            return finished
+        async with self.bot:
+            while not self._stopped.is_set() and (queued := self.outbox.peek()) is not None:
+                key, entry = queued
+                with tracer.span("outbox.deliver", chunks=len(entry["chunks"])):
+                    try:
+                        await self._deliver(key, entry)
+                    except (BadRequest, Forbidden) as e:
+                        # Sending it again would fail again, so it must not block the queue
+                        logger.error("Dropping digest %s from the outbox: %s", entry["id"], e)
+                        self.outbox.finish(key, entry, error=str(e))
+                    except (RetryAfter, NetworkError):
+                        raise
+                    except Exception as e:
+                        # E.g. a poster that was removed after the digest was queued
+                        logger.exception("Dropping digest %s from the outbox", entry["id"])
+                        self.outbox.finish(key, entry, error=f"{type(e).__name__}: {e}")
+                    else:
+                        self.outbox.finish(key, entry)
+                finished += 1
+        return finished
+
+    async def _deliver(self, key: str, entry: dict[str, Any]) -> None:
+        if (entry["chat_id"], entry["topic_id"]) != (settings.GROUP_CHAT_ID, settings.TOPIC_ID):
+            raise BadRequest("The digest was queued for another chat or topic")
+        events = [Event(**data) for data in entry["events"]]
+        if entry["step"] == UPDATE:
+            # Edits only what changed and saves its progress, so a retry repeats nothing
+            await self._request(update_html_message(events, self.bot))
+            return
+        if entry["step"] == POSTERS:
+            await self._request(send_event_posters(self.bot, events))
+            entry["step"] = MESSAGES
+            self.outbox.save(key, entry)
+        if entry["step"] == MESSAGES:
+            for chunk in entry["chunks"][len(entry["published"]):]:
+                message = await self._request(send_digest_chunk(self.bot, chunk))
+                entry["published"].append(
+                    {"message_id": message.message_id, "hash": content_hash(chunk)}
+                )
+                self.outbox.save(key, entry)
+            remember_published_digest(entry["published"], events)
+            entry["step"] = POLL
+            self.outbox.save(key, entry)
+        await self._request(send_event_poll(self.bot, events))
+
+    async def _request(self, coroutine: Any) -> Any:
+        """Await a request after the rate limit allows it."""
+        await self.limiter.wait()
+        return await coroutine
+
+    async def run(self) -> None:
+        """Flush the outbox until stopped, backing off while Telegram cannot be reached."""
+        backoff = 1.0
+        while not self._stopped.is_set():
+            delay = self.idle_interval
+            try:
+                await self.flush()
+                backoff = 1.0
+                self.outbox.set_flusher_state()
+            except RetryAfter as e:
+                delay = _retry_after(e)
+                self.outbox.set_flusher_state(retry_at=time.time() + delay)
+            except NetworkError as e:
+                logger.warning("Sending failed: %s, retrying in %.0f s", e, backoff)
+                delay = backoff
+                self.outbox.set_flusher_state(retry_at=time.time() + delay, error=str(e))
+                backoff = min(backoff * 2, 60)
+            except Exception as e:
+                # E.g. an invalid token, which must not end the thread without a trace
+                logger.exception("Flushing the outbox failed, retrying in %.0f s", backoff)
+                delay = backoff
+                self.outbox.set_flusher_state(
+                    retry_at=time.time() + delay, error=f"{type(e).__name__}: {e}", offline=False
+                )
+                backoff = min(backoff * 2, 60)
+            await asyncio.to_thread(self._wake.wait, delay)
+            self._wake.clear()
+
+    def start(self) -> threading.Thread:
+        """Run the flusher in a daemon thread with its own event loop."""
+        thread = threading.Thread(
+            target=asyncio.run, args=(self.run(),), name="outbox-flusher", daemon=True
+        )
+        thread.start()
+        return thread
+
+
+def main() -> None:
+    """Deliver the queued digests, or show the outbox, from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--status", action="store_true", help="Only show what is queued")
+    args = parser.parse_args()
+
+    outbox = Outbox(cache)
+    if args.status:
+        for entry_id, status in outbox.statuses().items():
+            error = f"  {status['error']}" if status.get("error") else ""
+            print(f"{entry_id}  {status['state']:<7}  {status['sent']}/{status['total']}{error}")
+        return
+
+    flusher = OutboxFlusher(outbox)
+
+    async def drain() -> None:
+        backoff = 1.0
+        while outbox.peek() is not None:
+            try:
+                await flusher.flush()
+            except RetryAfter as e:
+                await asyncio.sleep(_retry_after(e))
+            except NetworkError as e:
+                print(f"Sending failed: {e}, retrying in {backoff:.0f} s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    try:
+        asyncio.run(drain())
+    except Exception as e:
+        parser.exit(1, f"Sending failed: {type(e).__name__}: {e}\n")
+    print(outbox.describe())
+
+
+if __name__ == "__main__":
+    main()
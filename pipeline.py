@@ -0,0 +1,353 @@
+"""Publish many digests in one run, e.g. several weeks or cities, as a pipeline of stages.
+
+Digests flow through validation, rendering, splitting and delivery, connected by bounded
+queues, so the CPU-bound stages of one digest run while another waits on the network.
+Validation and rendering run in worker threads, and each of these stages has its own
+concurrency limit. Delivery has one worker per destination, since a destination must receive
+its messages in order, and the destinations are served concurrently. A digest that fails a
+stage is reported with its error and the others are still published. Every stage counts its
+items and busy time::
+
+    python pipeline.py events.json --by city   # publish a digest per city
+    python pipeline.py --by week                # the events saved in the GUI, per week
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import time
+from collections import defaultdict
+from collections.abc import Awaitable, Callable, Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from kuda_idem_template import Event, cache, generate_event_page
+from publishing import RateLimiter, Sink, SinkResult, configured_sinks, deliver_item
+from tracing import tracer
+
+# Ends a stage's input, every worker passes it on to its siblings before stopping
+_DONE = object()
+# Digest of the events that cannot be grouped, which fails validation
+INVALID_DIGEST = "invalid"
+
+
+@dataclass(slots=True)
+class StageStats:
+    """Throughput of a pipeline stage.
+
+    Attributes
+    ----------
+        name: Name of the stage
+        concurrency: Workers of the stage
+        items: Items the stage finished
+        busy: Seconds the workers spent on items, summed over the workers
+        started: When the first item was started, on the `time.perf_counter` clock
+        finished: When the last item was finished
+
+    """
+
+    name: str
+    concurrency: int
+    items: int = 0
+    busy: float = 0.0
+    started: float | None = None
+    finished: float | None = None
+
+    def record(self, started: float, finished: float) -> None:
+        """Count an item processed from ``started`` to ``finished``."""
+        self.items += 1
+        self.busy += finished - started
+        self.started = started if self.started is None else min(self.started, started)
+        self.finished = finished if self.finished is None else max(self.finished, finished)
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds from the first item's start to the last item's end."""
+        return 0.0 if self.started is None else self.finished - self.started
+
+    @property
+    def throughput(self) -> float:
+        """Items per second while the stage was active."""
+        return self.items / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """Share of the active time its workers were busy."""
+        return self.busy / (self.elapsed * self.concurrency) if self.elapsed else 0.0
+
+    def describe(self) -> str:
+        """One line about the stage for a human."""
+        return (
+            f"{self.name}: {self.items} items in {self.elapsed:.2f} s, "
+            f"{self.throughput:.1f}/s, {self.concurrency} workers {self.utilization:.0%} busy"
+        )
+
+
+class Stage:
+    """Workers taking items from a bounded queue and handing the results on."""
+
+    def __init__(
+            self,
+            name: str,
+            handle: Callable[[Any], Awaitable[Any]],
+            concurrency: int = 1,
+            queue_size: int = 8,
+    ) -> None:
+        self.handle = handle
+        self.concurrency = concurrency
+        self.inbox: asyncio.Queue[Any] = asyncio.Queue(maxsize=queue_size)
+        self.stats = StageStats(name, concurrency)
+
+    async def run(self, forward: Callable[[Any], Awaitable[None]]) -> None:
+        """Process items until the input ends, passing every result to ``forward``."""
+
+        async def work() -> None:
+            while (item := await self.inbox.get()) is not _DONE:
+                started = time.perf_counter()
+                with tracer.span(f"pipeline.{self.stats.name}"):
+                    result = await self.handle(item)
+                self.stats.record(started, time.perf_counter())
+                await forward(result)
+            await self.inbox.put(_DONE)
+
+        await asyncio.gather(*(work() for _ in range(self.concurrency)))
+
+
+@dataclass(slots=True)
+class Digest:
+    """A digest on its way through the pipeline, with the error that stopped it, if any."""
+
+    index: int
+    name: str
+    raw: Sequence[Event | dict[str, Any]]
+    events: list[Event] = field(default_factory=list)
+    page: str = ""
+    error: Exception | None = None
+
+
+@dataclass(slots=True)
+class PipelineResult:
+    """Delivery outcomes by digest name and sink, and the statistics of every stage."""
+
+    results: dict[str, list[SinkResult]]
+    stages: list[StageStats]
+
+    def describe(self) -> str:
+        """The outcome and the stage statistics for a human."""
+        lines = [
+            f"{name} → {result.name}: {result.delivered}/{result.total} delivered"
+            + (f", failed: {result.error!r}" if result.error is not None else "")
+            for name, results in self.results.items()
+            for result in results
+        ]
+        return "\n".join(lines + [stats.describe() for stats in self.stages])
+
+
+def group_events(
+        events: Iterable[Event | dict[str, Any]], by: str
+) -> dict[str, list[Event | dict[str, Any]]]:
+    """Split events into digests by ``"week"`` or ``"city"``, in the order of the keys.
+
+    Events are not validated here but in the pipeline, only the grouping field is read. Events
+    without a readable one go to the `INVALID_DIGEST`, so they are reported, not lost.
+    """
+    groups: defaultdict[str, list[Event | dict[str, Any]]] = defaultdict(list)
+    for event in events:
+        try:
+            key = _group_key(event, by)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            key = INVALID_DIGEST
+        groups[key].append(event)
+    return dict(sorted(groups.items()))
+
+
+def _group_key(event: Event | dict[str, Any], by: str) -> str:
+    if isinstance(event, Event):
+        value = event.city if by == "city" else event.start_datetime
+    else:
+        value = event["city" if by == "city" else "start_datetime"]
+    if by == "city":
+        return str(value)
+    start = dt.datetime.fromisoformat(value) if isinstance(value, str) else value
+    year, week, _ = start.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+async def run_pipeline(
+        digests: dict[str, Sequence[Event | dict[str, Any]]],
+        sinks: Sequence[Sink],
+        validate_concurrency: int = 4,
+        render_concurrency: int = 2,
+        queue_size: int = 4,
+) -> PipelineResult:
+    """Validate, render and deliver digests to every sink, overlapping the stages.
+
+    Args:
+    ----
+        digests: Events, validated or not, of every digest by its name, in delivery order
+        sinks: Destinations every digest is delivered to
+        validate_concurrency: Threads validating events
+        render_concurrency: Threads rendering pages
+        queue_size: Items waiting between two stages at most
+
+    Returns:
+    -------
+        PipelineResult: Outcome per digest and sink, and the statistics of every stage
+
+    """
+    loop = asyncio.get_running_loop()
+    results: dict[str, list[SinkResult]] = {name: [] for name in digests}
+
+    with ThreadPoolExecutor(validate_concurrency + render_concurrency) as executor:
+
+        async def validate(digest: Digest) -> Digest:
+            try:
+                digest.events = await loop.run_in_executor(
+                    executor, lambda: [Event.model_validate(event) for event in digest.raw]
+                )
+            except ValueError as e:
+                digest.error = e
+            return digest
+
+        async def render(digest: Digest) -> Digest:
+            if digest.error is None:
+                try:
+                    digest.page = await loop.run_in_executor(
+                        executor, generate_event_page, digest.events
+                    )
+                except Exception as e:
+                    # E.g. a broken template, which must not stop the other digests
+                    digest.error = e
+            return digest
+
+        def render_for(sink: Sink, digest: Digest) -> list[Any] | Exception:
+            try:
+                return sink.render(digest.page, digest.events)
+            except Exception as e:
+                return e
+
+        async def split(digest: Digest) -> tuple[Digest, list[list[Any] | Exception]]:
+            if digest.error is not None:
+                return digest, [[] for _ in sinks]
+            # A sink failing to render the page fails only its own delivery of the digest
+            return digest, [render_for(sink, digest) for sink in sinks]
+
+        def deliver_to(sink: Sink) -> Callable[[tuple[Digest, list[Any]]], Awaitable[None]]:
+            limiter = RateLimiter(sink.rate)
+
+            async def deliver(job: tuple[Digest, list[Any] | Exception]) -> None:
+                digest, items = job
+                started = time.perf_counter()
+                delivered = 0
+                failed = digest.error or (items if isinstance(items, Exception) else None)
+                if failed is not None:
+                    results[digest.name].append(SinkResult(sink.name, 0, 0, 0.0, failed))
+                    return
+                target = sink.for_digest(digest.name)
+                try:
+                    await target.open(digest.events)
+                    for item in items:
+                        await deliver_item(target, item, limiter)
+                        delivered += 1
+                    await target.close(digest.events)
+                except Exception as e:
+                    error: Exception | None = e
+                else:
+                    error = None
+                finally:
+                    await target.release()
+                results[digest.name].append(
+                    SinkResult(
+                        sink.name, delivered, len(items), time.perf_counter() - started, error
+                    )
+                )
+
+            return deliver
+
+        validating = Stage("validate", validate, validate_concurrency, queue_size)
+        rendering = Stage("render", render, render_concurrency, queue_size)
+        splitting = Stage("split", split, 1, queue_size)
+        delivering = [
+            Stage(f"deliver.{sink.name}", deliver_to(sink), 1, queue_size) for sink in sinks
+        ]
+
+        # Validation and rendering finish digests out of order, splitting restores the order
+        pending: dict[int, Digest] = {}
+        next_index = 0
+
+        async def reorder(digest: Digest) -> None:
+            nonlocal next_index
+            pending[digest.index] = digest
+            while next_index in pending:
+                await splitting.inbox.put(pending.pop(next_index))
+                next_index += 1
+
+        async def fan_out(job: tuple[Digest, list[list[Any] | Exception]]) -> None:
+            digest, items = job
+            for stage, sink_items in zip(delivering, items, strict=True):
+                await stage.inbox.put((digest, sink_items))
+
+        async def discard(_: None) -> None:
+            pass
+
+        async def feed() -> None:
+            for index, (name, raw) in enumerate(digests.items()):
+                await validating.inbox.put(Digest(index, name, raw))
+            await validating.inbox.put(_DONE)
+
+        async def chain(
+                stage: Stage, forward: Callable[[Any], Awaitable[None]], *downstream: Stage
+        ) -> None:
+            await stage.run(forward)
+            for next_stage in downstream:
+                await next_stage.inbox.put(_DONE)
+
+        with tracer.span("pipeline.run", digests=len(digests), sinks=len(sinks)):
+            await asyncio.gather(
+                feed(),
+                chain(validating, rendering.inbox.put, rendering),
+                chain(rendering, reorder, splitting),
+                chain(splitting, fan_out, *delivering),
+                *(stage.run(discard) for stage in delivering),
+            )
+
+    stages = [validating.stats, rendering.stats, splitting.stats]
+    return PipelineResult(results, stages + [stage.stats for stage in delivering])
+
+
+def main() -> None:
+    """Publish a digest per week or city to the configured channels from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "events", type=Path, nargs="?", help="JSON list of events, defaults to the saved ones"
+    )
+    parser.add_argument("--by", choices=("week", "city"), default="week")
+    parser.add_argument("--validate-concurrency", type=int, default=4)
+    parser.add_argument("--render-concurrency", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=4)
+    args = parser.parse_args()
+
+    raw = (
+        json.loads(args.events.read_text(encoding="utf-8"))
+        if args.events
+        else cache.get("events", [])
+    )
+    result = asyncio.run(
+        run_pipeline(
+            group_events(raw, args.by),
+            configured_sinks(),
+            validate_concurrency=args.validate_concurrency,
+            render_concurrency=args.render_concurrency,
+            queue_size=args.queue_size,
+        )
+    )
+    print(result.describe())
+
+
+if __name__ == "__main__":
+    main()
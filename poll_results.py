@@ -0,0 +1,302 @@
+"""Collect answers to the weekly polls and keep running per-option tallies.
+
+`send_html_message` registers every poll it sends in a `PollStore`. `PollAnswerCollector`
+long-polls getUpdates for ``poll_answer`` updates and applies each answer to the tallies in
+O(1) per chosen option, so current results are available without recounting anything::
+
+    python poll_results.py          # collect answers until interrupted
+    python poll_results.py --show   # print the results of the latest poll
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import logging
+from collections.abc import Callable, Collection, Sequence
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from diskcache import Cache
+from telegram import Bot, Message, Update
+from telegram.constants import UpdateType
+from telegram.error import NetworkError, RetryAfter
+
+from tracing import tracer
+
+if TYPE_CHECKING:
+    from event_archive import EventArchive
+    from kuda_idem_template import Event
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class OptionResult:
+    """Current votes for a poll option and the event it stands for, if any."""
+
+    text: str
+    votes: int
+    event: dict[str, Any] | None
+
+
+class PollStore:
+    """Sent polls, their voters and per-option vote counters in the disk cache.
+
+    Every voter of a poll gets a numbered slot holding their user ID on their first answer,
+    and keeps it when they retract, so recording an answer touches a fixed number of keys
+    however many people voted, and the voters of a poll are read without scanning the cache.
+    """
+
+    def __init__(self, cache: Cache) -> None:
+        self.cache = cache
+
+    def register_poll(self, message: Message, events: Collection[Event]) -> None:
+        """Remember a sent poll and link its options to the events they stand for.
+
+        Args:
+        ----
+            message: The message returned by sendPoll
+            events: Events in the order of the first poll options
+
+        """
+        assert message.poll is not None
+        poll = message.poll
+        event_data = [event.model_dump(mode="json") for event in events]
+        self.cache.set(
+            ("poll", poll.id),
+            {
+                "chat_id": message.chat_id,
+                "message_id": message.message_id,
+                "sent_at": message.date.isoformat(),
+                "options": [option.text for option in poll.options],
+                "events": event_data + [None] * (len(poll.options) - len(event_data)),
+            },
+        )
+        self.cache.set(("poll_voter_slots", poll.id), 0)
+        self.cache.set("latest_poll", poll.id)
+
+    def poll_ids(self) -> list[str]:
+        """IDs of all registered polls, in no particular order."""
+        return [
+            key[1] for key in self.cache.iterkeys() if isinstance(key, tuple) and key[0] == "poll"
+        ]
+
+    def latest_poll_id(self) -> str | None:
+        """ID of the most recently sent poll."""
+        return self.cache.get("latest_poll")
+
+    def record_answer(self, poll_id: str, user_id: int, option_ids: Sequence[int]) -> bool:
+        """Apply a voter's current answer, replacing their previous one.
+
+        An empty ``option_ids`` means the vote was retracted. Only the counters of the
+        options that changed are touched.
+
+        Returns
+        -------
+            bool: Whether the poll is known to the store
+
+        """
+        if ("poll", poll_id) not in self.cache:
+            return False
+        voter_key = ("poll_voter", poll_id, user_id)
+        current = set(option_ids)
+        with self.cache.transact():
+            answer = self.cache.get(voter_key)
+            if answer is None:
+                # A retracted answer is kept as an empty one, so this is the first answer
+                slot = self._slot_count(poll_id)
+                self.cache.set(("poll_voter_slot", poll_id, slot), user_id)
+                self.cache.set(("poll_voter_slots", poll_id), slot + 1)
+            previous = set(answer or ())
+            for option_id in previous - current:
+                self.cache.decr(("poll_votes", poll_id, option_id))
+            for option_id in current - previous:
+                self.cache.incr(("poll_votes", poll_id, option_id))
+            if previous and not current:
+                self.cache.decr(("poll_voters", poll_id))
+            elif current and not previous:
+                self.cache.incr(("poll_voters", poll_id))
+            self.cache.set(voter_key, tuple(sorted(current)))
+            self.cache.incr(("poll_answers", poll_id))
+        return True
+
+    def results(self, poll_id: str) -> list[OptionResult]:
+        """Current votes per option of a poll, in option order."""
+        poll = self.cache.get(("poll", poll_id))
+        if poll is None:
+            raise KeyError(poll_id)
+        return [
+            OptionResult(text, self.cache.get(("poll_votes", poll_id, option_id), 0), event)
+            for option_id, (text, event) in enumerate(
+                zip(poll["options"], poll["events"], strict=True)
+            )
+        ]
+
+    def voter_count(self, poll_id: str) -> int:
+        """Number of people who currently have an answer in a poll."""
+        return self.cache.get(("poll_voters", poll_id), 0)
+
+    def answer_count(self, poll_id: str) -> int:
+        """Number of answers, including changed and retracted ones, recorded for a poll.
+
+        Together with `voter_count` it tells whether anything about a poll's answers changed.
+        """
+        return self.cache.get(("poll_answers", poll_id), 0)
+
+    def voter_ids(self, poll_id: str) -> frozenset[int]:
+        """IDs of everyone who currently has an answer in a poll."""
+        return frozenset(self.voters(poll_id))
+
+    def _slot_count(self, poll_id: str) -> int:
+        count = self.cache.get(("poll_voter_slots", poll_id))
+        if count is None:
+            # Voters of polls registered before voters had slots are looked up once
+            user_ids = sorted(
+                key[2]
+                for key in self.cache.iterkeys()
+                if isinstance(key, tuple) and key[:2] == ("poll_voter", poll_id)
+            )
+            for slot, user_id in enumerate(user_ids):
+                self.cache.set(("poll_voter_slot", poll_id, slot), user_id)
+            count = len(user_ids)
+            self.cache.set(("poll_voter_slots", poll_id), count)
+            self.cache.delete(("poll_voter_ids", poll_id))
+        return count
+
+    def voters(self, poll_id: str) -> dict[int, tuple[int, ...]]:
+        """Current answers of every voter of a poll, keyed by user ID."""
+        voters = {}
+        with self.cache.transact():
+            for slot in range(self._slot_count(poll_id)):
+                user_id = self.cache[("poll_voter_slot", poll_id, slot)]
+                if answer := self.cache.get(("poll_voter", poll_id, user_id)):
+                    voters[user_id] = answer
+        return voters
+
+    @property
+    def update_offset(self) -> int:
+        """The getUpdates offset after the last processed update."""
+        return self.cache.get("update_offset", 0)
+
+    @update_offset.setter
+    def update_offset(self, offset: int) -> None:
+        self.cache.set("update_offset", offset)
+
+
+class PollAnswerCollector:
+    """Long-poll getUpdates for poll answers and apply them to a `PollStore`.
+
+    Subclasses that handle more kinds of updates extend `allowed_updates` accordingly.
+    """
+
+    allowed_updates: tuple[str, ...] = (UpdateType.POLL_ANSWER,)
+
+    def __init__(self, bot: Bot, store: PollStore, poll_timeout: int = 30) -> None:
+        self.bot = bot
+        self.store = store
+        self.poll_timeout = poll_timeout
+
+    async def handle_update(self, update: Update) -> None:
+        """Apply an update to the store if it is an answer to a known poll."""
+        answer = update.poll_answer
+        if answer is None or answer.user is None:
+            return
+        if not self.store.record_answer(answer.poll_id, answer.user.id, answer.option_ids):
+            logger.info("Ignoring an answer to unknown poll %s", answer.poll_id)
+
+    async def collect_once(self) -> int:
+        """Wait for one batch of updates, process it and return its size."""
+        with tracer.span("telegram.getUpdates"):
+            updates = await self.bot.get_updates(
+                offset=self.store.update_offset,
+                timeout=self.poll_timeout,
+                allowed_updates=list(self.allowed_updates),
+            )
+        for update in updates:
+            await self.handle_update(update)
+            # Acknowledge every update, so that it is not received again after a restart
+            self.store.update_offset = update.update_id + 1
+        return len(updates)
+
+    async def run(
+            self,
+            stop: asyncio.Event | None = None,
+            on_batch: Callable[[int], object] | None = None,
+    ) -> None:
+        """Collect answers until ``stop`` is set, riding out network errors and flood control.
+
+        Args:
+        ----
+            stop: Event that ends the collection
+            on_batch: Called with the size of every processed batch of updates
+
+        """
+        stop = stop or asyncio.Event()
+        backoff = 1.0
+        while not stop.is_set():
+            try:
+                count = await self.collect_once()
+                backoff = 1.0
+                if on_batch is not None:
+                    on_batch(count)
+            except RetryAfter as e:
+                await asyncio.sleep(
+                    e.retry_after.total_seconds()
+                    if isinstance(e.retry_after, dt.timedelta)
+                    else e.retry_after
+                )
+            except NetworkError as e:
+                logger.warning("getUpdates failed: %s, retrying in %.0f s", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+
+def format_results(store: PollStore, poll_id: str) -> str:
+    """Describe the current results of a poll as a text table."""
+    results = store.results(poll_id)
+    width = max(len(result.text) for result in results)
+    lines = [f"Poll {poll_id}, {store.voter_count(poll_id)} voters:"]
+    lines += [f"  {result.text:<{width}}  {result.votes:>4}" for result in results]
+    return "\n".join(lines)
+
+
+async def collect(bot: Bot, store: PollStore, archive: EventArchive | None = None) -> None:
+    """Collect answers forever, printing the latest poll's results after every batch.
+
+    The votes of the latest poll are also copied into the event archive, if one is given.
+    """
+
+    def print_results(count: int) -> None:
+        if count and (poll_id := store.latest_poll_id()):
+            print(format_results(store, poll_id))
+            if archive is not None:
+                archive.update_votes(poll_id, store)
+
+    await PollAnswerCollector(bot, store).run(on_batch=print_results)
+
+
+def main() -> None:
+    """Collect poll answers or show the current results from the command line."""
+    from event_archive import EventArchive
+    from kuda_idem_template import cache, make_bot, settings
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--show", action="store_true", help="Only print the current results")
+    parser.add_argument("--poll-id", help="Poll to show, defaults to the latest one")
+    args = parser.parse_args()
+
+    store = PollStore(cache)
+    if args.show:
+        poll_id = args.poll_id or store.latest_poll_id()
+        print(format_results(store, poll_id) if poll_id else "No polls sent yet.")
+        return
+    try:
+        asyncio.run(collect(make_bot(), store, EventArchive(settings.EVENT_ARCHIVE_DIR)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
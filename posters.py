@@ -0,0 +1,241 @@
+"""Attach event posters to the digest as a Telegram media group.
+
+Posters are downsized and recompressed in a process pool, so that decoding and encoding
+images neither blocks the event loop nor competes with it for the GIL. The pool spawns its
+workers rather than forking them, since it is often created from a thread of a process with
+other threads, e.g. the outbox flusher of the GUI. Telegram returns a ``file_id`` for every
+uploaded photo, which is cached by the content hash of the poster file: re-sends and other
+chats reuse the ID and the poster is neither processed nor uploaded again. An ID Telegram no
+longer accepts is dropped and the poster uploaded once more.
+
+Pillow is an optional dependency, install it with the ``posters`` extra.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import multiprocessing
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from diskcache import Cache
+from telegram import Bot, InputMediaPhoto, Message
+from telegram.constants import MediaGroupLimit
+from telegram.error import BadRequest
+
+from tracing import tracer
+
+if TYPE_CHECKING:
+    from kuda_idem_template import Event
+
+# Telegram shows photos at most 1280 pixels wide or high, larger ones are just wasted upload
+MAX_SIDE = 1280
+JPEG_QUALITY = 85
+
+
+def prepare_poster(data: bytes, max_side: int = MAX_SIDE, quality: int = JPEG_QUALITY) -> bytes:
+    """Downsize an image to fit ``max_side`` and recompress it as a JPEG.
+
+    Args:
+    ----
+        data: Content of an image file in any format Pillow reads
+        max_side: Maximal width and height of the result, in pixels
+        quality: JPEG quality of the result
+
+    Returns:
+    -------
+        bytes: JPEG image
+
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError as e:
+        raise ImportError(
+            "Posters need Pillow, install it with `pip install kuda_idem_template[posters]`"
+        ) from e
+
+    with Image.open(io.BytesIO(data)) as image:
+        # Phones store the orientation separately, which is lost once the metadata is dropped
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def poster_hash(data: bytes, max_side: int = MAX_SIDE, quality: int = JPEG_QUALITY) -> str:
+    """Hash a poster file together with the processing settings it is uploaded with."""
+    digest = hashlib.sha256(data)
+    digest.update(f":{max_side}:{quality}".encode())
+    return digest.hexdigest()
+
+
+@dataclass(slots=True)
+class Poster:
+    """A poster to upload, identified by its content hash."""
+
+    content_hash: str
+    caption: str | None
+    data: bytes
+
+
+class PosterUploader:
+    """Process posters in a process pool and upload each one to Telegram only once.
+
+    Use as an async context manager, which owns the process pool.
+
+    Attributes
+    ----------
+        bot: Bot that uploads the posters
+        cache: Disk cache for the ``file_id`` of every uploaded poster
+        max_side: Maximal width and height of uploaded posters, in pixels
+        quality: JPEG quality of uploaded posters
+        stats: Counts of uploaded posters and of posters sent by a cached ``file_id``
+
+    """
+
+    def __init__(
+            self,
+            bot: Bot,
+            cache: Cache,
+            max_workers: int | None = None,
+            max_side: int = MAX_SIDE,
+            quality: int = JPEG_QUALITY,
+    ) -> None:
+        self.bot = bot
+        self.cache = cache
+        self.max_side = max_side
+        self.quality = quality
+        self.stats = {"uploaded": 0, "reused": 0}
+        self._max_workers = max_workers
+        self._pool: ProcessPoolExecutor | None = None
+
+    async def __aenter__(self) -> PosterUploader:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def file_id(self, content_hash: str) -> str | None:
+        """The ``file_id`` of an already uploaded poster."""
+        return self.cache.get(("poster", content_hash))
+
+    async def send_posters(
+            self,
+            chat_id: int,
+            posters: Sequence[tuple[Path, str | None]],
+            message_thread_id: int | None = None,
+    ) -> list[Message]:
+        """Send posters as media groups, processing and uploading only unknown ones.
+
+        Args:
+        ----
+            chat_id: Chat to send the posters to
+            posters: Poster files with their captions, the same file is sent once
+            message_thread_id: Topic to send the posters to
+
+        Returns:
+        -------
+            list[Message]: Sent messages, one per poster
+
+        """
+        unique: dict[str, Poster] = {}
+        for path, caption in posters:
+            data = path.read_bytes()
+            key = poster_hash(data, self.max_side, self.quality)
+            unique.setdefault(key, Poster(key, caption, data))
+
+        media = await self._prepare_media(list(unique.values()))
+        sent: list[Message] = []
+        group_size = MediaGroupLimit.MAX_MEDIA_LENGTH
+        for start in range(0, len(media), group_size):
+            group = media[start:start + group_size]
+            try:
+                messages = await self._send_group(chat_id, group, message_thread_id)
+            except BadRequest:
+                # A cached file_id may have expired: upload those posters again, once
+                stale = [unique[key] for key, photo in group if isinstance(photo.media, str)]
+                if not stale:
+                    raise
+                for poster in stale:
+                    self.cache.delete(("poster", poster.content_hash))
+                self.stats["reused"] -= len(stale)
+                uploads = dict(await self._prepare_media(stale))
+                group = [(key, uploads.get(key, photo)) for key, photo in group]
+                messages = await self._send_group(chat_id, group, message_thread_id)
+            for (content_hash, _), message in zip(group, messages, strict=True):
+                if message.photo and self.file_id(content_hash) is None:
+                    # The largest size is the uploaded image itself
+                    self.cache.set(("poster", content_hash), message.photo[-1].file_id)
+            sent.extend(messages)
+        return sent
+
+    async def _send_group(
+            self,
+            chat_id: int,
+            group: Sequence[tuple[str, InputMediaPhoto]],
+            message_thread_id: int | None,
+    ) -> Sequence[Message]:
+        with tracer.span("telegram.sendMediaGroup", photos=len(group)):
+            if len(group) == 1:
+                # Media groups need at least two items
+                ((_, photo),) = group
+                return [
+                    await self.bot.send_photo(
+                        chat_id,
+                        photo.media,
+                        caption=photo.caption,
+                        message_thread_id=message_thread_id,
+                    )
+                ]
+            return await self.bot.send_media_group(
+                chat_id,
+                [photo for _, photo in group],
+                message_thread_id=message_thread_id,
+            )
+
+    async def _prepare_media(self, posters: list[Poster]) -> list[tuple[str, InputMediaPhoto]]:
+        loop = asyncio.get_running_loop()
+        pending = [poster for poster in posters if self.file_id(poster.content_hash) is None]
+        if pending:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    self._max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            with tracer.span("posters.prepare", posters=len(pending)):
+                processed = await asyncio.gather(*(
+                    loop.run_in_executor(
+                        self._pool, prepare_poster, poster.data, self.max_side, self.quality
+                    )
+                    for poster in pending
+                ))
+            uploads = {
+                poster.content_hash: data for poster, data in zip(pending, processed, strict=True)
+            }
+        else:
+            uploads = {}
+
+        media = []
+        for poster in posters:
+            upload = uploads.get(poster.content_hash)
+            self.stats["uploaded" if upload is not None else "reused"] += 1
+            photo = InputMediaPhoto(
+                upload if upload is not None else self.file_id(poster.content_hash),
+                caption=poster.caption,
+            )
+            media.append((poster.content_hash, photo))
+        return media
+
+
+def event_posters(events: Sequence[Event]) -> list[tuple[Path, str | None]]:
+    """Poster files of the events that have one, captioned with the event titles."""
+    return [(event.poster, event.title) for event in events if event.poster is not None]
@@ -0,0 +1,183 @@
+"""Capture cProfile and tracemalloc data for a whole run or for a chosen operation.
+
+Both entry points accept ``--profile [OPERATION]``. Every capture writes three files to the
+profile directory: a sorted text report (``.txt``), raw cProfile stats for ``pstats`` or
+snakeviz (``.prof``) and a raw tracemalloc snapshot (``.tracemalloc``).
+"""
+
+from __future__ import annotations
+
+import argparse
+import cProfile
+import datetime as dt
+import functools
+import inspect
+import io
+import pstats
+import time
+import tracemalloc
+from collections.abc import Callable, Sequence
+from pathlib import Path
+from typing import Any
+
+# Profile the whole run rather than a single operation
+SESSION = "session"
+# Number of frames kept per allocation, more frames make tracemalloc slower
+TRACEMALLOC_FRAMES = 10
+
+
+class Profiler:
+    """Profile CPU time with cProfile and memory allocations with tracemalloc.
+
+    Use `start` and `stop`, the profiler as a context manager, or `wrap` a function to profile
+    each of its calls. Captures don't nest: calls made while a capture is running are included
+    in it instead.
+    """
+
+    def __init__(
+            self,
+            label: str,
+            output_dir: Path = Path("profiles"),
+            top: int = 40,
+            sort: Sequence[str] = ("cumulative", "tottime"),
+    ) -> None:
+        self.label = label
+        self.output_dir = output_dir
+        self.top = top
+        self.sort = sort
+        self.reports: list[Path] = []
+        self._profile: cProfile.Profile | None = None
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._started_tracemalloc = False
+        self._started_at = 0.0
+
+    @property
+    def active(self) -> bool:
+        """Whether a capture is running."""
+        return self._profile is not None
+
+    def start(self) -> None:
+        """Start a capture."""
+        if self.active:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._snapshot = tracemalloc.take_snapshot()
+        self._started_at = time.perf_counter()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self) -> Path | None:
+        """Stop the capture, write its files and return the path of the text report."""
+        if self._profile is None:
+            return None
+        self._profile.disable()
+        elapsed = time.perf_counter() - self._started_at
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = dt.datetime.now().strftime("%Y%m%d-%H%M%S")
+        stem = self.output_dir / f"{self.label}-{timestamp}-{len(self.reports) + 1}"
+        self._profile.dump_stats(stem.with_suffix(".prof"))
+        snapshot.dump(str(stem.with_suffix(".tracemalloc")))
+
+        report_path = stem.with_suffix(".txt")
+        report_path.write_text(
+            self._report(self._profile, snapshot, elapsed, peak), encoding="utf-8"
+        )
+        self.reports.append(report_path)
+        self._profile = None
+        self._snapshot = None
+        return report_path
+
+    def __enter__(self) -> Profiler:
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    def wrap(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Return a wrapper of a sync or async function that captures each outermost call."""
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if self.active:
+                    return await func(*args, **kwargs)
+                self.start()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.stop()
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if self.active:
+                return func(*args, **kwargs)
+            self.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.stop()
+
+        return wrapper
+
+    def _report(
+            self,
+            profile: cProfile.Profile,
+            snapshot: tracemalloc.Snapshot,
+            elapsed: float,
+            peak: int,
+    ) -> str:
+        out = io.StringIO()
+        out.write(f"Profile of {self.label!r}: {elapsed:.3f} s wall time, ")
+        out.write(f"{peak / 2**20:.1f} MiB peak traced memory\n")
+
+        stats = pstats.Stats(profile, stream=out)
+        for key in self.sort:
+            out.write(f"\n{'=' * 30} CPU, top {self.top} by {key} {'=' * 30}\n")
+            stats.sort_stats(key).print_stats(self.top)
+
+        out.write(f"\n{'=' * 30} Memory, top {self.top} allocations since start {'=' * 30}\n")
+        ignored = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        )
+        assert self._snapshot is not None
+        differences = snapshot.filter_traces(ignored).compare_to(
+            self._snapshot.filter_traces(ignored), "lineno"
+        )
+        for difference in differences[:self.top]:
+            out.write(f"{difference}\n")
+        return out.getvalue()
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser, operations: Sequence[str]) -> None:
+    """Add the ``--profile`` and ``--profile-dir`` options to a command line parser."""
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=SESSION,
+        choices=(SESSION, *operations),
+        help=f"Profile the whole run or one operation (default: {SESSION})",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=Path,
+        default=Path("profiles"),
+        help="Directory for profile reports (default: %(default)s)",
+    )
+
+
+def wrap_operation(owner: object, name: str, profiler: Profiler) -> None:
+    """Profile each outermost call of ``owner.name``, a module-level function or a method."""
+    setattr(owner, name, profiler.wrap(getattr(owner, name)))
@@ -0,0 +1,408 @@
+"""Publish the digest to several channels at once: Telegram, Discord, email and a file.
+
+The page is rendered once with `generate_event_page`. Every sink turns it into its own
+deliveries, e.g. Telegram HTML chunks or Discord Markdown messages, and hands them to its own
+queue. The queues are drained concurrently, each by a worker that keeps to the sink's rate
+limit and waits out the back-off the service asks for, so a slow or failing channel delays
+and breaks no other one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import html
+import re
+import smtplib
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from dataclasses import dataclass
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Any
+
+import httpx
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from kuda_idem_template import (
+    Event,
+    content_hash,
+    generate_event_page,
+    make_bot,
+    remember_published_digest,
+    send_digest_chunk,
+    send_event_poll,
+    send_event_posters,
+    settings,
+    split_html_message,
+)
+from tracing import tracer
+
+# Discord rejects messages longer than this
+DISCORD_MAX_LENGTH = 2000
+# Retries of a single delivery the service asked to retry later
+MAX_RETRIES = 5
+
+_TAG = re.compile(r"<[^>]+>")
+_OTHER_TAG = re.compile(r"<(?!/?a[\s>])[^>]+>")
+_LINK = re.compile(r'<a href="([^"]*)">(.*?)</a>', re.DOTALL)
+_SPACE_BEFORE_NEWLINE = re.compile(r"[ \t]+\n")
+
+
+class RetryLater(Exception):
+    """Raised by a sink when the service asks to repeat a delivery after a while."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Retry after {retry_after} s")
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Space out calls to at most ``rate`` per second, no limit if ``rate`` is None."""
+
+    def __init__(self, rate: float | None) -> None:
+        self.interval = 1 / rate if rate else 0.0
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        """Wait until the next call is allowed."""
+        now = time.monotonic()
+        delay = self._next - now
+        self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def html_to_text(page: str) -> str:
+    """Strip the Telegram HTML markup from a rendered page, keeping link targets."""
+    text = page.replace('<meta charset="UTF-8">', "")
+    text = _LINK.sub(lambda m: f"{m.group(2)} ({m.group(1)})", text)
+    return _SPACE_BEFORE_NEWLINE.sub("\n", html.unescape(_TAG.sub("", text))).strip()
+
+
+def html_to_markdown(page: str) -> str:
+    """Convert the Telegram HTML markup of a rendered page to Discord Markdown."""
+    text = page.replace('<meta charset="UTF-8">', "")
+    for tag, mark in (("b", "**"), ("i", "*")):
+        text = text.replace(f"<{tag}>", mark).replace(f"</{tag}>", mark)
+    # Angle brackets around the target keep Discord from embedding a preview of every link
+    text = _LINK.sub(lambda m: f"[{m.group(2)}](<{m.group(1)}>)", _OTHER_TAG.sub("", text))
+    return _SPACE_BEFORE_NEWLINE.sub("\n", html.unescape(text)).strip()
+
+
+class Sink(ABC):
+    """A channel the digest is published to.
+
+    Subclasses render the page into deliveries and deliver them one at a time. Deliveries
+    are made in order by a single worker, at most ``rate`` per second.
+
+    Attributes
+    ----------
+        name: Name of the channel in results and traces
+        rate: Deliveries per second at most, None for no limit
+
+    """
+
+    name: str = "sink"
+    rate: float | None = None
+
+    @abstractmethod
+    def render(self, page: str, events: Sequence[Event]) -> list[Any]:
+        """Turn the rendered page into the deliveries of this sink."""
+
+    @abstractmethod
+    async def deliver(self, item: Any) -> None:
+        """Deliver a single item, raising `RetryLater` if the service asks for it."""
+
+    async def open(self, events: Sequence[Event]) -> None:
+        """Prepare the channel before the first delivery."""
+
+    async def close(self, events: Sequence[Event]) -> None:
+        """Finish publishing after all items were delivered."""
+
+    async def release(self) -> None:
+        """Free the resources of the sink, whether publishing succeeded or not."""
+
+    def for_digest(self, name: str) -> Sink:
+        """The sink one of several digests published in a run is delivered to, by its name.
+
+        Channels that hold a single digest, like a file, return a sink of their own per digest.
+        """
+        return self
+
+
+class TelegramSink(Sink):
+    """Send the digest to the configured topic with posters and a poll."""
+
+    name = "telegram"
+
+    def __init__(self, bot: Bot | None = None, rate: float | None = 1.0, digest: str = "") -> None:
+        self.bot = bot or make_bot()
+        self.rate = rate
+        self.digest = digest
+        self._published: list[dict[str, Any]] = []
+
+    def render(self, page: str, events: Sequence[Event]) -> list[str]:
+        return split_html_message(page.replace('<meta charset="UTF-8">', ""))
+
+    async def open(self, events: Sequence[Event]) -> None:
+        self._published = []
+        await send_event_posters(self.bot, events)
+
+    async def deliver(self, item: str) -> None:
+        try:
+            message = await send_digest_chunk(self.bot, item)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            raise RetryLater(
+                retry_after.total_seconds()
+                if isinstance(retry_after, dt.timedelta)
+                else retry_after
+            ) from e
+        self._published.append({"message_id": message.message_id, "hash": content_hash(item)})
+
+    async def close(self, events: Sequence[Event]) -> None:
+        remember_published_digest(self._published, events, name=self.digest)
+        await send_event_poll(self.bot, events)
+
+    def for_digest(self, name: str) -> Sink:
+        # Remembered under its name, so digests of one run don't replace each other
+        return TelegramSink(self.bot, self.rate, name)
+
+
+class DiscordWebhookSink(Sink):
+    """Post the digest as Markdown messages to a Discord-style webhook."""
+
+    name = "discord"
+
+    def __init__(self, url: str, rate: float | None = 1.0, timeout: float = 10.0) -> None:
+        self.url = url
+        self.rate = rate
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+
+    def render(self, page: str, events: Sequence[Event]) -> list[str]:
+        return split_html_message(html_to_markdown(page), limit=DISCORD_MAX_LENGTH)
+
+    async def open(self, events: Sequence[Event]) -> None:
+        self._client = httpx.AsyncClient(timeout=self.timeout)
+
+    async def deliver(self, item: str) -> None:
+        assert self._client is not None
+        response = await self._client.post(
+            self.url, json={"content": item, "allowed_mentions": {"parse": []}}
+        )
+        if response.status_code == httpx.codes.TOO_MANY_REQUESTS:
+            raise RetryLater(float(response.json().get("retry_after", 1)))
+        response.raise_for_status()
+
+    async def release(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class EmailSink(Sink):
+    """Mail the digest as HTML with a plain text alternative over SMTP.
+
+    smtplib blocks, so the message is sent from a worker thread.
+    """
+
+    name = "email"
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            sender: str,
+            recipients: Sequence[str],
+            username: str | None = None,
+            password: str | None = None,
+            starttls: bool = True,
+            timeout: float = 30.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def render(self, page: str, events: Sequence[Event]) -> list[EmailMessage]:
+        text = html_to_text(page)
+        message = EmailMessage()
+        message["Subject"] = text.splitlines()[0].rstrip(":")
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content(text)
+        body = page.replace('<meta charset="UTF-8">', "").strip().replace("\n", "<br>\n")
+        message.add_alternative(
+            f'<html><head><meta charset="UTF-8"></head><body>{body}</body></html>',
+            subtype="html",
+        )
+        return [message]
+
+    async def deliver(self, item: EmailMessage) -> None:
+        await asyncio.to_thread(self._send, item)
+
+    def _send(self, message: EmailMessage) -> None:
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username is not None and self.password is not None:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+class FileSink(Sink):
+    """Write the page to a file, replacing it atomically."""
+
+    name = "file"
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def render(self, page: str, events: Sequence[Event]) -> list[str]:
+        return [page]
+
+    def for_digest(self, name: str) -> FileSink:
+        return FileSink(self.path.with_stem(f"{self.path.stem}-{name}"))
+
+    async def deliver(self, item: str) -> None:
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        temporary.write_text(item, encoding="utf-8")
+        temporary.replace(self.path)
+
+
+@dataclass(slots=True)
+class SinkResult:
+    """Outcome of publishing to a sink."""
+
+    name: str
+    delivered: int
+    total: int
+    duration: float
+    error: BaseException | None = None
+
+    @property
+    def ok(self) -> bool:
+        """Whether everything was delivered."""
+        return self.error is None
+
+
+async def deliver_item(sink: Sink, item: Any, limiter: RateLimiter) -> None:
+    """Deliver an item within the rate limit, retrying while the service asks to."""
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.wait()
+        try:
+            await sink.deliver(item)
+            return
+        except RetryLater as e:
+            if attempt == MAX_RETRIES:
+                raise
+            await asyncio.sleep(e.retry_after)
+
+
+async def _run_sink(
+        sink: Sink, page: str, events: Sequence[Event], queue_size: int
+) -> SinkResult:
+    started = time.perf_counter()
+    queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=queue_size)
+    limiter = RateLimiter(sink.rate)
+    delivered = total = 0
+    done = object()
+
+    async def produce() -> None:
+        nonlocal total
+        try:
+            for item in sink.render(page, events):
+                total += 1
+                await queue.put(item)
+        except Exception:
+            # Stop the worker, which would wait for more items forever, and fail the sink below
+            await queue.put(done)
+            raise
+        await queue.put(done)
+
+    async def consume() -> None:
+        nonlocal delivered
+        while (item := await queue.get()) is not done:
+            await deliver_item(sink, item, limiter)
+            delivered += 1
+
+    with tracer.span("publish.sink", sink=sink.name):
+        try:
+            await sink.open(events)
+            producer = asyncio.create_task(produce())
+            try:
+                await consume()
+            finally:
+                producer.cancel()
+            # The worker got to the end of the items, raise the error that ended them early
+            await producer
+            await sink.close(events)
+        except Exception as e:
+            return SinkResult(sink.name, delivered, total, time.perf_counter() - started, e)
+        finally:
+            await sink.release()
+    return SinkResult(sink.name, delivered, total, time.perf_counter() - started)
+
+
+async def publish(
+        events: Sequence[Event],
+        sinks: Sequence[Sink],
+        queue_size: int = 16,
+) -> list[SinkResult]:
+    """Render the digest once and publish it to all sinks concurrently.
+
+    Args:
+    ----
+        events: Events of the digest
+        sinks: Channels to publish to
+        queue_size: Deliveries rendered ahead of a sink's worker at most
+
+    Returns:
+    -------
+        list[SinkResult]: Outcome per sink, in the order of ``sinks``
+
+    """
+    page = generate_event_page(events)
+    return await asyncio.gather(*(_run_sink(sink, page, events, queue_size) for sink in sinks))
+
+
+def configured_sinks() -> list[Sink]:
+    """Create the sinks enabled in the settings, Telegram always among them."""
+    sinks: list[Sink] = [TelegramSink()]
+    if settings.DISCORD_WEBHOOK_URL:
+        sinks.append(DiscordWebhookSink(settings.DISCORD_WEBHOOK_URL))
+    if settings.SMTP_HOST and settings.EMAIL_FROM and settings.EMAIL_TO:
+        sinks.append(
+            EmailSink(
+                settings.SMTP_HOST,
+                settings.SMTP_PORT,
+                settings.EMAIL_FROM,
+                settings.EMAIL_TO,
+                username=settings.SMTP_USERNAME,
+                password=(
+                    settings.SMTP_PASSWORD.get_secret_value() if settings.SMTP_PASSWORD else None
+                ),
+                starttls=settings.SMTP_STARTTLS,
+            )
+        )
+    if settings.PUBLISH_FILE_PATH:
+        sinks.append(FileSink(settings.PUBLISH_FILE_PATH))
+    return sinks
+
+
+def describe_results(results: Sequence[SinkResult]) -> str:
+    """Describe the outcome per sink for a human."""
+    return "\n".join(
+        f"{result.name}: {result.delivered}/{result.total} delivered in {result.duration:.2f} s"
+        + (f", failed: {result.error!r}" if result.error is not None else "")
+        for result in results
+    )
+
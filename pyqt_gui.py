@@ -2,20 +2,24 @@
 
 from __future__ import annotations
 
+import argparse
 import asyncio
 import datetime as dt
 import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 
-from diskcache import Cache
-from PyQt6.QtCore import QDate, QDateTime, Qt, QTime
-from PyQt6.QtGui import QIcon
+from PyQt6.QtCore import QDate, QDateTime, QStringListModel, Qt, QTime, QTimer
+from PyQt6.QtGui import QIcon, QKeySequence, QShortcut
 from PyQt6.QtWidgets import (
     QApplication,
     QCalendarWidget,
     QComboBox,
+    QCompleter,
     QDateEdit,
     QDialog,
+    QFileDialog,
     QFormLayout,
     QGridLayout,
     QGroupBox,
@@ -33,7 +37,31 @@ from PyQt6.QtWidgets import (
     QWidget,
 )
 
-from kuda_idem_template import Event, get_friday_and_sunday, send_html_message
+from archive_site import ArchiveStore
+from event_conflicts import find_conflicts
+from event_enrichment import enrich_links, missing_fields
+from event_search import EventSearchIndex, shift_to_weekend
+from gui_watchdog import EventLoopWatchdog, StallDebugDialog
+from kuda_idem_template import (
+    Event,
+    cache,
+    events_timezone,
+    get_friday_and_sunday,
+    load_published_events,
+    settings,
+)
+from link_checker import describe_broken_links, find_broken_links
+from outbox import Outbox, OutboxFlusher
+from profiling import SESSION, Profiler, add_profile_arguments, wrap_operation
+from recurrence import (
+    Frequency,
+    Recurrence,
+    RecurringEvent,
+    RecurringEventStore,
+    recurring_name,
+    weekend_window,
+)
+from tracing import tracer
 
 
 @dataclass(slots=True)
@@ -208,7 +236,6 @@ VENUES: dict[str, VenueInfo] = {
         ticket_link="https://worm.stager.co/web/tickets",
     ),
 }
-cache = Cache("event_cache")
 
 
 class RequiredLabel(QLabel):
@@ -403,6 +430,16 @@ class EventInputWindow(QMainWindow):
         self.venue_map_link = QLineEdit()
         self.ticket_link = QLineEdit()
         self.ticket_info = QLineEdit()
+        self.poster = QLineEdit()
+        # Recurrence rules the event can be saved with, e.g. for residencies
+        self.repeat = QComboBox()
+        self.repeat.addItem("Does not repeat", None)
+        self.repeat.addItem("Every week", Recurrence())
+        self.repeat.addItem("Every other week", Recurrence(interval=2))
+        self.repeat.addItem("Same weekday every month", Recurrence(frequency=Frequency.MONTHLY))
+        self.repeat.addItem(
+            "Last weekday of every month", Recurrence(frequency=Frequency.MONTHLY, nth=-1)
+        )
 
         # Add placeholder texts for mandatory fields
 
@@ -419,6 +456,7 @@ class EventInputWindow(QMainWindow):
         self.title_link.setPlaceholderText("Optional - URL to event details")
         self.description.setPlaceholderText("Optional - Event description")
         self.ticket_link.setPlaceholderText("Optional - URL to purchase tickets")
+        self.poster.setPlaceholderText("Optional - Image sent along with the digest")
         self.ticket_info.setPlaceholderText(
             "Optional - Default: 'Билет не нужен.', displays only if the ticket URL is missing"
         )
@@ -426,15 +464,44 @@ class EventInputWindow(QMainWindow):
         # Add fields to form layout with required indicators
         form_layout.addRow(RequiredLabel("City", required=True), self.city)
         form_layout.addRow(RequiredLabel("Title", required=True), self.title)
-        form_layout.addRow(RequiredLabel("Title Link"), self.title_link)  # optional
+        # The title link can fill in the other fields from the promoter page
+        self.fill_button = QPushButton("Fill")
+        self.fill_button.setToolTip("Fill empty fields from the page behind the title link")
+        self.fill_button.clicked.connect(self.fill_from_title_link)
+        title_link_layout = QHBoxLayout()
+        title_link_layout.addWidget(self.title_link)
+        title_link_layout.addWidget(self.fill_button)
+        form_layout.addRow(RequiredLabel("Title Link"), title_link_layout)  # optional
         form_layout.addRow(RequiredLabel("Description"), self.description)  # optional
         form_layout.addRow(RequiredLabel("Start DateTime", required=True), self.start_datetime)
         form_layout.addRow(RequiredLabel("End DateTime", required=True), self.end_datetime)
+        form_layout.addRow(RequiredLabel("Repeat"), self.repeat)  # optional
         form_layout.addRow(RequiredLabel("Venue Name", required=True), self.venue_name)
         form_layout.addRow(RequiredLabel("Venue Address", required=True), self.venue_address)
         form_layout.addRow(RequiredLabel("Venue Map Link", required=True), self.venue_map_link)
         form_layout.addRow(RequiredLabel("Ticket Link"), self.ticket_link)  # optional
         form_layout.addRow(RequiredLabel("Ticket Info"), self.ticket_info)  # optional
+        self.poster_button = QPushButton("Browse")
+        self.poster_button.clicked.connect(self.choose_poster)
+        poster_layout = QHBoxLayout()
+        poster_layout.addWidget(self.poster)
+        poster_layout.addWidget(self.poster_button)
+        form_layout.addRow(RequiredLabel("Poster"), poster_layout)  # optional
+
+        # Suggest past events while the title is typed, picking one fills in the form
+        self.search_index = EventSearchIndex(settings.SEARCH_INDEX_PATH)
+        self.suggestions: dict[str, Event] = {}
+        self.title_completer = QCompleter(QStringListModel(self), self)
+        self.title_completer.setWidget(self.title)
+        self.title_completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.title_completer.activated.connect(self.fill_from_past_event)
+        # Search once typing pauses rather than on every key
+        self.suggest_timer = QTimer(self)
+        self.suggest_timer.setSingleShot(True)
+        self.suggest_timer.setInterval(150)
+        self.suggest_timer.timeout.connect(self.suggest_past_events)
+        self.title.textEdited.connect(self.suggest_timer.start)
+        self.index_past_events()
 
         # Style required fields
         required_fields = [
@@ -496,7 +563,7 @@ class EventInputWindow(QMainWindow):
                 background-color: #5A6268;
             }
         """)
-        self.view_events_button.clicked.connect(self.show_events)
+        self.view_events_button.clicked.connect(lambda: self.show_events())
         button_layout.addWidget(self.view_events_button)
 
         # Add save events button
@@ -533,18 +600,55 @@ class EventInputWindow(QMainWindow):
                 background-color: #1E7E34;
             }
         """)
-        self.send_telegram_button.clicked.connect(self.send_to_telegram)
+        self.send_telegram_button.clicked.connect(lambda: self.send_to_telegram())
         button_layout.addWidget(self.send_telegram_button)
 
+        # Add update published digest button
+        self.update_telegram_button = QPushButton("Update in Telegram")
+        self.update_telegram_button.setStyleSheet("""
+            QPushButton {
+                background-color: #17A2B8;
+                color: white;
+                border: none;
+                padding: 8px 16px;
+                border-radius: 4px;
+            }
+            QPushButton:hover {
+                background-color: #138496;
+            }
+            QPushButton:pressed {
+                background-color: #117A8B;
+            }
+        """)
+        self.update_telegram_button.clicked.connect(self.update_in_telegram)
+        button_layout.addWidget(self.update_telegram_button)
+
         # Add button layout to main layout
         layout.addLayout(button_layout)
 
+        # Slow work, such as checking links, runs in a thread so the window stays responsive
+        self.worker = ThreadPoolExecutor(1, thread_name_prefix="gui-worker")
+
+        # Digests are queued and delivered in the background, whatever the network does
+        self.outbox = Outbox(cache)
+        self.outbox_flusher = OutboxFlusher(self.outbox)
+        self.outbox_flusher.start()
+        self.outbox_label = QLabel()
+        self.outbox_label.setStyleSheet("color: #555555; padding: 5px;")
+        layout.addWidget(self.outbox_label)
+        self.outbox_timer = QTimer(self)
+        self.outbox_timer.setInterval(1000)
+        self.outbox_timer.timeout.connect(self.update_outbox_status)
+        self.outbox_timer.start()
+        self.update_outbox_status()
+
         # Initialize events list
         self.events = []
         self.events_saved = True
 
-        # Check for saved events
+        # Check for saved events, then for recurring ones taking place this weekend
         self.check_saved_events()
+        self.check_recurring_events()
 
         # Create the venue combo box with proper styling
         self.venue_combo = QComboBox()
@@ -616,21 +720,25 @@ class EventInputWindow(QMainWindow):
 
     def save_events_to_cache(self):
         """Save events to disk cache."""
-        events_data = [event.model_dump(mode="python") for event in self.events]
-        cache.set('events', events_data)
+        with tracer.span("cache.save", events=len(self.events)):
+            events_data = [event.model_dump(mode="python") for event in self.events]
+            cache.set('events', events_data)
         self.events_saved = True
         self.events.clear()  # Clear events after saving
 
     def load_saved_events(self):
         """Load events from disk cache."""
-        events_data = cache.get('events', [])
-        for event_data in events_data:
-            self.events.append(Event(**event_data))
+        with tracer.span("cache.load"):
+            events_data = cache.get('events', [])
+        with tracer.span("events.validate", events=len(events_data)):
+            for event_data in events_data:
+                self.events.append(Event(**event_data))
         self.events_saved = True
 
     def clear_cached_events(self):
         """Clear events from disk cache."""
-        cache.delete('events')
+        with tracer.span("cache.delete"):
+            cache.delete('events')
 
     def save_events(self):
         """Handle saving events."""
@@ -782,6 +890,110 @@ class EventInputWindow(QMainWindow):
 
         return True, ""
 
+    def fill_from_title_link(self):
+        """Fill empty fields with the event metadata of the page behind the title link."""
+        url = self.title_link.text().strip()
+        if not url.startswith(("http://", "https://")):
+            msg = self.create_message_box(
+                QMessageBox.Icon.Warning,
+                "Validation Error",
+                "Title Link must be a valid URL starting with http:// or https://",
+            )
+            msg.exec()
+            return
+
+        self.fill_button.setEnabled(False)
+        self.fill_button.setText("Loading...")
+        QApplication.processEvents()
+        try:
+            (draft,) = asyncio.run(enrich_links([url], cache))
+        finally:
+            self.fill_button.setText("Fill")
+            self.fill_button.setEnabled(True)
+        if isinstance(draft, Exception):
+            msg = self.create_message_box(
+                QMessageBox.Icon.Critical, "Error", f"Failed to load the page: {draft}"
+            )
+            msg.exec()
+            return
+
+        text_fields = {
+            "city": self.city,
+            "title": self.title,
+            "venue_name": self.venue_name,
+            "venue_address": self.venue_address,
+            "ticket_link": self.ticket_link,
+        }
+        filled = [name for name, widget in text_fields.items() if widget.text().strip()]
+        if self.description.toPlainText().strip():
+            filled.append("description")
+        for name, value in missing_fields(draft, filled).items():
+            if name in text_fields:
+                text_fields[name].setText(str(value))
+            elif name == "description":
+                self.description.setPlainText(str(value))
+            elif name in ("start_datetime", "end_datetime"):
+                # The pickers always hold a value, so a time from the page replaces the default.
+                # They show times in the zone of the events, not of the machine the GUI runs on.
+                if value.tzinfo is not None:
+                    value = value.astimezone(events_timezone()).replace(tzinfo=None)
+                getattr(self, name).setDateTime(QDateTime(value))
+
+    def index_past_events(self):
+        """Add the archived digests published since the last start to the search index.
+
+        The sync runs in a thread with a connection of its own, so the window can be used,
+        with the suggestions indexed so far, while a long archive is indexed.
+        """
+
+        def sync():
+            index = EventSearchIndex(settings.SEARCH_INDEX_PATH)
+            try:
+                with tracer.span("search.sync"):
+                    index.sync_archive(ArchiveStore(cache))
+            finally:
+                index.close()
+
+        threading.Thread(target=sync, name="search-sync", daemon=True).start()
+
+    def suggest_past_events(self):
+        """Show the past events matching the typed title."""
+        self.suggestions = {
+            f"{event.title} — {event.venue_name}, {event.city}": event
+            for event in self.search_index.search(self.title.text())
+        }
+        self.title_completer.model().setStringList(list(self.suggestions))
+        if self.suggestions:
+            self.title_completer.complete()
+        else:
+            self.title_completer.popup().hide()
+
+    def fill_from_past_event(self, suggestion: str):
+        """Fill the form with a past event, moved to the current weekend."""
+        event = self.suggestions.get(suggestion)
+        if event is None:
+            return
+        event = shift_to_weekend(event)
+        self.city.setText(event.city)
+        self.title.setText(event.title)
+        self.title_link.setText(event.title_link or "")
+        self.description.setPlainText(event.description or "")
+        self.start_datetime.setDateTime(QDateTime(event.start_datetime))
+        self.end_datetime.setDateTime(QDateTime(event.end_datetime))
+        self.venue_name.setText(event.venue_name)
+        self.venue_address.setText(event.venue_address)
+        self.venue_map_link.setText(event.venue_map_link)
+        self.ticket_link.setText(event.ticket_link or "")
+        self.ticket_info.setText(event.ticket_info or "")
+
+    def choose_poster(self):
+        """Pick the poster image of the event."""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Choose Poster", "", "Images (*.png *.jpg *.jpeg *.webp)"
+        )
+        if path:
+            self.poster.setText(path)
+
     def submit_event(self):
         """Handle event submission."""
         # First validate the form
@@ -791,22 +1003,29 @@ class EventInputWindow(QMainWindow):
 
         try:
             # Create the event
-            event = Event(
-                city=self.city.text().strip(),
-                title=self.title.text().strip(),
-                title_link=self.title_link.text().strip() or None,
-                description=self.description.toPlainText().strip() or None,
-                start_datetime=self.start_datetime.dateTime().toPyDateTime(),
-                end_datetime=self.end_datetime.dateTime().toPyDateTime(),
-                venue_name=self.venue_name.text().strip(),
-                venue_address=self.venue_address.text().strip(),
-                venue_map_link=self.venue_map_link.text().strip(),
-                ticket_link=self.ticket_link.text().strip() or None,
-                ticket_info=self.ticket_info.text().strip() or None,
-            )
+            with tracer.span("events.validate", events=1):
+                event = Event(
+                    city=self.city.text().strip(),
+                    title=self.title.text().strip(),
+                    title_link=self.title_link.text().strip() or None,
+                    description=self.description.toPlainText().strip() or None,
+                    start_datetime=self.start_datetime.dateTime().toPyDateTime(),
+                    end_datetime=self.end_datetime.dateTime().toPyDateTime(),
+                    venue_name=self.venue_name.text().strip(),
+                    venue_address=self.venue_address.text().strip(),
+                    venue_map_link=self.venue_map_link.text().strip(),
+                    ticket_link=self.ticket_link.text().strip() or None,
+                    ticket_info=self.ticket_info.text().strip() or None,
+                    poster=self.poster.text().strip() or None,
+                )
 
-            # Add event to the list
+            # Add event to the list, and to the suggestions of later sessions
             self.events.append(event)
+            self.search_index.add([event])
+            if (rule := self.repeat.currentData()) is not None:
+                RecurringEventStore(cache).set(
+                    recurring_name(event), RecurringEvent(event=event, rule=rule)
+                )
             self.events_saved = False
 
             # Show success message
@@ -841,6 +1060,18 @@ class EventInputWindow(QMainWindow):
 
         layout = QVBoxLayout(dialog)
 
+        # Warn about duplicates and clashes at the same venue
+        conflicts = find_conflicts(self.events)
+        if conflicts:
+            conflicts_label = QLabel(
+                "\n".join(conflict.describe(self.events) for conflict in conflicts)
+            )
+            conflicts_label.setWordWrap(True)
+            conflicts_label.setStyleSheet(
+                "color: #856404; background-color: #FFF3CD; padding: 8px; border-radius: 4px;"
+            )
+            layout.addWidget(conflicts_label)
+
         # Create a widget to hold all events
         events_widget = QWidget()
         events_layout = QVBoxLayout(events_widget)
@@ -1007,6 +1238,8 @@ class EventInputWindow(QMainWindow):
         self.venue_map_link.clear()
         self.ticket_link.clear()
         self.ticket_info.clear()
+        self.poster.clear()
+        self.repeat.setCurrentIndex(0)
 
         # Get the next Friday and Sunday
         friday, sunday = get_friday_and_sunday(dt.datetime.now())
@@ -1026,49 +1259,145 @@ class EventInputWindow(QMainWindow):
         self.venue_combo.setCurrentIndex(0)  # Reset to "Select Venue"
 
     def send_to_telegram(self):
-        """Send events to Telegram and exit."""
+        """Queue the events to be sent to Telegram in the background."""
         if not self.events:
             msg = self.create_message_box(QMessageBox.Icon.Warning, "Warning", "No events to send!")
             msg.exec()
             return
 
+        conflicts = find_conflicts(self.events)
+        if conflicts:
+            msg = self.create_message_box(
+                QMessageBox.Icon.Question,
+                "Possible Duplicates",
+                "\n".join(conflict.describe(self.events) for conflict in conflicts)
+                + "\n\nSend anyway?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                QMessageBox.StandardButton.No,
+            )
+            if msg.exec() == QMessageBox.StandardButton.No:
+                return
+
+        # Check the links before anything is sent, in the background since it takes seconds
+        events = list(self.events)
+        self.send_telegram_button.setEnabled(False)
+        self.update_telegram_button.setEnabled(False)
+        self.send_telegram_button.setText("Checking links...")
+        self.run_in_background(
+            lambda: asyncio.run(find_broken_links(events, cache)),
+            lambda future: self.queue_checked_events(events, future),
+        )
+
+    def queue_checked_events(self, events: list[Event], links: Future):
+        """Queue the events once their links are checked, asking first if any are broken."""
+        self.send_telegram_button.setText("Send to Telegram")
+        self.send_telegram_button.setEnabled(True)
+        self.update_telegram_button.setEnabled(True)
         try:
-            # Disable buttons while sending
-            self.submit_button.setEnabled(False)
-            self.send_telegram_button.setEnabled(False)
-            self.send_telegram_button.setText("Sending...")
-            QApplication.processEvents()
+            broken_links = links.result()
+        except Exception as e:
+            broken_links = []
+            question = f"The links could not be checked:\n{e!s}"
+        else:
+            question = describe_broken_links(events, broken_links)
+        if broken_links or links.exception() is not None:
+            msg = self.create_message_box(
+                QMessageBox.Icon.Question,
+                "Broken Links",
+                question + "\n\nSend anyway?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                QMessageBox.StandardButton.No,
+            )
+            if msg.exec() == QMessageBox.StandardButton.No:
+                return
 
-            # Send the message
-            asyncio.run(send_html_message(self.events))
+        try:
+            # Queue the digest for the flusher, which adds the events to the calendar feed
+            self.outbox.put(events)
+            self.outbox_flusher.wake()
 
-            # Clear both the events list and cached events
-            self.events.clear()
+            # Clear the sent events, but not those added while the links were checked
+            self.events[:] = [event for event in self.events if event not in events]
             self.clear_cached_events()
+            self.events_saved = not self.events
+            self.update_outbox_status()
 
             # Show success message
             msg = self.create_message_box(
                 QMessageBox.Icon.Information,
                 "Success",
-                "Successfully sent the events to Telegram!",
+                "Queued the events, they are sent to Telegram as soon as it can be reached.",
+            )
+            msg.exec()
+
+        except Exception as e:
+            msg = self.create_message_box(
+                QMessageBox.Icon.Critical, "Error", f"Failed to queue the events:\n{e!s}"
             )
             msg.exec()
 
-            # Exit the application
-            QApplication.quit()
+    def run_in_background(self, function, on_done):
+        """Run a function in the worker thread, then pass its future to on_done in this one."""
+        future = self.worker.submit(function)
+
+        def poll():
+            if future.done():
+                on_done(future)
+            else:
+                QTimer.singleShot(50, poll)
+
+        QTimer.singleShot(50, poll)
+
+    def update_outbox_status(self):
+        """Show the delivery status of the queued digests."""
+        self.outbox_label.setText(self.outbox.describe())
+
+    def update_in_telegram(self):
+        """Edit the published digest in place, or load its events for editing first."""
+        if not self.events:
+            published_events = load_published_events()
+            if not published_events:
+                msg = self.create_message_box(
+                    QMessageBox.Icon.Warning, "Warning", "No published digest to update!"
+                )
+                msg.exec()
+                return
+            msg = self.create_message_box(
+                QMessageBox.Icon.Question,
+                "Load Published Events",
+                f"Load the {len(published_events)} published events to edit them?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                QMessageBox.StandardButton.Yes,
+            )
+            if msg.exec() == QMessageBox.StandardButton.Yes:
+                self.events.extend(published_events)
+                self.events_saved = False
+            return
+
+        try:
+            # Queued behind the digests, so the flusher applies it to the one published last
+            self.outbox.put_update(self.events)
+            self.outbox_flusher.wake()
+            self.update_outbox_status()
+
+            msg = self.create_message_box(
+                QMessageBox.Icon.Information,
+                "Success",
+                "Queued the update, the published digest is edited as soon as Telegram can be "
+                "reached.",
+            )
+            msg.exec()
 
         except Exception as e:
             msg = self.create_message_box(
-                QMessageBox.Icon.Critical, "Error", f"Failed to send to Telegram:\n{e!s}"
+                QMessageBox.Icon.Critical, "Error", f"Failed to queue the update:\n{e!s}"
             )
             msg.exec()
-            self.submit_button.setEnabled(True)
-            self.send_telegram_button.setEnabled(True)
-            self.send_telegram_button.setText("Send to Telegram")
 
     def check_saved_events(self):
         """Check for saved events on startup."""
-        saved_events = cache.get('events', [])
+        with tracer.span("cache.load"):
+            saved_events = cache.get('events', [])
         if saved_events:
             msg = self.create_message_box(
                 QMessageBox.Icon.Question,
@@ -1082,6 +1411,27 @@ class EventInputWindow(QMainWindow):
             if reply == QMessageBox.StandardButton.Yes:
                 self.load_saved_events()
 
+    def check_recurring_events(self):
+        """Offer to add the occurrences of recurring events on the current weekend."""
+        occurrences = [
+            event
+            for event in RecurringEventStore(cache).occurrences(*weekend_window(dt.datetime.now()))
+            if event not in self.events
+        ]
+        if occurrences:
+            msg = self.create_message_box(
+                QMessageBox.Icon.Question,
+                "Recurring Events",
+                f"{len(occurrences)} recurring event(s) take place this weekend:\n"
+                + "\n".join(f"{event.title} ({event.venue_name})" for event in occurrences)
+                + "\n\nAdd them?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                QMessageBox.StandardButton.Yes,
+            )
+            if msg.exec() == QMessageBox.StandardButton.Yes:
+                self.events.extend(occurrences)
+                self.events_saved = False
+
     def closeEvent(self, event):
         """Handle application closing."""
         if self.events and not self.events_saved:  # Only prompt if there are unsaved changes
@@ -1113,11 +1463,47 @@ class EventInputWindow(QMainWindow):
                 event.ignore()
         else:
             event.accept()
+        if event.isAccepted():
+            # Queued digests stay in the outbox and are sent on the next start
+            self.outbox_flusher.stop()
+            self.worker.shutdown(wait=False, cancel_futures=True)
+
+
+# Operations that can be profiled on their own besides "startup", mapped to their handlers.
+# "send" only renders and queues the digest once its links are checked, "flush" is the outbox
+# sending it to Telegram.
+PROFILED_OPERATIONS = {
+    "show_events": (EventInputWindow, "show_events"),
+    "send": (EventInputWindow, "queue_checked_events"),
+    "flush": (OutboxFlusher, "flush"),
+}
+
+
+def parse_args() -> tuple[argparse.Namespace, list[str]]:
+    """Parse the GUI options, leaving the rest of the command line to Qt."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_profile_arguments(parser, operations=("startup", *PROFILED_OPERATIONS))
+    parser.add_argument(
+        "--stall-threshold-ms",
+        type=float,
+        default=200,
+        help="Log UI handlers that block the event loop for longer (default: %(default)s)",
+    )
+    return parser.parse_known_args()
 
 
 def main():
+    args, qt_args = parse_args()
+    profiler = Profiler(args.profile, args.profile_dir) if args.profile else None
+    if args.profile in (SESSION, "startup"):
+        profiler.start()
+    elif args.profile in PROFILED_OPERATIONS:
+        # Buttons call the handlers through lambdas, so they reach the wrappers and Qt does
+        # not pass the wrappers the ``checked`` argument of ``clicked``
+        wrap_operation(*PROFILED_OPERATIONS[args.profile], profiler)
+
     try:
-        app = QApplication(sys.argv)
+        app = QApplication([sys.argv[0], *qt_args])
         app.setStyle("Fusion")
 
         app.setStyleSheet("""
@@ -1334,14 +1720,27 @@ def main():
         """)
         app.setWindowIcon(QIcon("dutch_rave_bot.ico"))
 
+        # Watch the event loop from the start, Ctrl+Shift+D opens the stall histogram
+        watchdog = EventLoopWatchdog(threshold_ms=args.stall_threshold_ms, parent=app)
         window = EventInputWindow()
+        debug_shortcut = QShortcut(QKeySequence("Ctrl+Shift+D"), window)
+        debug_shortcut.activated.connect(lambda: StallDebugDialog(watchdog, window).show())
         window.show()
+        if args.profile == "startup":
+            # Stop once the event loop has processed the first batch of events
+            QTimer.singleShot(0, profiler.stop)
 
-        sys.exit(app.exec())
+        exit_code = app.exec()
 
     except Exception as e:
         QMessageBox.critical(None, "Critical Error", f"Application failed to start:\n{e!s}")
-        sys.exit(1)
+        exit_code = 1
+
+    if profiler is not None:
+        profiler.stop()
+        for report in profiler.reports:
+            print(f"Profile report written to {report}")
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
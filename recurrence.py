@@ -0,0 +1,304 @@
+"""Recurring events, such as residencies every Saturday or every first Friday of the month.
+
+A `RecurringEvent` is an event template with a recurrence rule, the occurrences it skips and
+the fields it changes for single occurrences. Occurrences are never stored: they are
+computed by generators for the requested window only, jumping straight to the first period
+in it, so a rule running for years costs no more than one running for a month::
+
+    python recurrence.py add "Bassiani residency" --event 0 --every month --nth 1
+    python recurrence.py skip "Bassiani residency" 2024-12-06
+    python recurrence.py override "Bassiani residency" 2025-01-03 title="New Year special"
+    python recurrence.py show --date 2024-12-06
+"""
+
+from __future__ import annotations
+
+import argparse
+import calendar
+import datetime as dt
+import heapq
+from collections.abc import Iterator
+from enum import Enum
+from typing import Any
+from zoneinfo import ZoneInfo
+
+from diskcache import Cache
+from pydantic import BaseModel, Field, model_validator
+
+from kuda_idem_template import Event, cache, events_timezone, get_friday_and_sunday, settings
+from tracing import tracer
+
+_RULES_KEY = "recurring_events"
+
+
+class Frequency(str, Enum):
+    """How often an event recurs."""
+
+    WEEKLY = "week"
+    MONTHLY = "month"
+
+
+class Recurrence(BaseModel):
+    """When an event recurs, starting from the start of its template.
+
+    Attributes
+    ----------
+        frequency: Every week, or on a weekday of every month
+        interval: Periods between occurrences, e.g. 2 for every other week
+        nth: For monthly rules, which weekday of the month: 1 to 4, or -1 for the last one.
+            Defaults to the position of the template's start in its month
+        until: Last day an occurrence may start on
+        count: Number of periods, skipped occurrences included
+
+    """
+
+    frequency: Frequency = Frequency.WEEKLY
+    interval: int = Field(default=1, ge=1)
+    nth: int | None = None
+    until: dt.date | None = None
+    count: int | None = Field(default=None, ge=1)
+
+    @model_validator(mode="after")
+    def check_nth(self) -> Recurrence:
+        """Only allow weekdays that every month has."""
+        if self.nth is not None and self.nth not in (1, 2, 3, 4, -1):
+            raise ValueError("nth must be 1 to 4, or -1 for the last weekday of the month")
+        return self
+
+
+def weekend_window(day: dt.datetime) -> tuple[dt.datetime, dt.datetime]:
+    """From the start of Friday to the end of Sunday of the week of a day."""
+    friday, sunday = get_friday_and_sunday(day)
+    start = dt.datetime.combine(friday.date(), dt.time(), friday.tzinfo)
+    end = dt.datetime.combine(sunday.date() + dt.timedelta(days=1), dt.time(), sunday.tzinfo)
+    return start, end
+
+
+def recurring_name(event: Event) -> str:
+    """The name a recurring event is stored under unless it is given one.
+
+    Titles repeat across venues and cities, e.g. a residency of the same DJs in two clubs, so
+    the name includes both.
+    """
+    return f"{event.title} ({event.venue_name}, {event.city})"
+
+
+def _nth_weekday(year: int, month: int, weekday: int, nth: int) -> dt.date:
+    days = [
+        week[weekday] for week in calendar.monthcalendar(year, month) if week[weekday] != 0
+    ]
+    return dt.date(year, month, days[nth - 1 if nth > 0 else -1])
+
+
+class RecurringEvent(BaseModel):
+    """An event template that recurs, with per occurrence exceptions and overrides.
+
+    Attributes
+    ----------
+        event: The first occurrence, the others get its fields and times of day
+        rule: When the event recurs
+        exceptions: Days of occurrences that do not take place
+        overrides: Fields that differ for single occurrences, by the day the occurrence
+            would start on
+        timezone: Time zone of aware template times, whose occurrences keep their wall time
+            across DST changes. Defaults to the zone of the template, or to EVENTS_TIMEZONE
+            if its times only have a UTC offset
+
+    """
+
+    event: Event
+    rule: Recurrence = Field(default_factory=Recurrence)
+    exceptions: set[dt.date] = set()
+    overrides: dict[dt.date, dict[str, Any]] = {}
+    timezone: str | None = None
+
+    @model_validator(mode="after")
+    def restore_timezone(self) -> RecurringEvent:
+        """Put aware template times back into their zone, which JSON keeps only as an offset."""
+        start, end = self.event.start_datetime, self.event.end_datetime
+        if start.tzinfo is None:
+            return self
+        if self.timezone is None:
+            self.timezone = getattr(start.tzinfo, "key", None) or settings.EVENTS_TIMEZONE
+        if self.timezone:
+            zone = ZoneInfo(self.timezone)
+            self.event = self.event.model_copy(
+                update={
+                    "start_datetime": start.astimezone(zone),
+                    "end_datetime": end.astimezone(zone),
+                }
+            )
+        return self
+
+    def _localize(self, value: dt.datetime) -> dt.datetime:
+        """A window bound in the time zone of the template, or naive if its times are."""
+        tzinfo = self.event.start_datetime.tzinfo
+        if value.tzinfo is None:
+            return value if tzinfo is None else value.replace(tzinfo=tzinfo)
+        if tzinfo is None:
+            # Naive event times are wall times in EVENTS_TIMEZONE
+            return value.astimezone(events_timezone()).replace(tzinfo=None)
+        return value.astimezone(tzinfo)
+
+    def _starts(self, start: dt.datetime) -> Iterator[dt.datetime]:
+        """Starts of the occurrences from the first period that may start after a time."""
+        first = self.event.start_datetime
+        rule = self.rule
+        if rule.frequency is Frequency.WEEKLY:
+            step = dt.timedelta(weeks=rule.interval)
+            period = max(0, -((first - start) // step))
+            while rule.count is None or period < rule.count:
+                yield first + period * step
+                period += 1
+        else:
+            nth = rule.nth or (first.day + 6) // 7
+            nth = -1 if nth == 5 else nth
+            months = max(0, (start.year - first.year) * 12 + start.month - first.month)
+            # The last period in or before the month of start, earlier ones are all before it
+            period = months // rule.interval
+            while rule.count is None or period < rule.count:
+                year, month = divmod(first.month - 1 + period * rule.interval, 12)
+                day = _nth_weekday(first.year + year, month + 1, first.weekday(), nth)
+                occurrence = dt.datetime.combine(day, first.timetz())
+                if occurrence >= first:
+                    yield occurrence
+                period += 1
+
+    def occurrences(self, start: dt.datetime, end: dt.datetime) -> Iterator[Event]:
+        """Occurrences starting in ``[start, end)``, in start time order.
+
+        Naive bounds are wall times in the time zone of the template, aware ones are
+        converted to it, so a window made with `weekend_window` fits templates of both kinds.
+
+        Args:
+        ----
+            start: Start of the window, inclusive
+            end: End of the window, exclusive
+
+        Returns:
+        -------
+            Iterator[Event]: Occurrences with overrides applied, without the skipped ones
+
+        """
+        start, end = self._localize(start), self._localize(end)
+        duration = self.event.end_datetime - self.event.start_datetime
+        for occurrence in self._starts(start):
+            if occurrence >= end or (self.rule.until and occurrence.date() > self.rule.until):
+                return
+            if occurrence < start or occurrence.date() in self.exceptions:
+                continue
+            fields = {
+                # Every occurrence is an event of its own in the calendar feed
+                **self.event.model_dump(exclude={"uid"}),
+                "start_datetime": occurrence,
+                "end_datetime": occurrence + duration,
+                **self.overrides.get(occurrence.date(), {}),
+            }
+            yield Event(**fields)
+
+
+class RecurringEventStore:
+    """Recurring events by name in the disk cache."""
+
+    def __init__(self, cache: Cache) -> None:
+        self.cache = cache
+
+    def all(self) -> dict[str, RecurringEvent]:
+        """Every recurring event by name."""
+        return {
+            name: RecurringEvent(**data) for name, data in self.cache.get(_RULES_KEY, {}).items()
+        }
+
+    def get(self, name: str) -> RecurringEvent:
+        """A recurring event by name, raising `KeyError` if there is none."""
+        return RecurringEvent(**self.cache.get(_RULES_KEY, {})[name])
+
+    def set(self, name: str, recurring: RecurringEvent) -> None:
+        """Add a recurring event, or replace the one with the same name."""
+        with self.cache.transact():
+            rules = self.cache.get(_RULES_KEY, {})
+            self.cache.set(_RULES_KEY, {**rules, name: recurring.model_dump(mode="json")})
+
+    def remove(self, name: str) -> None:
+        """Remove a recurring event, raising `KeyError` if there is none."""
+        with self.cache.transact():
+            rules = self.cache.get(_RULES_KEY, {})
+            del rules[name]
+            self.cache.set(_RULES_KEY, rules)
+
+    def occurrences(self, start: dt.datetime, end: dt.datetime) -> Iterator[Event]:
+        """Occurrences of all recurring events starting in ``[start, end)``, by start time."""
+        with tracer.span("recurrence.expand"):
+            recurring = list(self.all().values())
+        return heapq.merge(
+            *(event.occurrences(start, end) for event in recurring),
+            key=lambda event: event.start_datetime,
+        )
+
+    def weekend(self, day: dt.datetime) -> list[Event]:
+        """Occurrences on the weekend of the week of a day."""
+        return list(self.occurrences(*weekend_window(day)))
+
+
+def _parse_override(value: str) -> tuple[str, str]:
+    name, separator, field_value = value.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(f"expected field=value, got {value!r}")
+    return name, field_value
+
+
+def main() -> None:
+    """Manage recurring events from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Repeat one of the events saved in the GUI")
+    add.add_argument("name", nargs="?", help="Defaults to the title, venue and city")
+    add.add_argument("--event", type=int, default=0, help="Position of the saved event")
+    add.add_argument("--every", choices=[f.value for f in Frequency], default="week")
+    add.add_argument("--interval", type=int, default=1)
+    add.add_argument("--nth", type=int, help="Weekday of the month, -1 for the last one")
+    add.add_argument("--until", type=dt.date.fromisoformat)
+    add.add_argument("--count", type=int)
+    remove = commands.add_parser("remove", help="Stop repeating an event")
+    remove.add_argument("name")
+    skip = commands.add_parser("skip", help="Cancel a single occurrence")
+    skip.add_argument("name")
+    skip.add_argument("date", type=dt.date.fromisoformat)
+    override = commands.add_parser("override", help="Change fields of a single occurrence")
+    override.add_argument("name")
+    override.add_argument("date", type=dt.date.fromisoformat)
+    override.add_argument("fields", nargs="+", type=_parse_override, metavar="field=value")
+    show = commands.add_parser("show", help="List the occurrences on a weekend")
+    show.add_argument("--date", type=dt.date.fromisoformat, default=dt.date.today())
+    args = parser.parse_args()
+
+    store = RecurringEventStore(cache)
+    match args.command:
+        case "add":
+            event = Event(**cache.get("events", [])[args.event])
+            rule = Recurrence(
+                frequency=Frequency(args.every),
+                interval=args.interval,
+                nth=args.nth,
+                until=args.until,
+                count=args.count,
+            )
+            store.set(args.name or recurring_name(event), RecurringEvent(event=event, rule=rule))
+        case "remove":
+            store.remove(args.name)
+        case "skip":
+            recurring = store.get(args.name)
+            recurring.exceptions.add(args.date)
+            store.set(args.name, recurring)
+        case "override":
+            recurring = store.get(args.name)
+            recurring.overrides.setdefault(args.date, {}).update(args.fields)
+            store.set(args.name, recurring)
+        case "show":
+            day = dt.datetime.combine(args.date, dt.time())
+            for event in store.weekend(day):
+                print(f"{event.start_datetime:%a %d.%m %H:%M}  {event.title} ({event.venue_name})")
+
+
+if __name__ == "__main__":
+    main()
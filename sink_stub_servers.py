@@ -0,0 +1,187 @@
+"""Local stand-ins for the services `publishing` delivers to, besides the Telegram Bot API.
+
+`DiscordWebhookStub` accepts webhook posts and answers with 429 and ``retry_after`` when
+posts come faster than its bucket allows, like Discord does. `SMTPStubServer` speaks enough
+SMTP for smtplib to deliver mail to it, without TLS, and keeps the received messages::
+
+    python sink_stub_servers.py --discord-port 8082 --smtp-port 8025
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import email.policy
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from email.parser import BytesParser
+from http import HTTPStatus
+from typing import Any
+
+from local_http import LocalHTTPServer, Request, Response
+
+
+@dataclass
+class DiscordWebhookStub:
+    """A fake Discord webhook with a sliding-window rate limit.
+
+    Attributes
+    ----------
+        host: Interface to listen on
+        port: Port to listen on, 0 picks a free one
+        bucket: Posts allowed per ``window`` seconds
+        window: Length of the rate limit window, in seconds
+        messages: Contents of the accepted posts
+        rejected: Number of posts answered with 429
+
+    """
+
+    host: str = "127.0.0.1"
+    port: int = 0
+    bucket: int = 5
+    window: float = 2.0
+
+    messages: list[str] = field(default_factory=list, init=False)
+    rejected: int = field(default=0, init=False)
+    _accepted_at: deque[float] = field(default_factory=deque, init=False)
+
+    def __post_init__(self) -> None:
+        self._http = LocalHTTPServer(self._handle, self.host, self.port)
+
+    @property
+    def url(self) -> str:
+        """Webhook URL to post to."""
+        return f"{self._http.url}/api/webhooks/1/stub"
+
+    async def __aenter__(self) -> DiscordWebhookStub:
+        await self._http.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self._http.stop()
+
+    async def _handle(self, request: Request) -> Response:
+        if request.method != "POST" or not request.path.startswith("/api/webhooks/"):
+            return Response(HTTPStatus.NOT_FOUND)
+        now = time.monotonic()
+        while self._accepted_at and self._accepted_at[0] <= now - self.window:
+            self._accepted_at.popleft()
+        if len(self._accepted_at) >= self.bucket:
+            self.rejected += 1
+            retry_after = self._accepted_at[0] + self.window - now
+            return Response.json(
+                {"message": "You are being rate limited.", "retry_after": retry_after,
+                 "global": False},
+                HTTPStatus.TOO_MANY_REQUESTS,
+            )
+        content: Any = request.form().get("content")
+        if not isinstance(content, str) or not content or len(content) > 2000:
+            return Response.json({"message": "Invalid Form Body"}, HTTPStatus.BAD_REQUEST)
+        self._accepted_at.append(now)
+        self.messages.append(content)
+        return Response(HTTPStatus.NO_CONTENT)
+
+
+@dataclass
+class SMTPStubServer:
+    """A fake SMTP server that accepts every message and keeps it.
+
+    Attributes
+    ----------
+        host: Interface to listen on
+        port: Port to listen on, 0 picks a free one
+        messages: Received messages with their envelope recipients
+
+    """
+
+    host: str = "127.0.0.1"
+    port: int = 0
+
+    messages: list[tuple[list[str], EmailMessage]] = field(default_factory=list, init=False)
+    _server: asyncio.Server | None = field(default=None, init=False)
+
+    async def __aenter__(self) -> SMTPStubServer:
+        self._server = await asyncio.start_server(self._session, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        async def reply(line: str) -> None:
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        recipients: list[str] = []
+        await reply("220 stub ESMTP")
+        try:
+            while line := await reader.readline():
+                command = line.decode(errors="replace").strip()
+                verb = command[:4].upper()
+                if verb == "EHLO":
+                    await reply("250-stub")
+                    await reply("250 AUTH PLAIN LOGIN")
+                elif verb == "HELO":
+                    await reply("250 stub")
+                elif verb == "AUTH":
+                    await reply("235 Authentication successful")
+                elif verb == "MAIL":
+                    recipients = []
+                    await reply("250 OK")
+                elif verb == "RCPT":
+                    recipients.append(command.split(":", 1)[1].strip(" <>"))
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while (data := await reader.readline()) not in (b".\r\n", b""):
+                        # Undo the dot-stuffing of lines that start with a dot
+                        lines.append(data[1:] if data.startswith(b"..") else data)
+                    message = BytesParser(policy=email.policy.default).parsebytes(b"".join(lines))
+                    self.messages.append((recipients, message))
+                    await reply("250 OK: queued")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                elif verb in ("RSET", "NOOP"):
+                    await reply("250 OK")
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+
+async def serve(args: argparse.Namespace) -> None:
+    """Run both stand-ins until interrupted."""
+    async with (
+        DiscordWebhookStub(port=args.discord_port) as discord,
+        SMTPStubServer(port=args.smtp_port) as smtp,
+    ):
+        print(f"DISCORD_WEBHOOK_URL={discord.url}")
+        print(f"SMTP_HOST={smtp.host} SMTP_PORT={smtp.port} SMTP_STARTTLS=false")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            print(f"Discord: {len(discord.messages)} messages, {discord.rejected} rate limited")
+            print(f"SMTP: {len(smtp.messages)} messages")
+
+
+def main() -> None:
+    """Run the stand-ins from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--discord-port", type=int, default=8082)
+    parser.add_argument("--smtp-port", type=int, default=8025)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""A local stand-in for the Telegram Bot API to load-test the send path offline.
+
+Point the bot at it by setting ``BOT_API_BASE_URL`` to the printed base URL, e.g.::
+
+    python telegram_stub_server.py --port 8081 --latency 0.05 --rate-429 0.05
+    BOT_API_BASE_URL=http://127.0.0.1:8081/bot python kuda_idem.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Any
+
+from local_http import LocalHTTPServer, Request, Response
+
+# Parameters which PTB sends as plain strings rather than JSON-encoded values
+STRING_PARAMS = frozenset({"text", "question", "caption", "parse_mode", "inline_query_id"})
+
+
+@dataclass(slots=True)
+class RecordedRequest:
+    """A request received by the stub, kept for accounting."""
+
+    method: str
+    params: dict[str, Any]
+    status: int
+    received_at: float
+    duration: float
+
+
+@dataclass(slots=True)
+class InjectedError:
+    """An error response to return instead of handling a request."""
+
+    status: int
+    retry_after: int | None = None
+
+
+@dataclass
+class StubBotApiServer:
+    """A fake Telegram Bot API with configurable latency, error injection and accounting.
+
+    Attributes
+    ----------
+        host: Interface to listen on
+        port: Port to listen on, 0 picks a free one
+        latency: Delay added to every request, in seconds
+        jitter: Maximal random delay added on top of `latency`, in seconds
+        rate_429: Share of requests answered with 429 Too Many Requests
+        retry_after: The ``retry_after`` value sent with 429 responses, in seconds
+        rate_5xx: Share of requests answered with 502 Bad Gateway
+        seed: Seed for the random generator behind jitter and error injection
+
+    """
+
+    host: str = "127.0.0.1"
+    port: int = 0
+    latency: float = 0.0
+    jitter: float = 0.0
+    rate_429: float = 0.0
+    retry_after: int = 1
+    rate_5xx: float = 0.0
+    seed: int | None = None
+
+    requests: list[RecordedRequest] = field(default_factory=list, init=False)
+    messages: dict[int, dict[int, dict[str, Any]]] = field(default_factory=dict, init=False)
+    inline_answers: dict[str, list[dict[str, Any]]] = field(default_factory=dict, init=False)
+    _injected: deque[InjectedError] = field(default_factory=deque, init=False)
+    _updates: list[dict[str, Any]] = field(default_factory=list, init=False)
+    _new_update: asyncio.Event = field(default_factory=asyncio.Event, init=False)
+    _ids: itertools.count[int] = field(default_factory=lambda: itertools.count(1), init=False)
+    _message_ids: dict[int, itertools.count[int]] = field(default_factory=dict, init=False)
+    _file_ids: set[str] = field(default_factory=set, init=False)
+
+    def __post_init__(self) -> None:
+        self._random = random.Random(self.seed)
+        self._http = LocalHTTPServer(self._handle, self.host, self.port)
+        self.methods: dict[str, Callable[[dict[str, Any]], Awaitable[Any]]] = {
+            "getMe": self.get_me,
+            "sendMessage": self.send_message,
+            "sendPoll": self.send_poll,
+            "sendPhoto": self.send_photo,
+            "sendMediaGroup": self.send_media_group,
+            "editMessageText": self.edit_message_text,
+            "deleteMessage": self.delete_message,
+            "getUpdates": self.get_updates,
+            "answerInlineQuery": self.answer_inline_query,
+        }
+
+    @property
+    def base_url(self) -> str:
+        """Value for the ``BOT_API_BASE_URL`` setting."""
+        return f"{self._http.url}/bot"
+
+    async def start(self) -> None:
+        """Start serving requests."""
+        await self._http.start()
+
+    async def stop(self) -> None:
+        """Stop serving requests."""
+        await self._http.stop()
+
+    async def __aenter__(self) -> StubBotApiServer:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.stop()
+
+    # Test controls
+
+    def fail_next(self, status: int, count: int = 1, retry_after: int | None = None) -> None:
+        """Answer the next ``count`` requests with an error status."""
+        if status == HTTPStatus.TOO_MANY_REQUESTS and retry_after is None:
+            retry_after = self.retry_after
+        self._injected.extend(InjectedError(status, retry_after) for _ in range(count))
+
+    def enqueue_update(self, update: dict[str, Any]) -> int:
+        """Make an update available through getUpdates and return its update_id."""
+        update = {"update_id": len(self._updates) + 1, **update}
+        self._updates.append(update)
+        self._new_update.set()
+        return update["update_id"]
+
+    def stats(self) -> Counter[tuple[str, int]]:
+        """Count the received requests by method and response status."""
+        return Counter((request.method, request.status) for request in self.requests)
+
+    def summary(self) -> str:
+        """Describe the received requests in a human-readable way."""
+        lines = [f"{'method':<18}{'status':>8}{'count':>8}{'mean, ms':>10}"]
+        for (method, status), count in sorted(self.stats().items()):
+            durations = [
+                r.duration for r in self.requests if r.method == method and r.status == status
+            ]
+            lines.append(
+                f"{method:<18}{status:>8}{count:>8}{sum(durations) / count * 1000:>10.1f}"
+            )
+        return "\n".join(lines)
+
+    # Bot API methods
+
+    async def get_me(self, params: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "id": 1,
+            "is_bot": True,
+            "first_name": "Stub",
+            "username": "stub_bot",
+            "can_join_groups": True,
+            "can_read_all_group_messages": False,
+            "supports_inline_queries": True,
+        }
+
+    async def send_message(self, params: dict[str, Any]) -> dict[str, Any]:
+        return self._store_message(params, text=params["text"])
+
+    async def send_poll(self, params: dict[str, Any]) -> dict[str, Any]:
+        options = [
+            option if isinstance(option, str) else option["text"] for option in params["options"]
+        ]
+        poll = {
+            "id": str(next(self._ids)),
+            "question": params["question"],
+            "options": [
+                {"text": option, "voter_count": 0, "persistent_id": str(i)}
+                for i, option in enumerate(options)
+            ],
+            "total_voter_count": 0,
+            "is_closed": False,
+            "is_anonymous": params.get("is_anonymous", True),
+            "type": params.get("type", "regular"),
+            "allows_multiple_answers": params.get("allows_multiple_answers", False),
+            "allows_revoting": True,
+            "members_only": False,
+        }
+        return self._store_message(params, poll=poll)
+
+    async def send_photo(self, params: dict[str, Any]) -> dict[str, Any]:
+        content = {"photo": self._photo_sizes(params["photo"], params)}
+        if "caption" in params:
+            content["caption"] = params["caption"]
+        return self._store_message(params, **content)
+
+    async def send_media_group(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        media_group_id = str(next(self._ids))
+        messages = []
+        for media in params["media"]:
+            content = {
+                "photo": self._photo_sizes(media["media"], params),
+                "media_group_id": media_group_id,
+            }
+            if "caption" in media:
+                content["caption"] = media["caption"]
+            messages.append(self._store_message(params, **content))
+        return messages
+
+    async def answer_inline_query(self, params: dict[str, Any]) -> bool:
+        inline_query_id = params["inline_query_id"]
+        if inline_query_id in self.inline_answers:
+            raise ValueError("Bad Request: query is too old and response timeout expired")
+        self.inline_answers[inline_query_id] = params["results"]
+        return True
+
+    def _photo_sizes(self, photo: str | bytes, params: dict[str, Any]) -> list[dict[str, Any]]:
+        if isinstance(photo, str) and photo.startswith("attach://"):
+            photo = params[photo.removeprefix("attach://")]
+        if isinstance(photo, bytes):
+            file_id = f"photo-{next(self._ids)}"
+            self._file_ids.add(file_id)
+            size = len(photo)
+        elif photo in self._file_ids:
+            file_id, size = photo, 0
+        else:
+            raise ValueError("Bad Request: wrong file identifier/HTTP URL specified")
+        return [
+            {"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 1280,
+             "file_size": size}
+        ]
+
+    async def edit_message_text(self, params: dict[str, Any]) -> dict[str, Any]:
+        message = self.messages.get(int(params["chat_id"]), {}).get(int(params["message_id"]))
+        if message is None:
+            raise LookupError("Bad Request: message to edit not found")
+        if message.get("text") == params["text"]:
+            raise ValueError("Bad Request: message is not modified")
+        message["text"] = params["text"]
+        message["edit_date"] = int(time.time())
+        return message
+
+    async def delete_message(self, params: dict[str, Any]) -> bool:
+        chat_messages = self.messages.get(int(params["chat_id"]), {})
+        if chat_messages.pop(int(params["message_id"]), None) is None:
+            raise LookupError("Bad Request: message to delete not found")
+        return True
+
+    async def get_updates(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", 100))
+        deadline = time.monotonic() + float(params.get("timeout", 0))
+        while True:
+            self._new_update.clear()
+            updates = [u for u in self._updates if u["update_id"] >= offset][:limit]
+            remaining = deadline - time.monotonic()
+            if updates or remaining <= 0:
+                return updates
+            try:
+                await asyncio.wait_for(self._new_update.wait(), remaining)
+            except TimeoutError:
+                pass
+
+    def _store_message(self, params: dict[str, Any], **content: Any) -> dict[str, Any]:
+        chat_id = int(params["chat_id"])
+        chat_messages = self.messages.setdefault(chat_id, {})
+        message = {
+            "message_id": next(self._message_ids.setdefault(chat_id, itertools.count(1))),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+            **content,
+        }
+        if "message_thread_id" in params:
+            message["message_thread_id"] = int(params["message_thread_id"])
+            message["is_topic_message"] = True
+        chat_messages[message["message_id"]] = message
+        return message
+
+    # HTTP plumbing
+
+    async def _handle(self, request: Request) -> Response:
+        received_at = time.monotonic()
+        method = request.path.rsplit("/", 1)[-1]
+        params = {
+            name: value if name in STRING_PARAMS or not isinstance(value, str) else _loads(value)
+            for name, value in {**request.query, **request.form()}.items()
+        }
+
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        status, payload = await self._dispatch(method, params)
+        self.requests.append(
+            RecordedRequest(method, params, status, received_at, time.monotonic() - received_at)
+        )
+        return Response.json(payload, status)
+
+    async def _dispatch(self, method: str, params: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        injected = self._injected.popleft() if self._injected else self._random_error()
+        if injected is not None:
+            payload: dict[str, Any] = {
+                "ok": False,
+                "error_code": injected.status,
+                "description": HTTPStatus(injected.status).phrase,
+            }
+            if injected.retry_after is not None:
+                payload["parameters"] = {"retry_after": injected.retry_after}
+                payload["description"] = (
+                    f"Too Many Requests: retry after {injected.retry_after}"
+                )
+            return injected.status, payload
+
+        handler = self.methods.get(method)
+        if handler is None:
+            return HTTPStatus.NOT_FOUND, {
+                "ok": False, "error_code": 404, "description": "Not Found"
+            }
+        try:
+            return HTTPStatus.OK, {"ok": True, "result": await handler(params)}
+        except (KeyError, LookupError, ValueError) as e:
+            return HTTPStatus.BAD_REQUEST, {
+                "ok": False, "error_code": 400, "description": str(e).strip("'\"")
+            }
+
+    def _random_error(self) -> InjectedError | None:
+        roll = self._random.random()
+        if roll < self.rate_429:
+            return InjectedError(HTTPStatus.TOO_MANY_REQUESTS, self.retry_after)
+        if roll < self.rate_429 + self.rate_5xx:
+            return InjectedError(HTTPStatus.BAD_GATEWAY)
+        return None
+
+
+def _loads(value: str) -> Any:
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+
+async def serve(server: StubBotApiServer) -> None:
+    """Run the stub until interrupted, then print the request accounting."""
+    async with server:
+        print(f"Serving a fake Bot API, set BOT_API_BASE_URL={server.base_url}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            print(server.summary())
+
+
+def main() -> None:
+    """Run the stub from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay per request, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra delay, seconds")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of 429 responses")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after of 429 responses")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Share of 502 responses")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(StubBotApiServer(**vars(args))))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""Settings the modules need at import time, for tests that import them."""
+
+import os
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("TOPIC_ID", "1")
+os.environ.setdefault("GROUP_CHAT_ID", "-100")
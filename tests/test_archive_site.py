@@ -0,0 +1,68 @@
+"""Building the static archive site from published digests."""
+
+from __future__ import annotations
+
+import datetime as dt
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from diskcache import Cache
+
+from archive_site import ArchiveStore, build_site
+from kuda_idem_template import Event
+
+TEMPLATE_DIR = Path(__file__).parent.parent
+
+
+def make_event(title: str, description: str | None = None) -> Event:
+    return Event(
+        city="Амстердам",
+        title=title,
+        description=description,
+        title_link="https://example.com/party?a=1&b=2",
+        start_datetime=dt.datetime(2024, 11, 22, 23),
+        end_datetime=dt.datetime(2024, 11, 23, 7),
+        venue_name="Клуб RAUM",
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+
+
+@pytest.fixture
+def store(tmp_path: Path) -> Iterator[ArchiveStore]:
+    with Cache(tmp_path / "cache") as cache:
+        yield ArchiveStore(cache)
+
+
+def test_event_text_is_escaped(store: ArchiveStore, tmp_path: Path) -> None:
+    store.record([make_event("Jazz & <script>alert(1)</script>", '"Quotes" <i>and</i> tags')])
+    output = tmp_path / "site"
+    build_site(store, output, TEMPLATE_DIR)
+    page = (output / "2024-W47.html").read_text(encoding="utf-8")
+    assert "<script>" not in page
+    assert "Jazz &amp; &lt;script&gt;alert(1)&lt;/script&gt;" in page
+    assert "&#34;Quotes&#34; &lt;i&gt;and&lt;/i&gt; tags" in page
+    # The markup of the templates is kept
+    assert '<a href="https://example.com/party?a=1&amp;b=2">' in page
+    assert "<b>Амстердам:</b>" in page
+
+
+def test_unchanged_pages_are_skipped(store: ArchiveStore, tmp_path: Path) -> None:
+    store.record([make_event("Techno")])
+    output = tmp_path / "site"
+    assert build_site(store, output, TEMPLATE_DIR).rendered == ["2024-W47.html", "index.html"]
+    result = build_site(store, output, TEMPLATE_DIR)
+    assert (result.rendered, result.skipped) == ([], 2)
+    store.record([make_event("House")])
+    assert build_site(store, output, TEMPLATE_DIR).rendered == ["2024-W47.html"]
+
+
+def test_digests_of_a_week_are_merged_by_name(store: ArchiveStore) -> None:
+    week = store.record([make_event("Techno")], "Амстердам")
+    store.record([make_event("House")], "Роттердам")
+    store.record([make_event("Disco")], "Амстердам")
+    assert [data["title"] for data in store.events(week)] == ["Disco", "House"]
+    # A digest named after its week is the whole week, published besides the others
+    store.record([make_event("Jazz")], week)
+    assert [data["title"] for data in store.events(week)] == ["Jazz", "Disco", "House"]
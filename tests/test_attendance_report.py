@@ -0,0 +1,96 @@
+"""Summaries of poll answers in the disk cache and the attendance page made from them."""
+
+from __future__ import annotations
+
+import datetime as dt
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from diskcache import Cache
+
+from attendance_report import build_report, render_report, summarize_polls
+from kuda_idem_template import Event
+from poll_results import PollStore
+
+
+def make_event(venue: str) -> Event:
+    start = dt.datetime(2024, 11, 22, 23)
+    return Event(
+        city="Амстердам",
+        title="Party 2",
+        start_datetime=start,
+        end_datetime=start + dt.timedelta(hours=6),
+        venue_name=venue,
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+
+
+@pytest.fixture
+def store(tmp_path: Path) -> PollStore:
+    store = PollStore(Cache(tmp_path))
+    events = [make_event("Клуб RAUM"), make_event("<b>Shelter</b>")]
+    # The attributes of the message returned by sendPoll that the store reads
+    texts = [event.venue_name for event in events] + ["Никуда не иду"]
+    poll = SimpleNamespace(id="5001", options=[SimpleNamespace(text=text) for text in texts])
+    message = SimpleNamespace(
+        chat_id=-100, message_id=1, date=dt.datetime(2024, 11, 20, tzinfo=dt.UTC), poll=poll
+    )
+    store.register_poll(message, events)
+    return store
+
+
+def test_summaries_follow_answers(store: PollStore) -> None:
+    store.record_answer("5001", 1, [0])
+    store.record_answer("5001", 2, [0, 1])
+    (summary,) = summarize_polls(store)
+    assert summary.votes == [2, 1]
+    assert summary.voters == {1, 2}
+
+    # Same votes per option, but another voter
+    store.record_answer("5001", 2, [])
+    store.record_answer("5001", 3, [0, 1])
+    (summary,) = summarize_polls(store)
+    assert summary.votes == [2, 1]
+    assert summary.voters == {1, 3}
+    assert store.voters("5001") == {1: (0,), 3: (0, 1)}
+
+
+def test_cached_summaries_are_reused(store: PollStore) -> None:
+    store.record_answer("5001", 1, [1])
+    first = summarize_polls(store)
+    store.cache.set(("poll", "5001"), None)
+    # The poll itself is not read again while nobody answered it
+    assert summarize_polls(store) == first
+
+
+def test_answers_do_not_scan_the_cache(store: PollStore, monkeypatch: pytest.MonkeyPatch) -> None:
+    def iterkeys() -> None:
+        raise AssertionError("scanned the cache")
+
+    monkeypatch.setattr(store.cache, "iterkeys", iterkeys)
+    for user_id in range(1, 4):
+        store.record_answer("5001", user_id, [0])
+    store.record_answer("5001", 2, [])
+    assert store.voter_ids("5001") == {1, 3}
+    assert store.voter_count("5001") == 2
+
+
+def test_voters_of_polls_answered_before_they_had_slots(store: PollStore) -> None:
+    store.record_answer("5001", 1, [0])
+    store.record_answer("5001", 2, [1])
+    store.record_answer("5001", 2, [])
+    for key in [("poll_voter_slots", "5001"), *(("poll_voter_slot", "5001", n) for n in (0, 1))]:
+        store.cache.delete(key)
+    store.record_answer("5001", 3, [1])
+    # The voter who retracted before keeps their slot when they answer again
+    store.record_answer("5001", 2, [0])
+    assert store.voter_ids("5001") == {1, 2, 3}
+
+
+def test_venue_names_are_escaped(store: PollStore) -> None:
+    store.record_answer("5001", 1, [1])
+    page = render_report(build_report(summarize_polls(store), min_series=1))
+    assert "&lt;b&gt;Shelter&lt;/b&gt;" in page
+    assert "<b>Shelter</b>" not in page
@@ -0,0 +1,43 @@
+"""Appending events to an `EventArchive` and reading them back."""
+
+from __future__ import annotations
+
+import datetime as dt
+from pathlib import Path
+
+from event_archive import EventArchive, build_report
+from kuda_idem_template import Event
+
+
+def make_event(day: int, venue: str) -> Event:
+    start = dt.datetime(2024, 11, day, 23)
+    return Event(
+        city="Амстердам",
+        title=f"Party {day}",
+        start_datetime=start,
+        end_datetime=start + dt.timedelta(hours=6),
+        venue_name=venue,
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+
+
+def test_rows_span_chunks(tmp_path: Path) -> None:
+    archive = EventArchive(tmp_path)
+    archive.append([make_event(day, f"Venue {day % 3}") for day in range(1, 29)], "poll")
+    with archive.reader() as reader:
+        rows = list(reader.rows(chunk=5))
+        report = build_report(reader)
+    assert len(rows) == 28
+    assert [row[0] for row in rows] == sorted(row[0] for row in rows)
+    assert report.events == 28
+    assert sorted(count for _, count, _ in report.venues) == [9, 9, 10]
+
+
+def test_close_with_partly_consumed_rows(tmp_path: Path) -> None:
+    archive = EventArchive(tmp_path)
+    archive.append([make_event(22, "Клуб RAUM"), make_event(23, "Shelter")])
+    with archive.reader() as reader:
+        rows = reader.rows()
+        next(rows)
+    # Closing must not fail on an export of the map still held by the iterator
@@ -0,0 +1,95 @@
+"""Round trips of events through `EventBatch`, with and without time zones."""
+
+from __future__ import annotations
+
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from event_batch import EventBatch
+from kuda_idem_template import Event
+
+MOSCOW = ZoneInfo("Europe/Moscow")
+AMSTERDAM = ZoneInfo("Europe/Amsterdam")
+
+
+def make_event(start: dt.datetime, end: dt.datetime, city: str = "Амстердам") -> Event:
+    return Event(
+        city=city,
+        title=f"Party at {start.isoformat()}",
+        start_datetime=start,
+        end_datetime=end,
+        venue_name="Клуб RAUM",
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+
+
+AWARE = [
+    make_event(
+        dt.datetime(2024, 11, 22, 23, tzinfo=AMSTERDAM),
+        dt.datetime(2024, 11, 23, 7, tzinfo=AMSTERDAM),
+    ),
+    # Starts in one time zone and ends in another
+    make_event(
+        dt.datetime(2024, 11, 22, 19, tzinfo=MOSCOW), dt.datetime(2024, 11, 22, 22, tzinfo=dt.UTC)
+    ),
+    make_event(
+        dt.datetime(2024, 11, 23, 12, tzinfo=dt.timezone(dt.timedelta(hours=-5))),
+        dt.datetime(2024, 11, 23, 20, tzinfo=dt.UTC),
+        city="Утрехт",
+    ),
+]
+NAIVE = [
+    make_event(dt.datetime(2024, 11, 22, 23), dt.datetime(2024, 11, 23, 7)),
+    make_event(dt.datetime(2024, 11, 22, 16), dt.datetime(2024, 11, 22, 22), city="Утрехт"),
+]
+
+
+@pytest.mark.parametrize("events", [AWARE, NAIVE], ids=["aware", "naive"])
+def test_round_trip(events: list[Event]) -> None:
+    restored = EventBatch.from_events(events).to_events()
+    assert restored == events
+    assert [event.model_dump_json() for event in restored] == [
+        event.model_dump_json() for event in events
+    ]
+
+
+def test_views_round_trip() -> None:
+    batch = EventBatch.from_events(AWARE)
+    assert batch.sorted().to_events() == sorted(AWARE, key=lambda event: event.start_datetime)
+    assert batch.group_by_city()["Утрехт"].to_events() == [AWARE[2]]
+
+
+def test_extremes_keep_their_time_zone() -> None:
+    batch = EventBatch.from_events(AWARE)
+    assert batch.min_start() == AWARE[1].start_datetime
+    assert batch.min_start().tzinfo == MOSCOW
+    assert batch.max_end() == AWARE[2].end_datetime
+    assert batch.max_end().tzinfo == dt.UTC
+    assert batch.window(AWARE[0].start_datetime, AWARE[2].start_datetime).max_end().tzinfo == (
+        AMSTERDAM
+    )
+
+
+def test_window() -> None:
+    batch = EventBatch.from_events(AWARE)
+    # 23:00 in Amsterdam is 22:00 UTC, 19:00 in Moscow is 16:00 UTC
+    window = batch.window(
+        dt.datetime(2024, 11, 22, 16, tzinfo=dt.UTC), dt.datetime(2024, 11, 22, 22, tzinfo=dt.UTC)
+    )
+    assert window.to_events() == [AWARE[1]]
+    with pytest.raises(TypeError):
+        batch.window(dt.datetime(2024, 11, 22), dt.datetime(2024, 11, 23))
+
+
+def test_naive_and_aware_times_are_not_mixed() -> None:
+    batch = EventBatch.from_events(NAIVE)
+    with pytest.raises(ValueError):
+        batch.append(AWARE[0])
+    with pytest.raises(ValueError):
+        EventBatch().append(
+            make_event(dt.datetime(2024, 11, 22, 19, tzinfo=MOSCOW), dt.datetime(2024, 11, 22, 23))
+        )
+    assert len(batch) == len(NAIVE)
@@ -0,0 +1,90 @@
+"""Duplicates and clashes found by the sweep over events at the same venue."""
+
+from __future__ import annotations
+
+import datetime as dt
+
+from event_conflicts import Conflict, ConflictKind, find_conflicts, normalize
+from kuda_idem_template import Event
+
+DUPLICATE, CLASH = ConflictKind.DUPLICATE, ConflictKind.CLASH
+
+
+def make_event(
+        title: str,
+        start: int,
+        end: int,
+        venue: str = "Клуб RAUM",
+        city: str = "Амстердам",
+) -> Event:
+    """An event on 22 November 2024 from and to the given hours, past midnight above 24."""
+    midnight = dt.datetime(2024, 11, 22)
+    return Event(
+        city=city,
+        title=title,
+        start_datetime=midnight + dt.timedelta(hours=start),
+        end_datetime=midnight + dt.timedelta(hours=end),
+        venue_name=venue,
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+
+
+def test_normalize() -> None:
+    assert normalize("  Jazz-Night!  ") == normalize("jazz night") == "jazz night"
+    assert normalize("ＲＡＵＭ") == "raum"
+
+
+def test_overlap_at_the_same_venue_clashes() -> None:
+    events = [make_event("Techno", 23, 30), make_event("House", 28, 34)]
+    assert find_conflicts(events) == [Conflict(CLASH, 0, 1)]
+
+
+def test_adjacent_events_do_not_clash() -> None:
+    events = [make_event("Techno", 23, 30), make_event("Afterparty", 30, 36)]
+    assert find_conflicts(events) == []
+
+
+def test_other_venues_and_cities_do_not_clash() -> None:
+    events = [
+        make_event("Techno", 23, 30),
+        make_event("House", 23, 30, venue="Shelter"),
+        make_event("Disco", 23, 30, city="Роттердам"),
+    ]
+    assert find_conflicts(events) == []
+
+
+def test_venue_names_are_normalized() -> None:
+    events = [make_event("Techno", 23, 30), make_event("House", 24, 30, venue="клуб  raum")]
+    assert find_conflicts(events) == [Conflict(CLASH, 0, 1)]
+
+
+def test_same_title_and_start_is_a_duplicate_at_any_venue() -> None:
+    events = [
+        make_event("Jazz Night", 20, 23),
+        make_event("Techno", 0, 6),
+        make_event("jazz night!", 20, 23, venue="Bimhuis"),
+    ]
+    assert find_conflicts(events) == [Conflict(DUPLICATE, 0, 2)]
+
+
+def test_same_title_overlapping_at_the_venue_is_a_duplicate() -> None:
+    events = [make_event("Jazz Night", 21, 24), make_event("Jazz Night", 20, 23)]
+    assert find_conflicts(events) == [Conflict(DUPLICATE, 0, 1)]
+
+
+def test_long_event_conflicts_with_every_event_it_spans() -> None:
+    events = [
+        make_event("Short 1", 21, 22),
+        make_event("Festival", 20, 44),
+        make_event("Short 2", 22, 23),
+        make_event("Festival", 20, 44),
+        make_event("Next day", 44, 48),
+    ]
+    assert find_conflicts(events) == [
+        Conflict(CLASH, 0, 1),
+        Conflict(CLASH, 0, 3),
+        Conflict(CLASH, 1, 2),
+        Conflict(DUPLICATE, 1, 3),
+        Conflict(CLASH, 2, 3),
+    ]
@@ -0,0 +1,160 @@
+"""Extraction of event fields from pages, and fetching them through the HTTP cache."""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+from collections.abc import Iterator
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from diskcache import Cache
+
+import event_enrichment
+from event_enrichment import (
+    CachingFetcher,
+    PageMetadata,
+    enrich_links,
+    extract_event_fields,
+    missing_fields,
+)
+from local_http import LocalHTTPServer, Request, Response
+
+JSON_LD = {
+    "@context": "https://schema.org",
+    "@graph": [
+        {"@type": "WebPage", "name": "Tickets"},
+        {
+            "@type": ["MusicEvent"],
+            "name": "RAUM invites BASSIANI",
+            "description": "All night long",
+            "startDate": "2024-11-22T23:00:00+01:00",
+            "endDate": "2024-11-23T07:00:00+01:00",
+            "location": [
+                {
+                    "@type": "Place",
+                    "name": "Клуб RAUM",
+                    "address": {
+                        "streetAddress": "Humberweg 3",
+                        "addressLocality": "Амстердам",
+                    },
+                }
+            ],
+            "offers": {"url": "https://tickets.example.com/raum"},
+        },
+    ],
+}
+
+JSON_LD_PAGE = f"""<!DOCTYPE html>
+<html><head>
+<title>Page title</title>
+<meta property="og:title" content="OpenGraph title">
+<meta property="og:description" content="OpenGraph description">
+<script type="application/ld+json">{{ not json }}</script>
+<script type="application/ld+json">{json.dumps(JSON_LD, ensure_ascii=False)}</script>
+</head><body></body></html>
+"""
+
+OPEN_GRAPH_PAGE = """<!DOCTYPE html>
+<html><head>
+<title>Page title</title>
+<meta name="description" content="Plain description">
+<meta property="og:title" content="Bassiani residency &amp; friends">
+<meta property="event:start_time" content="2024-12-06T23:00:00Z">
+<meta property="event:end_time" content="">
+</head><body></body></html>
+"""
+
+
+def test_json_ld_event() -> None:
+    assert extract_event_fields(JSON_LD_PAGE, "https://example.com/raum") == {
+        "title": "RAUM invites BASSIANI",
+        "description": "All night long",
+        "start_datetime": dt.datetime.fromisoformat("2024-11-22T23:00:00+01:00"),
+        "end_datetime": dt.datetime.fromisoformat("2024-11-23T07:00:00+01:00"),
+        "venue_name": "Клуб RAUM",
+        "venue_address": "Humberweg 3",
+        "city": "Амстердам",
+        "ticket_link": "https://tickets.example.com/raum",
+    }
+
+
+def test_open_graph() -> None:
+    assert extract_event_fields(OPEN_GRAPH_PAGE, "https://example.com/bassiani") == {
+        "title": "Bassiani residency & friends",
+        "description": "Plain description",
+        "start_datetime": dt.datetime(2024, 12, 6, 23, tzinfo=dt.UTC),
+    }
+
+
+def test_page_title_without_metadata() -> None:
+    page = "<html><head><title> Just a page </title></head></html>"
+    assert extract_event_fields(page, "https://example.com/") == {"title": "Just a page"}
+
+
+def test_site_parser_takes_precedence(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(event_enrichment, "_site_parsers", {})
+
+    @event_enrichment.site_parser("Example.com")
+    def parse(metadata: PageMetadata, url: str) -> dict[str, str]:
+        return {"title": metadata.meta["og:title"].upper(), "ticket_link": url}
+
+    draft = extract_event_fields(JSON_LD_PAGE, "https://www.example.com/raum")
+    assert draft["title"] == "OPENGRAPH TITLE"
+    assert draft["ticket_link"] == "https://www.example.com/raum"
+    assert draft["venue_name"] == "Клуб RAUM"
+    assert extract_event_fields(JSON_LD_PAGE, "https://example.org/")["title"] == (
+        "RAUM invites BASSIANI"
+    )
+
+
+def test_missing_fields() -> None:
+    draft = {"title": "A", "city": "B", "venue_name": "C"}
+    assert missing_fields(draft, ["title", "city"]) == {"venue_name": "C"}
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> Iterator[Cache]:
+    with Cache(tmp_path / "cache") as cache:
+        yield cache
+
+
+async def test_pages_are_revalidated(cache: Cache) -> None:
+    requests: list[Request] = []
+
+    async def handle(request: Request) -> Response:
+        requests.append(request)
+        if request.path == "/missing":
+            return Response(HTTPStatus.NOT_FOUND)
+        if request.headers.get("if-none-match") == '"v1"':
+            return Response(HTTPStatus.NOT_MODIFIED, headers={"ETag": '"v1"'})
+        return Response(
+            body=JSON_LD_PAGE.encode(),
+            headers={"Content-Type": "text/html; charset=utf-8", "ETag": '"v1"'},
+        )
+
+    async with LocalHTTPServer(handle) as server:
+        url = f"{server.url}/raum"
+        first, missing = await enrich_links([url, f"{server.url}/missing"], cache)
+        assert first["venue_name"] == "Клуб RAUM"
+        assert isinstance(missing, Exception)
+
+        async with CachingFetcher(cache) as fetcher:
+            assert await fetcher.fetch(url) == JSON_LD_PAGE
+            assert fetcher.stats == {"fetched": 0, "revalidated": 1, "fresh": 0}
+    assert requests[-1].headers["if-none-match"] == '"v1"'
+
+
+async def test_fresh_pages_are_not_requested(cache: Cache) -> None:
+    requests: list[Request] = []
+
+    async def handle(request: Request) -> Response:
+        requests.append(request)
+        return Response(body=b"<title>Fresh</title>", headers={"Cache-Control": "max-age=600"})
+
+    async with LocalHTTPServer(handle) as server, CachingFetcher(cache) as fetcher:
+        for _ in range(3):
+            assert await fetcher.fetch(f"{server.url}/page") == "<title>Fresh</title>"
+    assert len(requests) == 1
+    assert fetcher.stats == {"fetched": 1, "revalidated": 0, "fresh": 2}
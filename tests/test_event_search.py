@@ -0,0 +1,66 @@
+"""Searching the index of past events."""
+
+from __future__ import annotations
+
+import datetime as dt
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from diskcache import Cache
+
+from archive_site import ArchiveStore
+from event_search import EventSearchIndex
+from kuda_idem_template import Event
+
+
+def make_event(title: str, day: int = 22, venue: str = "Клуб RAUM") -> Event:
+    return Event(
+        city="Амстердам",
+        title=title,
+        start_datetime=dt.datetime(2024, 11, day, 23),
+        end_datetime=dt.datetime(2024, 11, day + 1, 7),
+        venue_name=venue,
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+
+
+@pytest.fixture
+def index(tmp_path: Path) -> Iterator[EventSearchIndex]:
+    index = EventSearchIndex(tmp_path / "search.sqlite3")
+    yield index
+    index.close()
+
+
+def test_search(index: EventSearchIndex) -> None:
+    index.add([make_event("Jazz Night", 8), make_event("Jazz Night", 15), make_event("Techno")])
+    (latest,) = index.search("azz nig")
+    assert latest.start_datetime.day == 15
+    assert [event.title for event in index.search("Te")] == ["Techno"]
+    assert sorted(event.title for event in index.search("raum")) == ["Jazz Night", "Techno"]
+    # The query is matched as typed
+    assert index.search("Jazz Nihgt") == []
+
+
+def test_archive_is_synced_by_another_connection(
+        index: EventSearchIndex, tmp_path: Path
+) -> None:
+    with Cache(tmp_path / "cache") as cache:
+        store = ArchiveStore(cache)
+        store.record([make_event("Jazz Night")])
+        index.add([make_event("Techno")])
+
+        def sync() -> None:
+            other = EventSearchIndex(index.path)
+            try:
+                assert other.sync_archive(store) == 1
+            finally:
+                other.close()
+
+        thread = threading.Thread(target=sync)
+        thread.start()
+        thread.join()
+        assert [event.title for event in index.search("Jazz")] == ["Jazz Night"]
+        assert index.sync_archive(store) == 0
@@ -0,0 +1,83 @@
+"""Calendar feed entries of edited, moved and dropped events."""
+
+from __future__ import annotations
+
+import datetime as dt
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from diskcache import Cache
+
+from event_search import shift_to_weekend
+from ics_export import CalendarFeed, fold_line
+from kuda_idem_template import Event
+
+NOW = dt.datetime(2024, 11, 20, tzinfo=dt.UTC)
+
+
+def make_event(title: str = "Jazz Night", start: int = 23) -> Event:
+    return Event(
+        city="Амстердам",
+        title=title,
+        start_datetime=dt.datetime(2024, 11, 22, start),
+        end_datetime=dt.datetime(2024, 11, 23, 7),
+        venue_name="Клуб RAUM",
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+
+
+def vevents(path: Path) -> list[str]:
+    """The VEVENTs of the feed, unfolded."""
+    text = path.read_text(encoding="utf-8").replace("\r\n ", "")
+    return [part.split("END:VEVENT")[0] for part in text.split("BEGIN:VEVENT")[1:]]
+
+
+@pytest.fixture
+def feed(tmp_path: Path) -> Iterator[CalendarFeed]:
+    with Cache(tmp_path / "cache") as cache:
+        yield CalendarFeed(tmp_path / "events.ics", cache, dt.UTC)
+
+
+def test_uid_is_kept_when_an_event_is_edited() -> None:
+    event = make_event()
+    assert make_event().uid == event.uid
+    moved = Event(**{**event.model_dump(), "start_datetime": dt.datetime(2024, 11, 22, 22)})
+    assert moved.uid == event.uid
+    assert make_event(start=22).uid != event.uid
+    assert shift_to_weekend(event, now=dt.datetime(2024, 12, 2)).uid != event.uid
+
+
+def test_moved_event_updates_its_entry(feed: CalendarFeed) -> None:
+    event = make_event()
+    assert feed.update([event], NOW) == 1
+    assert feed.update([event], NOW) == 0
+    moved = event.model_copy(update={"start_datetime": dt.datetime(2024, 11, 22, 22)})
+    assert feed.update([moved], NOW) == 1
+    (vevent,) = vevents(feed.path)
+    assert "SEQUENCE:1" in vevent
+    assert "DTSTART:20241122T220000Z" in vevent
+
+
+def test_dropped_event_is_cancelled(feed: CalendarFeed) -> None:
+    kept, dropped = make_event("Techno"), make_event()
+    feed.update([kept, dropped], NOW)
+    assert feed.update([kept], NOW, cancelled=[dropped]) == 1
+    # Cancelling again changes nothing, and an event that is kept is never cancelled
+    assert feed.update([kept], NOW, cancelled=[dropped, kept]) == 0
+    cancelled, confirmed = sorted(vevents(feed.path), key=lambda vevent: "Techno" in vevent)
+    assert "STATUS:CANCELLED" in cancelled and "SEQUENCE:1" in cancelled
+    assert "STATUS" not in confirmed and "SEQUENCE:0" in confirmed
+
+    # An event that returns is confirmed again
+    assert feed.update([dropped], NOW) == 1
+    restored = next(vevent for vevent in vevents(feed.path) if "Jazz" in vevent)
+    assert "STATUS" not in restored and "SEQUENCE:2" in restored
+
+
+def test_fold_line() -> None:
+    line = "SUMMARY:" + "Кофе" * 30
+    folded = fold_line(line)
+    assert all(len(part.encode()) <= 75 for part in folded.removesuffix("\r\n").split("\r\n"))
+    assert folded.replace("\r\n ", "").removesuffix("\r\n") == line
@@ -0,0 +1,104 @@
+"""Link checks against a local HTTP server."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator, Iterator
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from diskcache import Cache
+
+from kuda_idem_template import Event
+from link_checker import LinkChecker, LinkStatus
+from local_http import LocalHTTPServer, Request, Response
+
+
+async def handle(request: Request) -> Response:
+    match request.path:
+        case "/ok":
+            return Response()
+        case "/redirect":
+            return Response(HTTPStatus.FOUND, headers={"Location": "/ok"})
+        case "/slow":
+            await asyncio.sleep(5)
+            return Response()
+        case "/get-only" if request.method == "HEAD":
+            return Response(HTTPStatus.METHOD_NOT_ALLOWED)
+        case "/get-only":
+            return Response()
+    return Response(HTTPStatus.NOT_FOUND)
+
+
+@pytest.fixture
+async def server() -> AsyncIterator[LocalHTTPServer]:
+    async with LocalHTTPServer(handle) as server:
+        yield server
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> Iterator[Cache]:
+    with Cache(tmp_path / "cache") as cache:
+        yield cache
+
+
+async def check(
+        server: LocalHTTPServer, cache: Cache, path: str, **kwargs: float
+) -> LinkStatus:
+    async with LinkChecker(cache, **kwargs) as checker:
+        return await checker.check_url(f"{server.url}{path}")
+
+
+async def test_ok(server: LocalHTTPServer, cache: Cache) -> None:
+    status = await check(server, cache, "/ok")
+    assert status.ok
+    assert status.status == HTTPStatus.OK
+
+
+async def test_redirect_is_followed(server: LocalHTTPServer, cache: Cache) -> None:
+    status = await check(server, cache, "/redirect")
+    assert status.ok
+    assert status.status == HTTPStatus.OK
+
+
+async def test_head_unsupported_falls_back_to_get(server: LocalHTTPServer, cache: Cache) -> None:
+    assert (await check(server, cache, "/get-only")).ok
+
+
+async def test_not_found(server: LocalHTTPServer, cache: Cache) -> None:
+    status = await check(server, cache, "/missing")
+    assert not status.ok
+    assert status.describe() == "HTTP 404"
+
+
+async def test_timeout(server: LocalHTTPServer, cache: Cache) -> None:
+    status = await check(server, cache, "/slow", timeout=0.2)
+    assert not status.ok
+    assert status.status is None
+    assert status.error.startswith("ReadTimeout")
+
+
+async def test_results_are_cached(server: LocalHTTPServer, cache: Cache) -> None:
+    await check(server, cache, "/missing")
+    await server.stop()
+    assert (await check(server, cache, "/missing")).describe() == "HTTP 404"
+
+
+async def test_unreachable_links_are_unknown(server: LocalHTTPServer, cache: Cache) -> None:
+    event = Event(
+        city="Амстердам",
+        title="Techno",
+        title_link=f"{server.url}/missing",
+        start_datetime="2024-11-22T23:00",
+        end_datetime="2024-11-23T07:00",
+        venue_name="Клуб RAUM",
+        venue_address="Humberweg 3",
+        venue_map_link=f"{server.url}/ok",
+        ticket_link=f"{server.url}/slow",
+    )
+    async with LinkChecker(cache, timeout=0.2) as checker:
+        (broken,) = await checker.check_events([event])
+    assert (broken.field, broken.link.describe()) == ("title_link", "HTTP 404")
+    # Not cached, so it is checked again once it can be reached
+    assert cache.get(("link", event.ticket_link)) is None
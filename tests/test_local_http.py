@@ -0,0 +1,83 @@
+"""Requests to the local HTTP server behind the stand-ins."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from collections.abc import AsyncIterator
+from http import HTTPStatus
+from typing import Any
+
+import httpx
+import pytest
+
+from local_http import LocalHTTPServer, Request, Response
+
+
+async def handle(request: Request) -> Response:
+    if request.path == "/fail":
+        raise RuntimeError("broken handler")
+    return Response.json(
+        {"method": request.method, "path": request.path, "query": request.query,
+         "form": {name: str(value) for name, value in request.form().items()}}
+    )
+
+
+@pytest.fixture
+async def server() -> AsyncIterator[LocalHTTPServer]:
+    async with LocalHTTPServer(handle) as server:
+        yield server
+
+
+async def raw_request(server: LocalHTTPServer, data: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    writer.write(data)
+    await writer.drain()
+    response = await asyncio.wait_for(reader.read(), 2)
+    writer.close()
+    return response
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"json": {"text": "Привет"}},
+        {"data": {"text": "Привет"}},
+        {"data": {"text": "Привет"}, "files": {"photo": ("a.jpg", b"\xff\xd8")}},
+    ],
+    ids=["json", "urlencoded", "multipart"],
+)
+async def test_form_bodies(server: LocalHTTPServer, kwargs: dict[str, Any]) -> None:
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{server.url}/send?chat=1", **kwargs)
+    payload = response.json()
+    assert response.status_code == HTTPStatus.OK
+    assert payload["path"] == "/send"
+    assert payload["query"] == {"chat": "1"}
+    assert payload["form"]["text"] == "Привет"
+
+
+async def test_keep_alive(server: LocalHTTPServer) -> None:
+    async with httpx.AsyncClient() as client:
+        for path in ("/a", "/b"):
+            assert (await client.get(f"{server.url}{path}")).json()["path"] == path
+
+
+async def test_handler_error_is_500(server: LocalHTTPServer) -> None:
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f"{server.url}/fail")
+    assert response.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert response.text == "broken handler"
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"GARBAGE\r\n\r\n", b"POST /a HTTP/1.1\r\nContent-Length: many\r\n\r\n"],
+    ids=["request-line", "content-length"],
+)
+async def test_malformed_request_is_400(server: LocalHTTPServer, data: bytes) -> None:
+    response = await raw_request(server, data)
+    assert response.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+    # The server keeps serving other connections
+    response = await raw_request(server, b"GET /ok HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert json.loads(response.partition(b"\r\n\r\n")[2])["path"] == "/ok"
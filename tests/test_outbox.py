@@ -0,0 +1,77 @@
+"""Digests and updates delivered from the outbox to the Bot API stand-in."""
+
+from __future__ import annotations
+
+import datetime as dt
+from collections.abc import AsyncIterator, Iterator
+from pathlib import Path
+
+import pytest
+from diskcache import Cache
+from telegram import Bot
+
+import kuda_idem_template
+from kuda_idem_template import Event, settings
+from outbox import Outbox, OutboxFlusher
+from telegram_stub_server import StubBotApiServer
+
+
+def make_event(title: str, day: int) -> Event:
+    return Event(
+        city="Амстердам",
+        title=title,
+        start_datetime=dt.datetime(2024, 11, day, 23),
+        end_datetime=dt.datetime(2024, 11, day + 1, 7),
+        venue_name="Клуб RAUM",
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+
+
+@pytest.fixture
+def cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Cache]:
+    """The cache of the published digest, with the feed and archive next to it."""
+    with Cache(tmp_path / "cache") as cache:
+        monkeypatch.setattr(kuda_idem_template, "cache", cache)
+        monkeypatch.setattr(settings, "ICS_FEED_PATH", tmp_path / "events.ics")
+        monkeypatch.setattr(settings, "EVENT_ARCHIVE_DIR", tmp_path / "event_archive")
+        yield cache
+
+
+@pytest.fixture
+async def server() -> AsyncIterator[StubBotApiServer]:
+    async with StubBotApiServer() as server:
+        yield server
+
+
+def flusher(outbox: Outbox, server: StubBotApiServer) -> OutboxFlusher:
+    return OutboxFlusher(outbox, Bot("1:test", base_url=server.base_url), rate=None)
+
+
+async def test_update_is_applied_after_the_digest_queued_before_it(
+        cache: Cache, server: StubBotApiServer
+) -> None:
+    outbox = Outbox(cache)
+    events = [make_event("Techno", 22), make_event("House", 23)]
+    outbox.put(events)
+    outbox.put_update([events[0], make_event("Disco", 23)])
+    assert await flusher(outbox, server).flush() == 2
+    assert [status["state"] for status in outbox.statuses().values()] == ["sent", "sent"]
+    (digest,) = [
+        message["text"] for message in server.messages[-100].values() if "text" in message
+    ]
+    assert "Disco" in digest and "House" not in digest
+    assert server.stats()[("editMessageText", 200)] == 1
+    published = kuda_idem_template.load_published_events()
+    assert [event.title for event in published] == ["Techno", "Disco"]
+
+
+async def test_update_without_a_published_digest_fails(
+        cache: Cache, server: StubBotApiServer
+) -> None:
+    outbox = Outbox(cache)
+    outbox.put_update([make_event("Techno", 22)])
+    assert await flusher(outbox, server).flush() == 1
+    (status,) = outbox.statuses().values()
+    assert status["state"] == "failed"
+    assert "No published digest" in status["error"]
@@ -0,0 +1,113 @@
+"""Publishing several digests in one run through the pipeline."""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+from collections.abc import AsyncIterator, Iterator, Sequence
+from pathlib import Path
+from typing import Any
+
+import pytest
+from diskcache import Cache
+from telegram import Bot
+
+import kuda_idem_template
+import pipeline
+from archive_site import ArchiveStore
+from kuda_idem_template import Event, load_published_events, settings
+from pipeline import group_events, run_pipeline
+from publishing import Sink, TelegramSink
+from telegram_stub_server import StubBotApiServer
+
+
+def make_event(title: str, city: str) -> Event:
+    return Event(
+        city=city,
+        title=title,
+        start_datetime=dt.datetime(2024, 11, 22, 23),
+        end_datetime=dt.datetime(2024, 11, 23, 7),
+        venue_name="Клуб RAUM",
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+
+
+EVENTS = [
+    make_event("Techno", "Амстердам"),
+    make_event("House", "Роттердам"),
+    make_event("Disco", "Утрехт"),
+]
+
+
+class ListSink(Sink):
+    """Collects the pages of the digests, or fails to render them."""
+
+    name = "list"
+
+    def __init__(self, fail_render: bool = False) -> None:
+        self.fail_render = fail_render
+        self.pages: list[str] = []
+
+    def render(self, page: str, events: Sequence[Event]) -> list[str]:
+        if self.fail_render:
+            raise ValueError("cannot render")
+        return [page]
+
+    async def deliver(self, item: Any) -> None:
+        self.pages.append(item)
+
+
+@pytest.fixture
+def cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Cache]:
+    with Cache(tmp_path / "cache") as cache:
+        monkeypatch.setattr(kuda_idem_template, "cache", cache)
+        monkeypatch.setattr(settings, "ICS_FEED_PATH", tmp_path / "events.ics")
+        monkeypatch.setattr(settings, "EVENT_ARCHIVE_DIR", tmp_path / "event_archive")
+        yield cache
+
+
+@pytest.fixture
+async def server() -> AsyncIterator[StubBotApiServer]:
+    async with StubBotApiServer() as server:
+        yield server
+
+
+async def test_render_error_fails_only_its_digest(monkeypatch: pytest.MonkeyPatch) -> None:
+    generate_event_page = pipeline.generate_event_page
+
+    def render(events: Sequence[Event]) -> str:
+        if events[0].city == "Роттердам":
+            raise KeyError("broken template")
+        return generate_event_page(events)
+
+    monkeypatch.setattr(pipeline, "generate_event_page", render)
+    sink = ListSink()
+    result = await asyncio.wait_for(run_pipeline(group_events(EVENTS, "city"), [sink]), 5)
+    assert isinstance(result.results["Роттердам"][0].error, KeyError)
+    assert result.results["Амстердам"][0].ok and result.results["Утрехт"][0].ok
+    assert len(sink.pages) == 2
+
+
+async def test_sink_render_error_fails_only_its_sink() -> None:
+    broken, working = ListSink(fail_render=True), ListSink()
+    result = await asyncio.wait_for(
+        run_pipeline(group_events(EVENTS, "city"), [broken, working]), 5
+    )
+    for results in result.results.values():
+        assert isinstance(results[0].error, ValueError)
+        assert results[1].ok
+    assert len(working.pages) == 3
+
+
+async def test_digests_per_city_are_kept_apart(cache: Cache, server: StubBotApiServer) -> None:
+    sink = TelegramSink(Bot("1:test", base_url=server.base_url), rate=None)
+    async with sink.bot:
+        result = await run_pipeline(group_events(EVENTS, "city"), [sink])
+    assert all(results[0].ok for results in result.results.values())
+    for event in EVENTS:
+        assert load_published_events(event.city) == [event]
+    # The week's archive page has every city
+    store = ArchiveStore(cache)
+    (week,) = store.weeks()
+    assert sorted(data["title"] for data in store.events(week)) == ["Disco", "House", "Techno"]
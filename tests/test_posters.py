@@ -0,0 +1,75 @@
+"""Poster uploads to the Bot API stand-in, with the file_id cache."""
+
+from __future__ import annotations
+
+import io
+from collections.abc import AsyncIterator, Iterator
+from pathlib import Path
+
+import pytest
+from diskcache import Cache
+from PIL import Image
+from telegram import Bot
+
+from posters import MAX_SIDE, PosterUploader, poster_hash, prepare_poster
+from telegram_stub_server import StubBotApiServer
+
+
+def write_poster(path: Path, color: str, size: tuple[int, int] = (2000, 1000)) -> Path:
+    Image.new("RGB", size, color).save(path, "PNG")
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> Iterator[Cache]:
+    with Cache(tmp_path / "cache") as cache:
+        yield cache
+
+
+@pytest.fixture
+async def server() -> AsyncIterator[StubBotApiServer]:
+    async with StubBotApiServer() as server:
+        yield server
+
+
+@pytest.fixture
+async def bot(server: StubBotApiServer) -> AsyncIterator[Bot]:
+    async with Bot("1:test", base_url=server.base_url) as bot:
+        yield bot
+
+
+def test_prepare_poster(tmp_path: Path) -> None:
+    data = prepare_poster(write_poster(tmp_path / "poster.png", "red").read_bytes())
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (MAX_SIDE, MAX_SIDE // 2)
+
+
+async def test_uploaded_once(tmp_path: Path, cache: Cache, bot: Bot) -> None:
+    posters = [
+        (write_poster(tmp_path / "a.png", "red"), "A"),
+        (write_poster(tmp_path / "b.png", "blue"), "B"),
+    ]
+    async with PosterUploader(bot, cache, max_workers=1) as uploader:
+        assert len(await uploader.send_posters(-100, posters)) == 2
+        assert len(await uploader.send_posters(-100, posters)) == 2
+    assert uploader.stats == {"uploaded": 2, "reused": 2}
+
+
+async def test_stale_file_id_is_uploaded_again(
+        tmp_path: Path, cache: Cache, bot: Bot, server: StubBotApiServer
+) -> None:
+    stale = write_poster(tmp_path / "stale.png", "red")
+    posters = [(stale, "Stale"), (write_poster(tmp_path / "new.png", "blue"), "New")]
+    key = poster_hash(stale.read_bytes())
+    cache.set(("poster", key), "expired-file-id")
+    async with PosterUploader(bot, cache, max_workers=1) as uploader:
+        messages = await uploader.send_posters(-100, posters)
+    assert [message.caption for message in messages] == ["Stale", "New"]
+    assert uploader.stats == {"uploaded": 2, "reused": 0}
+    assert cache.get(("poster", key)) == messages[0].photo[-1].file_id
+    assert server.stats() == {
+        ("getMe", 200): 1,
+        ("sendMediaGroup", 400): 1,
+        ("sendMediaGroup", 200): 1,
+    }
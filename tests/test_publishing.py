@@ -0,0 +1,128 @@
+"""Publishing a digest to the sinks, with local stand-ins for Discord and SMTP."""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from kuda_idem_template import Event
+from publishing import (
+    DiscordWebhookSink,
+    EmailSink,
+    FileSink,
+    Sink,
+    html_to_markdown,
+    html_to_text,
+    publish,
+)
+from sink_stub_servers import DiscordWebhookStub, SMTPStubServer
+
+EVENTS = [
+    Event(
+        city="Амстердам",
+        title="Jazz & Techno",
+        title_link="https://example.com/jazz",
+        start_datetime=dt.datetime(2024, 11, 22, 23),
+        end_datetime=dt.datetime(2024, 11, 23, 7),
+        venue_name="Клуб RAUM",
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+]
+
+
+class FixedDiscordSink(DiscordWebhookSink):
+    """Posts the given messages instead of the rendered page."""
+
+    def __init__(self, url: str, messages: list[str], **kwargs: Any) -> None:
+        super().__init__(url, **kwargs)
+        self.messages = messages
+
+    def render(self, page: str, events: Sequence[Event]) -> list[str]:
+        return self.messages
+
+
+class RecordingSink(Sink):
+    """Delivers every line of the page to a list, or fails to render it."""
+
+    name = "recording"
+
+    def __init__(self, fail_render: bool = False) -> None:
+        self.fail_render = fail_render
+        self.delivered: list[str] = []
+
+    def render(self, page: str, events: Sequence[Event]) -> list[str]:
+        if self.fail_render:
+            raise ValueError("broken template")
+        return page.splitlines()
+
+    async def deliver(self, item: Any) -> None:
+        self.delivered.append(item)
+
+
+def test_html_conversion() -> None:
+    page = '<meta charset="UTF-8"><b>Куда?</b> <a href="https://x.example">Tickets</a> &amp;'
+    assert html_to_text(page) == "Куда? Tickets (https://x.example) &"
+    assert html_to_markdown(page) == "**Куда?** [Tickets](<https://x.example>) &"
+
+
+async def test_render_error_fails_only_its_sink() -> None:
+    broken, working = RecordingSink(fail_render=True), RecordingSink()
+    results = await asyncio.wait_for(publish(EVENTS, [broken, working]), 3)
+    assert isinstance(results[0].error, ValueError)
+    assert results[0].delivered == results[0].total == 0
+    assert results[1].ok
+    assert working.delivered and results[1].delivered == len(working.delivered)
+
+
+async def test_discord_rate_limit_is_waited_out() -> None:
+    async with DiscordWebhookStub(bucket=1, window=0.2) as discord:
+        sink = FixedDiscordSink(discord.url, ["first", "second", "third"], rate=None)
+        (result,) = await publish(EVENTS, [sink])
+    assert result.ok
+    assert discord.messages == ["first", "second", "third"]
+    assert discord.rejected >= 1
+
+
+async def test_discord_messages_fit_the_length_limit() -> None:
+    async with DiscordWebhookStub() as discord:
+        (result,) = await publish(EVENTS, [DiscordWebhookSink(discord.url)])
+    assert result.ok
+    assert result.delivered == len(discord.messages) > 0
+    assert "Jazz & Techno" in "".join(discord.messages)
+    assert all(len(message) <= 2000 for message in discord.messages)
+
+
+async def test_email() -> None:
+    async with SMTPStubServer() as smtp:
+        sink = EmailSink(
+            smtp.host, smtp.port, "bot@example.com", ["a@example.com", "b@example.com"],
+            starttls=False,
+        )
+        (result,) = await publish(EVENTS, [sink])
+    assert result.ok
+    ((recipients, message),) = smtp.messages
+    assert recipients == ["a@example.com", "b@example.com"]
+    assert message["From"] == "bot@example.com"
+    assert "Jazz & Techno" in message.get_body(("plain",)).get_content()
+    assert "<b>Амстердам:</b>" in message.get_body(("html",)).get_content()
+
+
+async def test_file_per_digest(tmp_path: Path) -> None:
+    sink = FileSink(tmp_path / "digest.html")
+    assert sink.for_digest("amsterdam").path == tmp_path / "digest-amsterdam.html"
+    (result,) = await publish(EVENTS, [sink])
+    assert result.ok
+    assert "Jazz" in (tmp_path / "digest.html").read_text(encoding="utf-8")
+
+
+async def test_invalid_discord_message_is_reported() -> None:
+    async with DiscordWebhookStub() as discord:
+        (result,) = await publish(EVENTS, [FixedDiscordSink(discord.url, ["x" * 2001])])
+    assert isinstance(result.error, httpx.HTTPStatusError)
+    assert discord.messages == []
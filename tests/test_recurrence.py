@@ -0,0 +1,132 @@
+"""Occurrences of recurring events, and storing them by name."""
+
+from __future__ import annotations
+
+import datetime as dt
+from collections.abc import Iterator
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import pytest
+from diskcache import Cache
+
+from kuda_idem_template import Event
+from recurrence import (
+    Frequency,
+    Recurrence,
+    RecurringEvent,
+    RecurringEventStore,
+    recurring_name,
+    weekend_window,
+)
+
+AMSTERDAM = ZoneInfo("Europe/Amsterdam")
+MONTHLY = Frequency.MONTHLY
+
+
+def make_event(
+        start: dt.datetime, venue: str = "Клуб RAUM", city: str = "Амстердам"
+) -> Event:
+    return Event(
+        city=city,
+        title="Residency",
+        start_datetime=start,
+        end_datetime=start + dt.timedelta(hours=8),
+        venue_name=venue,
+        venue_address="Humberweg 3",
+        venue_map_link="https://maps.example.com/raum",
+    )
+
+
+def starts(recurring: RecurringEvent, start: dt.datetime, end: dt.datetime) -> list[dt.datetime]:
+    return [event.start_datetime for event in recurring.occurrences(start, end)]
+
+
+@pytest.fixture
+def store(tmp_path: Path) -> Iterator[RecurringEventStore]:
+    with Cache(tmp_path) as cache:
+        yield RecurringEventStore(cache)
+
+
+def test_weekly_interval_and_count() -> None:
+    # Friday 1 November 2024, every other week, four periods
+    first = dt.datetime(2024, 11, 1, 23)
+    recurring = RecurringEvent(event=make_event(first), rule=Recurrence(interval=2, count=4))
+    assert starts(recurring, dt.datetime(2024, 11, 10), dt.datetime(2025, 6, 1)) == [
+        dt.datetime(2024, 11, 15, 23),
+        dt.datetime(2024, 11, 29, 23),
+        dt.datetime(2024, 12, 13, 23),
+    ]
+    # Nothing before the first occurrence
+    assert starts(recurring, dt.datetime(2024, 10, 1), dt.datetime(2024, 11, 2)) == [first]
+
+
+@pytest.mark.parametrize(
+    ("nth", "expected"),
+    [
+        # The first Friday, from the position of the template in its month
+        (None, [dt.date(2024, 12, 6), dt.date(2025, 1, 3), dt.date(2025, 2, 7)]),
+        (3, [dt.date(2024, 11, 15), dt.date(2024, 12, 20), dt.date(2025, 1, 17)]),
+        (-1, [dt.date(2024, 11, 29), dt.date(2024, 12, 27), dt.date(2025, 1, 31)]),
+    ],
+)
+def test_monthly_weekday(nth: int | None, expected: list[dt.date]) -> None:
+    recurring = RecurringEvent(
+        event=make_event(dt.datetime(2024, 11, 1, 23)), rule=Recurrence(frequency=MONTHLY, nth=nth)
+    )
+    found = starts(recurring, dt.datetime(2024, 11, 2), dt.datetime(2025, 2, 28))
+    assert [start.date() for start in found][:3] == expected
+
+
+def test_monthly_interval_across_years_with_until() -> None:
+    # The last Saturday of every third month
+    rule = Recurrence(frequency=MONTHLY, interval=3, nth=-1, until=dt.date(2025, 12, 1))
+    recurring = RecurringEvent(event=make_event(dt.datetime(2024, 8, 31, 22)), rule=rule)
+    found = starts(recurring, dt.datetime(2025, 1, 1), dt.datetime(2026, 6, 1))
+    assert [start.date() for start in found] == [
+        dt.date(2025, 2, 22),
+        dt.date(2025, 5, 31),
+        dt.date(2025, 8, 30),
+        dt.date(2025, 11, 29),
+    ]
+
+
+def test_exceptions_and_overrides() -> None:
+    recurring = RecurringEvent(
+        event=make_event(dt.datetime(2024, 11, 1, 23)),
+        exceptions={dt.date(2024, 11, 8)},
+        overrides={dt.date(2024, 11, 15): {"title": "Special"}},
+    )
+    events = list(recurring.occurrences(dt.datetime(2024, 11, 2), dt.datetime(2024, 11, 20)))
+    assert [(event.start_datetime.day, event.title) for event in events] == [(15, "Special")]
+    assert events[0].uid != recurring.event.uid
+
+
+def test_wall_time_is_kept_across_dst(store: RecurringEventStore) -> None:
+    # Stored as JSON, the template comes back with the +02:00 offset of summer time
+    first = dt.datetime(2024, 10, 18, 23, tzinfo=AMSTERDAM)
+    store.set("residency", RecurringEvent(event=make_event(first)))
+    recurring = store.get("residency")
+    assert recurring.timezone == "Europe/Amsterdam"
+    (occurrence,) = recurring.occurrences(*weekend_window(dt.datetime(2024, 11, 1, 12)))
+    assert occurrence.start_datetime == dt.datetime(2024, 11, 1, 23, tzinfo=AMSTERDAM)
+    assert occurrence.start_datetime.utcoffset() == dt.timedelta(hours=1)
+    assert occurrence.end_datetime == dt.datetime(2024, 11, 2, 7, tzinfo=AMSTERDAM)
+
+
+def test_naive_window_and_aware_template() -> None:
+    recurring = RecurringEvent(event=make_event(dt.datetime(2024, 11, 1, 23, tzinfo=dt.UTC)))
+    # Offsets are only kept as a time zone, EVENTS_TIMEZONE by default
+    assert recurring.timezone == "Europe/Amsterdam"
+    (occurrence,) = recurring.occurrences(*weekend_window(dt.datetime(2024, 11, 13)))
+    assert occurrence.start_datetime == dt.datetime(2024, 11, 16, 0, tzinfo=AMSTERDAM)
+
+
+def test_same_title_at_other_venues_are_kept_apart(store: RecurringEventStore) -> None:
+    first = dt.datetime(2024, 11, 1, 23)
+    events = [make_event(first), make_event(first, venue="Maassilo", city="Роттердам")]
+    for event in events:
+        store.set(recurring_name(event), RecurringEvent(event=event))
+    assert len(store.all()) == 2
+    found = store.weekend(dt.datetime(2024, 11, 8))
+    assert sorted(event.city for event in found) == ["Амстердам", "Роттердам"]
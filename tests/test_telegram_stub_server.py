@@ -0,0 +1,54 @@
+"""Bot API calls of python-telegram-bot against the local stand-in."""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+from http import HTTPStatus
+
+import pytest
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from telegram_stub_server import StubBotApiServer
+
+
+@pytest.fixture
+async def server() -> AsyncIterator[StubBotApiServer]:
+    async with StubBotApiServer(seed=0) as server:
+        yield server
+
+
+@pytest.fixture
+async def bot(server: StubBotApiServer) -> AsyncIterator[Bot]:
+    async with Bot("1:test", base_url=server.base_url) as bot:
+        yield bot
+
+
+async def test_send_and_edit(server: StubBotApiServer, bot: Bot) -> None:
+    message = await bot.send_message(-100, "<b>Куда идём?</b>", message_thread_id=1)
+    assert message.is_topic_message
+    await bot.edit_message_text("Никуда", -100, message.message_id)
+    assert server.messages[-100][message.message_id]["text"] == "Никуда"
+    with pytest.raises(BadRequest, match="not modified"):
+        await bot.edit_message_text("Никуда", -100, message.message_id)
+    assert server.stats()[("editMessageText", HTTPStatus.BAD_REQUEST)] == 1
+
+
+async def test_injected_errors(server: StubBotApiServer, bot: Bot) -> None:
+    server.fail_next(HTTPStatus.TOO_MANY_REQUESTS, retry_after=3)
+    with pytest.raises(RetryAfter) as error:
+        await bot.send_message(-100, "text")
+    assert str(error.value) == "Flood control exceeded. Retry in 3 seconds"
+    server.fail_next(HTTPStatus.BAD_GATEWAY)
+    with pytest.raises(NetworkError):
+        await bot.send_message(-100, "text")
+    await bot.send_message(-100, "text")
+    assert len(server.messages[-100]) == 1
+
+
+async def test_photo_file_ids(server: StubBotApiServer, bot: Bot) -> None:
+    message = await bot.send_photo(-100, b"\xff\xd8poster")
+    file_id = message.photo[-1].file_id
+    await bot.send_photo(-100, file_id)
+    with pytest.raises(BadRequest, match="(?i)wrong file identifier"):
+        await bot.send_photo(-100, "unknown")
@@ -0,0 +1,51 @@
+"""Export of finished spans while the process keeps running."""
+
+from __future__ import annotations
+
+import json
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from tracing import Tracer
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_spans_are_flushed_periodically(tmp_path: Path) -> None:
+    tracer = Tracer()
+    jsonl_path, prometheus_path = tmp_path / "spans.jsonl", tmp_path / "spans.prom"
+    tracer.configure(jsonl_path, prometheus_path, flush_interval=0.05)
+    with tracer.span("render", events=3):
+        pass
+    assert wait_for(lambda: jsonl_path.exists() and prometheus_path.exists())
+    (line,) = jsonl_path.read_text(encoding="utf-8").splitlines()
+    assert json.loads(line)["attributes"] == {"events": 3}
+    assert 'kuda_idem_span_duration_seconds_count{span="render"} 1' in prometheus_path.read_text()
+
+
+def test_many_pending_spans_are_flushed_early(tmp_path: Path) -> None:
+    tracer = Tracer()
+    jsonl_path = tmp_path / "spans.jsonl"
+    tracer.configure(jsonl_path, flush_interval=60, max_pending=10)
+    for _ in range(10):
+        with tracer.span("send"):
+            pass
+    assert wait_for(lambda: jsonl_path.exists() and len(jsonl_path.read_bytes().splitlines()) == 10)
+
+
+def test_spans_are_not_kept_without_a_jsonl_file(tmp_path: Path) -> None:
+    tracer = Tracer()
+    tracer.configure(prometheus_path=tmp_path / "spans.prom", flush_interval=60)
+    for _ in range(5):
+        with tracer.span("send"):
+            pass
+    assert tracer.drain() == []
+    assert 'kuda_idem_span_duration_seconds_count{span="send"} 5' in tracer.prometheus_text()
@@ -0,0 +1,116 @@
+"""Updates posted to the webhook receiver over local HTTP."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from collections.abc import AsyncIterator
+from http import HTTPStatus
+from pathlib import Path
+
+import httpx
+import pytest
+from diskcache import Cache
+from telegram import Bot, Update
+
+from webhook_server import SECRET_TOKEN_HEADER, WebhookReceiver
+
+
+def poll_answer(update_id: int) -> bytes:
+    return json.dumps(
+        {
+            "update_id": update_id,
+            "poll_answer": {
+                "poll_id": "5001",
+                "user": {"id": 7, "is_bot": False, "first_name": "Ann"},
+                "option_ids": [0],
+                "option_persistent_ids": ["0"],
+            },
+        }
+    ).encode()
+
+
+class Handler:
+    """Collects the IDs of handled updates, optionally only once released."""
+
+    def __init__(self) -> None:
+        self.handled: list[int] = []
+        self.released = asyncio.Event()
+        self.released.set()
+
+    async def __call__(self, update: Update) -> None:
+        await self.released.wait()
+        self.handled.append(update.update_id)
+
+
+@pytest.fixture
+def handler() -> Handler:
+    return Handler()
+
+
+@pytest.fixture
+async def client() -> AsyncIterator[httpx.AsyncClient]:
+    async with httpx.AsyncClient() as client:
+        yield client
+
+
+def receiver(handler: Handler, **kwargs: object) -> WebhookReceiver:
+    return WebhookReceiver(handler, Bot("1:test"), port=0, **kwargs)
+
+
+async def test_routing(handler: Handler, client: httpx.AsyncClient) -> None:
+    async with receiver(handler) as webhook:
+        assert (await client.post(webhook.url, content=poll_answer(1))).status_code == HTTPStatus.OK
+        assert (await client.get(webhook.url)).status_code == HTTPStatus.NOT_FOUND
+        response = await client.post(webhook.url + "/other", content=poll_answer(2))
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        response = await client.post(webhook.url, content=b"{not json")
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert handler.handled == [1]
+    assert webhook.stats == {"received": 1, "processed": 1, "malformed": 1}
+
+
+async def test_secret_token(handler: Handler, client: httpx.AsyncClient) -> None:
+    async with receiver(handler, secret_token="s3cret") as webhook:
+        for headers in ({}, {SECRET_TOKEN_HEADER: "wrong"}):
+            response = await client.post(webhook.url, content=poll_answer(1), headers=headers)
+            assert response.status_code == HTTPStatus.FORBIDDEN
+        headers = {SECRET_TOKEN_HEADER: "s3cret"}
+        response = await client.post(webhook.url, content=poll_answer(2), headers=headers)
+        assert response.status_code == HTTPStatus.OK
+    assert handler.handled == [2]
+
+
+async def test_backpressure(handler: Handler, client: httpx.AsyncClient) -> None:
+    handler.released.clear()
+    async with receiver(handler, workers=1, queue_size=1, enqueue_timeout=0.05) as webhook:
+        statuses = [
+            (await client.post(webhook.url, content=poll_answer(update_id))).status_code
+            for update_id in range(1, 5)
+        ]
+        handler.released.set()
+    # One update is with the worker, one waits in the queue, the others are rejected
+    assert statuses == [200, 200, 503, 503]
+    assert handler.handled == [1, 2]
+    assert webhook.stats["rejected"] == 2
+
+
+async def test_journal_resumes_queued_updates(
+        handler: Handler, client: httpx.AsyncClient, tmp_path: Path
+) -> None:
+    handler.released.clear()
+    with Cache(tmp_path) as journal:
+        webhook = receiver(handler, workers=1, journal=journal)
+        await webhook.start()
+        for update_id in (1, 2, 3):
+            await client.post(webhook.url, content=poll_answer(update_id))
+        # Stopped as on a crash: the update with the worker and the queued ones are not handled
+        await webhook.stop(drain=False)
+        assert handler.handled == []
+
+        handler.released.set()
+        async with receiver(handler, journal=journal) as webhook:
+            pass
+        assert handler.handled == [1, 2, 3]
+        assert webhook.stats["resumed"] == 3
+        assert len(journal) == 0
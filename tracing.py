@@ -0,0 +1,277 @@
+"""Lightweight timing spans exported to JSON lines and a Prometheus text file.
+
+Tracing is disabled by default, in which case `Tracer.span` returns a shared no-op context
+manager. It is enabled by `Tracer.configure`, which `kuda_idem_template` calls when one of the
+``TRACE_JSONL_PATH`` or ``TRACE_PROMETHEUS_PATH`` settings is set. A background thread then
+flushes finished spans every ``TRACE_FLUSH_INTERVAL`` seconds, or sooner when many are pending,
+so long-running processes export as they go instead of only at exit.
+"""
+
+from __future__ import annotations
+
+import atexit
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, ParamSpec, TypeVar
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the duration histogram buckets, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+METRIC_NAME = "kuda_idem_span_duration_seconds"
+
+_current_span_id: ContextVar[int | None] = ContextVar("current_span_id", default=None)
+
+
+class _NoopSpan:
+    """Returned instead of a span while tracing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> _NoopSpan:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        return None
+
+    def set(self, **attributes: Any) -> None:
+        """Ignore the attributes."""
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """A timed operation, nested under the span that was active when it started."""
+
+    __slots__ = (
+        "_started",
+        "_token",
+        "attributes",
+        "duration",
+        "error",
+        "name",
+        "parent_id",
+        "span_id",
+        "timestamp",
+        "tracer",
+    )
+
+    def __init__(self, tracer: Tracer, name: str, attributes: dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(tracer._ids)
+        self.parent_id: int | None = None
+        self.timestamp = 0.0
+        self.duration = 0.0
+        self.error: str | None = None
+
+    def __enter__(self) -> Span:
+        self.parent_id = _current_span_id.get()
+        self._token = _current_span_id.set(self.span_id)
+        self.timestamp = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *exc_info: object) -> None:
+        self.duration = time.perf_counter() - self._started
+        _current_span_id.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.tracer._finish(self)
+
+    def set(self, **attributes: Any) -> None:
+        """Add attributes to the span, e.g. sizes known only at the end of the operation."""
+        self.attributes.update(attributes)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Represent the span as a JSON-serializable dict."""
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "timestamp": self.timestamp,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+@dataclass(slots=True)
+class _Histogram:
+    counts: list[int] = field(default_factory=lambda: [0] * len(BUCKETS))
+    total: float = 0.0
+    errors: int = 0
+
+
+class Tracer:
+    """Collect spans and aggregate their durations per span name."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.jsonl_path: Path | None = None
+        self.prometheus_path: Path | None = None
+        self._ids = itertools.count(1)
+        self._pending: list[Span] = []
+        self._histograms: dict[str, _Histogram] = {}
+        self.flush_interval = 10.0
+        self.max_pending = 1000
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher: threading.Thread | None = None
+        self._atexit_registered = False
+
+    def configure(
+            self,
+            jsonl_path: Path | None = None,
+            prometheus_path: Path | None = None,
+            enabled: bool | None = None,
+            flush_interval: float = 10.0,
+            max_pending: int = 1000,
+    ) -> None:
+        """Set the export paths and enable tracing if any of them is set.
+
+        Args:
+        ----
+            jsonl_path: File the finished spans are appended to, one JSON object per line
+            prometheus_path: File the duration histograms are written to, in text format
+            enabled: Enable tracing even without export paths, e.g. to read `prometheus_text`
+            flush_interval: Seconds between flushes to the export paths
+            max_pending: Spans kept for the JSON lines file before it is flushed early
+
+        """
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enabled = enabled if enabled is not None else bool(jsonl_path or prometheus_path)
+        if self.enabled and not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+        if (jsonl_path or prometheus_path) and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("Exporting spans failed")
+
+    def span(self, name: str, **attributes: Any) -> Span | _NoopSpan:
+        """Time a block of code: ``with tracer.span("render", events=len(events)): ...``."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            # Only the JSON lines file needs the spans themselves, the rest is aggregated
+            if self.jsonl_path is not None:
+                self._pending.append(span)
+                if len(self._pending) >= self.max_pending:
+                    self._wake.set()
+            histogram = self._histograms.setdefault(span.name, _Histogram())
+            for i, bound in enumerate(BUCKETS):
+                if span.duration <= bound:
+                    histogram.counts[i] += 1
+                    break
+            histogram.total += span.duration
+            histogram.errors += span.error is not None
+
+    def drain(self) -> list[Span]:
+        """Return the spans finished since the last drain or flush and forget them.
+
+        Spans are only kept while there is a JSON lines file to write them to.
+        """
+        with self._lock:
+            spans, self._pending = self._pending, []
+        return spans
+
+    def flush(self) -> None:
+        """Append pending spans to the JSON lines file and rewrite the Prometheus file."""
+        with self._flush_lock:
+            spans = self.drain()
+            if self.jsonl_path is not None and spans:
+                with self.jsonl_path.open("a", encoding="utf-8") as f:
+                    f.writelines(
+                        json.dumps(span.as_dict(), ensure_ascii=False, default=str) + "\n"
+                        for span in spans
+                    )
+            if self.prometheus_path is not None:
+                # Write atomically, so that a scraper never reads a half-written file
+                temporary_path = self.prometheus_path.with_name(
+                    self.prometheus_path.name + ".tmp"
+                )
+                temporary_path.write_text(self.prometheus_text(), encoding="utf-8")
+                os.replace(temporary_path, self.prometheus_path)
+
+    def prometheus_text(self) -> str:
+        """Render the duration histograms in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {METRIC_NAME} Duration of traced operations.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        errors = []
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts, strict=True):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{METRIC_NAME}_bucket{{span="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{METRIC_NAME}_sum{{span="{name}"}} {histogram.total!r}')
+                lines.append(f'{METRIC_NAME}_count{{span="{name}"}} {cumulative}')
+                errors.append(f'kuda_idem_span_errors_total{{span="{name}"}} {histogram.errors}')
+        lines += [
+            "# HELP kuda_idem_span_errors_total Traced operations that raised an exception.",
+            "# TYPE kuda_idem_span_errors_total counter",
+            *errors,
+        ]
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer()
+
+
+def traced(name: str | None = None) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Wrap every call of a function, sync or async, into a span named after it."""
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: P.args, **kwargs: P.kwargs) -> Any:
+                with tracer.span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,284 @@
+"""Receive bot updates through a webhook instead of long-polling getUpdates.
+
+Updates are parsed as their requests arrive, acknowledged as soon as they are queued and
+processed by a fixed number of workers. The queue is bounded: when the workers fall behind,
+requests wait briefly for room and are then rejected with 503, so that Telegram retries them
+later instead of the receiver buffering without limit.
+
+Telegram does not deliver an acknowledged update again, so with a journal every update is
+written to disk before it is acknowledged and removed once it was handled. Updates that were
+still queued when the receiver stopped or crashed are handled after the next start: delivery
+is at least once, and handlers must tolerate an update they already handled, as applying a
+poll answer does. Without a journal such updates are lost, i.e. delivery is at most once::
+
+    python webhook_server.py serve --url https://example.com/webhook --port 8443
+    python webhook_server.py replay updates.jsonl --target http://127.0.0.1:8443/webhook
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from http import HTTPStatus
+from pathlib import Path
+
+import httpx
+from diskcache import Cache
+from telegram import Bot, Update
+
+from local_http import LocalHTTPServer, Request, Response
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+
+UpdateHandler = Callable[[Update], Awaitable[None]]
+
+
+class WebhookReceiver:
+    """An asyncio webhook endpoint with a bounded queue and a pool of update workers.
+
+    Attributes
+    ----------
+        handler: Coroutine function called with every update
+        bot: Bot the updates are bound to
+        path: URL path Telegram posts updates to
+        secret_token: Expected value of the secret token header, if any
+        workers: Number of updates processed concurrently
+        queue_size: Number of updates waiting for a worker at most
+        enqueue_timeout: How long a request may wait for room in the queue, in seconds
+        record_path: File every accepted update payload is appended to, for later replays
+        journal: Cache of the payloads of accepted updates until they are handled, by update ID
+        stats: Counts of received, rejected, processed and failed updates
+
+    """
+
+    def __init__(
+            self,
+            handler: UpdateHandler,
+            bot: Bot,
+            host: str = "127.0.0.1",
+            port: int = 8443,
+            path: str = "/webhook",
+            secret_token: str | None = None,
+            workers: int = 4,
+            queue_size: int = 1000,
+            enqueue_timeout: float = 0.5,
+            record_path: Path | None = None,
+            journal: Cache | None = None,
+    ) -> None:
+        self.handler = handler
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self.enqueue_timeout = enqueue_timeout
+        self.record_path = record_path
+        self.journal = journal
+        self.stats: Counter[str] = Counter()
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=queue_size)
+        self._http = LocalHTTPServer(self._receive, host, port)
+        self._worker_tasks: list[asyncio.Task[None]] = []
+
+    @property
+    def url(self) -> str:
+        """Local URL of the endpoint."""
+        return self._http.url + self.path
+
+    async def start(self) -> None:
+        """Start the workers, queue the updates left in the journal and start the HTTP server."""
+        self._worker_tasks = [
+            asyncio.create_task(self._work(), name=f"webhook-worker-{i}")
+            for i in range(self.workers)
+        ]
+        if self.journal is not None:
+            for update_id in sorted(self.journal):
+                payload = self.journal.get(update_id)
+                if payload is not None:
+                    self.stats["resumed"] += 1
+                    await self._queue.put(Update.de_json(json.loads(payload), self.bot))
+        await self._http.start()
+
+    async def stop(self, drain: bool = True) -> None:
+        """Stop accepting updates and, if ``drain`` is set, process the queued ones first.
+
+        Without ``drain``, queued updates are only kept if there is a journal.
+        """
+        await self._http.stop()
+        if drain:
+            await self._queue.join()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+
+    async def __aenter__(self) -> WebhookReceiver:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.stop()
+
+    async def _receive(self, request: Request) -> Response:
+        if request.method != "POST" or request.path != self.path:
+            return Response(HTTPStatus.NOT_FOUND)
+        if self.secret_token is not None and (
+                request.headers.get(SECRET_TOKEN_HEADER) != self.secret_token
+        ):
+            return Response(HTTPStatus.FORBIDDEN)
+        try:
+            update = Update.de_json(json.loads(request.body), self.bot)
+        except (ValueError, TypeError, KeyError):
+            self.stats["malformed"] += 1
+            return Response(HTTPStatus.BAD_REQUEST)
+
+        self.stats["received"] += 1
+        # Journaled before it is queued, so a worker never handles an update not journaled yet
+        if self.journal is not None:
+            self.journal.set(update.update_id, request.body)
+        try:
+            await asyncio.wait_for(self._queue.put(update), self.enqueue_timeout)
+        except TimeoutError:
+            # Backpressure: a non-2xx status makes Telegram deliver the update again later
+            self.stats["rejected"] += 1
+            if self.journal is not None:
+                self.journal.delete(update.update_id)
+            return Response(HTTPStatus.SERVICE_UNAVAILABLE)
+        if self.record_path is not None:
+            with self.record_path.open("ab") as f:
+                f.write(request.body.strip() + b"\n")
+        return Response(HTTPStatus.OK)
+
+    async def _work(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                with tracer.span("webhook.update"):
+                    await self.handler(update)
+                self.stats["processed"] += 1
+            except Exception:
+                self.stats["failed"] += 1
+                logger.exception("Failed to process update %s", update.update_id)
+            finally:
+                self._queue.task_done()
+            # Not reached when the worker is cancelled mid-update, which then stays journaled
+            if self.journal is not None:
+                self.journal.delete(update.update_id)
+
+
+async def replay(
+        path: Path,
+        target: str,
+        concurrency: int = 10,
+        secret_token: str | None = None,
+) -> Counter[int]:
+    """Post recorded update payloads, one JSON object per line, to a webhook endpoint.
+
+    Returns
+    -------
+        Counter[int]: Number of responses per HTTP status
+
+    """
+    payloads = [line for line in path.read_bytes().splitlines() if line.strip()]
+    headers = {"Content-Type": "application/json"}
+    if secret_token is not None:
+        headers[SECRET_TOKEN_HEADER] = secret_token
+    statuses: Counter[int] = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(
+            headers=headers, limits=httpx.Limits(max_connections=concurrency)
+    ) as client:
+
+        async def post(payload: bytes) -> None:
+            async with semaphore:
+                response = await client.post(target, content=payload)
+                statuses[response.status_code] += 1
+
+        await asyncio.gather(*(post(payload) for payload in payloads))
+    return statuses
+
+
+async def serve(args: argparse.Namespace) -> None:
+    """Register the webhook with Telegram, apply poll answers and answer inline queries."""
+    from inline_queries import InlineQueryResponder, UpdateRouter
+    from kuda_idem_template import cache, load_published_events, make_bot, settings
+    from poll_results import PollStore
+
+    bot = make_bot()
+    secret = settings.WEBHOOK_SECRET_TOKEN
+    secret_token = secret.get_secret_value() if secret is not None else None
+    router = UpdateRouter(bot, PollStore(cache), InlineQueryResponder(bot, load_published_events))
+    receiver = WebhookReceiver(
+        router.handle_update,
+        bot,
+        host=args.host,
+        port=args.port,
+        path=args.path,
+        secret_token=secret_token,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        record_path=args.record,
+        journal=Cache(args.journal),
+    )
+    if args.url:
+        await bot.set_webhook(
+            args.url, secret_token=secret_token, allowed_updates=list(router.allowed_updates)
+        )
+    async with receiver:
+        print(f"Receiving updates on {receiver.url}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            print(dict(receiver.stats))
+
+
+def main() -> None:
+    """Serve the webhook or replay recorded updates from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Receive updates")
+    serve_parser.add_argument("--url", help="Public URL to register with Telegram")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8443)
+    serve_parser.add_argument("--path", default="/webhook")
+    serve_parser.add_argument("--workers", type=int, default=4)
+    serve_parser.add_argument("--queue-size", type=int, default=1000)
+    serve_parser.add_argument("--record", type=Path, help="Append received payloads to a file")
+    serve_parser.add_argument(
+        "--journal",
+        type=Path,
+        default=Path("webhook_journal"),
+        help="Directory of the updates not handled yet, handled after a restart",
+    )
+
+    replay_parser = commands.add_parser("replay", help="Post recorded updates to a webhook")
+    replay_parser.add_argument("file", type=Path, help="File with one update per line")
+    replay_parser.add_argument("--target", default="http://127.0.0.1:8443/webhook")
+    replay_parser.add_argument("--concurrency", type=int, default=10)
+    replay_parser.add_argument("--secret-token")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        started = time.perf_counter()
+        statuses = asyncio.run(
+            replay(args.file, args.target, args.concurrency, args.secret_token)
+        )
+        elapsed = time.perf_counter() - started
+        total = sum(statuses.values())
+        print(f"Posted {total} updates in {elapsed:.2f} s ({total / elapsed:.0f}/s): {statuses}")
+        return
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()